@@ -24,6 +24,9 @@ from django.conf.urls.static import static
 from django.db import connection
 from django.http import JsonResponse
 
+from dashboard.db_pool import get_pool_stats
+from dashboard.result_cache import get_cache_stats, get_search_cache_stats
+
 # ฟังก์ชันสำหรับ redirect เมื่อเข้า root URL
 def redirect_to_login_or_portal(request):
     if request.user.is_authenticated:
@@ -44,7 +47,8 @@ def health(request):
     db_ms = round((time.monotonic() - t0) * 1000)
     status = 'ok' if db_status == 'ok' else 'degraded'
     return JsonResponse(
-        {'status': status, 'db': db_status, 'db_ms': db_ms},
+        {'status': status, 'db': db_status, 'db_ms': db_ms, 'api_pool': get_pool_stats(),
+         'result_cache': get_cache_stats(), 'search_cache': get_search_cache_stats()},
         status=200 if status == 'ok' else 503,
     )
 
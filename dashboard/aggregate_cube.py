@@ -0,0 +1,112 @@
+"""
+Aggregate cube ในหน่วยความจำ สำหรับ students_info และ staff_info
+
+เก็บจำนวนนับแบบละเอียดสุดของทุกมิติที่ dashboard ใช้ (cube) ไว้ใน process
+ค่าของแต่ละมิติถูกเข้ารหัสเป็นเลขจำนวนเต็ม (dictionary encoding) และเก็บแบบ
+columnar ด้วย array ทำให้ใช้หน่วยความจำน้อย
+
+cube ถูกสร้างครั้งเดียวต่อ data generation (ดู data_generation.py)
+การกรองปี / drill-down เป็นแค่การ slice cube ไม่ต้องกลับไปถามฐานข้อมูล
+"""
+from array import array
+
+from .data_generation import get_for_generation
+
+
+class CountCube:
+    """
+    Cube ของจำนวนนับ: แต่ละ cell คือชุดค่าของทุกมิติ + จำนวน
+    """
+
+    def __init__(self, dimensions):
+        self.dimensions = tuple(dimensions)
+        self._dimension_index = {dimension: i for i, dimension in enumerate(self.dimensions)}
+        self._codes = [{} for _ in self.dimensions]      # value -> code
+        self._values = [[] for _ in self.dimensions]     # code -> value
+        self._columns = [array('I') for _ in self.dimensions]
+        self._counts = array('I')
+        self._postings = {}  # dimension index -> {code: [cell, ...]}
+
+    def __len__(self):
+        return len(self._counts)
+
+    def add(self, values, count):
+        """เพิ่ม cell (values เรียงตาม dimensions)"""
+        for i, value in enumerate(values):
+            codes = self._codes[i]
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(self._values[i])
+                self._values[i].append(value)
+            self._columns[i].append(code)
+        self._counts.append(count)
+
+    def slice(self, **filters):
+        """
+        เลือกเฉพาะ cell ที่ตรงกับเงื่อนไข เช่น cube.slice(faculty_name='...', year_code='68')
+        """
+        candidates = []
+        for dimension, value in filters.items():
+            i = self._dimension_index[dimension]
+            code = self._codes[i].get(value)
+            if code is None:
+                return CubeSlice(self, ())
+            candidates.append((i, code, self._posting(i).get(code, ())))
+
+        if not candidates:
+            return CubeSlice(self, range(len(self._counts)))
+
+        # เริ่มจาก posting list ที่สั้นที่สุด แล้วกรองด้วยมิติที่เหลือ
+        candidates.sort(key=lambda item: len(item[2]))
+        cells = candidates[0][2]
+        for i, code, _ in candidates[1:]:
+            column = self._columns[i]
+            cells = [cell for cell in cells if column[cell] == code]
+        return CubeSlice(self, cells)
+
+    def _posting(self, i):
+        posting = self._postings.get(i)
+        if posting is None:
+            posting = {}
+            for cell, code in enumerate(self._columns[i]):
+                posting.setdefault(code, []).append(cell)
+            self._postings[i] = posting
+        return posting
+
+
+class CubeSlice:
+    """ส่วนย่อยของ cube ที่ผ่านการ slice แล้ว"""
+
+    def __init__(self, cube, cells):
+        self.cube = cube
+        self.cells = cells
+
+    def total(self):
+        counts = self.cube._counts
+        return sum(counts[cell] for cell in self.cells)
+
+    def count_by(self, dimensions):
+        """รวมยอดตามมิติที่ระบุ คืน dict {(value, ...): count}"""
+        cube = self.cube
+        indexes = [cube._dimension_index[dimension] for dimension in dimensions]
+        columns = [cube._columns[i] for i in indexes]
+        counts = cube._counts
+
+        totals = {}
+        for cell in self.cells:
+            key = tuple(column[cell] for column in columns)
+            totals[key] = totals.get(key, 0) + counts[cell]
+
+        values = [cube._values[i] for i in indexes]
+        return {
+            tuple(values[n][code] for n, code in enumerate(key)): count
+            for key, count in totals.items()
+        }
+
+
+def get_cube(table_name, build):
+    """
+    คืน cube ของตารางสำหรับ generation ปัจจุบัน
+    build() จะถูกเรียกเมื่อยังไม่มี cube หรือมี sync ใหม่สำเร็จ (คืน None ถ้าสร้างไม่ได้)
+    """
+    return get_for_generation('cube', table_name, build)
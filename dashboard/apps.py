@@ -8,4 +8,6 @@ class DashboardConfig(AppConfig):
     def ready(self):
         # APScheduler disabled — ใช้ Windows Task Scheduler แทน
         # ดู deploy/task_scheduler/ สำหรับ .bat files
-        pass
+
+        # ลงทะเบียน signal ที่ bump data generation เมื่อ sync สำเร็จ
+        from . import data_generation  # noqa: F401
@@ -0,0 +1,82 @@
+"""
+แถวผลลัพธ์แบบกะทัดรัด (compact rows) สำหรับผลลัพธ์ขนาดใหญ่
+
+cursor(dictionary=True) สร้าง dict ใหม่ (พร้อม hash table ของชื่อคอลัมน์) ทุกแถว
+สำหรับรายชื่อบุคลากรหลายพันคนหรือผลการค้นหาที่เก็บใน cache จำนวนมาก
+CompactRow เป็น tuple ของค่าในแถว + index ของชื่อคอลัมน์ที่ใช้ร่วมกันทั้งผลลัพธ์
+(หนึ่ง class ต่อชุดคอลัมน์) จึงใช้หน่วยความจำเท่า tuple ธรรมดา
+
+อ่านค่าได้เหมือน dict เดิม: row['STAFFNAME'], row.get('STAFFNAME', ''),
+row.STAFFNAME (template), dict(row), row.keys() / row.items()
+แถวแก้ไขไม่ได้ — ถ้าต้องเพิ่ม/แก้ค่าให้สร้าง dict ใหม่ด้วย dict(row, ...)
+"""
+import functools
+
+
+class CompactRow(tuple):
+    """tuple ที่อ่านค่าด้วยชื่อคอลัมน์ได้ (class ย่อยของแต่ละชุดคอลัมน์สร้างโดย row_class)"""
+
+    __slots__ = ()
+    _columns = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def __getattr__(self, name):
+        try:
+            return tuple.__getitem__(self, self._index[name])
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __contains__(self, key):
+        # เหมือน dict: ตรวจชื่อคอลัมน์ ไม่ใช่ค่า
+        return key in self._index
+
+    def get(self, key, default=None):
+        i = self._index.get(key)
+        return default if i is None else tuple.__getitem__(self, i)
+
+    def keys(self):
+        return self._columns
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return zip(self._columns, self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{k}={v!r}' for k, v in self.items())})"
+
+
+@functools.lru_cache(maxsize=None)
+def row_class(columns):
+    """class ของแถวสำหรับชุดคอลัมน์ (tuple ของชื่อคอลัมน์) — สร้างครั้งเดียวต่อชุดคอลัมน์"""
+    return type('CompactRow', (CompactRow,), {
+        '__slots__': (),
+        '_columns': columns,
+        '_index': {column: i for i, column in enumerate(columns)},
+    })
+
+
+def fetch_compact(cursor):
+    """
+    อ่านผลลัพธ์ทั้งหมดของ cursor (แบบ tuple ไม่ใช่ dictionary) เป็น list ของ CompactRow
+    ใช้ได้ทั้ง cursor ของ mysql.connector และ sqlite3
+    """
+    cls = row_class(tuple(column[0] for column in cursor.description))
+    return [cls(row) for row in cursor.fetchall()]
+
+
+def add_column(rows, column, values):
+    """คืน list ของแถวใหม่ที่มีคอลัมน์ column (ค่าจาก values ตามลำดับแถว) ต่อท้าย"""
+    if not rows:
+        return []
+    cls = row_class((*rows[0].keys(), column))
+    return [cls((*row, value)) for row, value in zip(rows, values)]
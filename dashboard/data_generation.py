@@ -0,0 +1,99 @@
+"""
+Data generation ของตารางในฐานข้อมูล api
+
+ข้อมูล staff_info / students_info เปลี่ยนเฉพาะตอน sync (02:00 / 02:30)
+จึงใช้ id ของ SyncLog ล่าสุดที่ sync สำเร็จเป็น "generation" ของตารางนั้น
+ผลลัพธ์ที่คำนวณจาก generation เดิมใช้ซ้ำได้จนกว่าจะมี sync ใหม่สำเร็จ
+
+- sync ที่รันใน process เดียวกัน (ปุ่ม Sync ในหน้า Sync Monitor)
+  จะ bump generation ทันทีผ่าน post_save signal ของ SyncLog
+- sync ที่รันจาก Windows Task Scheduler (คนละ process) จะถูกตรวจพบ
+  จากการอ่าน SyncLog ทุก GENERATION_CHECK_INTERVAL วินาที
+"""
+import os
+import threading
+import time
+
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import SyncLog
+
+GENERATION_CHECK_INTERVAL = float(os.getenv('GENERATION_CHECK_INTERVAL', '60'))
+
+_generations = {}  # table_name -> (generation, checked_at)
+_lock = threading.Lock()
+
+
+def get_generation(table_name):
+    """
+    คืน generation ปัจจุบันของตาราง (id ของ SyncLog ล่าสุดที่สำเร็จ, 0 ถ้ายังไม่เคย sync)
+    """
+    now = time.monotonic()
+    with _lock:
+        cached = _generations.get(table_name)
+    if cached and now - cached[1] < GENERATION_CHECK_INTERVAL:
+        return cached[0]
+
+    try:
+        generation = (
+            SyncLog.objects
+            .filter(table_name=table_name, status='success')
+            .order_by('-id')
+            .values_list('id', flat=True)
+            .first()
+        ) or 0
+    except Exception as e:
+        # อ่าน SyncLog ไม่ได้ — ใช้ generation เดิมไปก่อน แล้วลองใหม่รอบถัดไป
+        print(f"เกิดข้อผิดพลาดในการตรวจสอบ generation ของ {table_name}: {e}")
+        generation = cached[0] if cached else 0
+
+    with _lock:
+        current = _generations.get(table_name)
+        if current and current[0] > generation:
+            generation = current[0]
+        _generations[table_name] = (generation, now)
+    return generation
+
+
+def bump_generation(table_name, generation):
+    """ประกาศ generation ใหม่ของตาราง (ไม่ถอยกลับไป generation ที่เก่ากว่า)"""
+    with _lock:
+        current = _generations.get(table_name)
+        if not current or generation > current[0]:
+            _generations[table_name] = (generation, time.monotonic())
+
+
+_built = {}  # (name, table_name) -> (generation, value)
+_build_locks = {}
+
+
+def get_for_generation(name, table_name, build):
+    """
+    คืนค่าที่สร้างจากข้อมูลของตาราง (เช่น cube, search index) สำหรับ generation ปัจจุบัน
+    build() ถูกเรียกครั้งเดียวต่อ generation (คืน None ถ้าสร้างไม่ได้ — จะลองใหม่ครั้งถัดไป)
+    ค่าใหม่ถูกสลับเข้าแทนค่าเดิมทีเดียว ผู้อ่านที่ถือค่าเดิมอยู่ใช้ต่อได้จนจบ
+    """
+    key = (name, table_name)
+    generation = get_generation(table_name)
+    cached = _built.get(key)
+    if cached and cached[0] == generation:
+        return cached[1]
+
+    with _lock:
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+    with build_lock:
+        # thread อื่นอาจสร้างเสร็จแล้วระหว่างรอ lock
+        cached = _built.get(key)
+        if cached and cached[0] == generation:
+            return cached[1]
+        value = build()
+        if value is not None:
+            _built[key] = (generation, value)
+        return value
+
+
+@receiver(post_save, sender=SyncLog)
+def _sync_log_saved(sender, instance, **kwargs):
+    if instance.status == 'success':
+        bump_generation(instance.table_name, instance.id)
@@ -1,609 +1,870 @@
 import mysql.connector
+from mysql.connector import errorcode
 from django.conf import settings
+import base64
+import json
+import math
 import os
 
+from .aggregate_cube import CountCube, get_cube
+from .data_generation import get_for_generation
+from .db_pool import get_pool, report_error
+from . import local_replica
+from .compact_rows import add_column, fetch_compact
+from .fanout import fan_out
+from .line_ids import add_line_ids
+from .result_cache import cached_result, is_stale, mark_stale, search_cache
+from .rollups import ROLLUPS
+from .search_index import PrefixIndex, SearchIndex, normalize
+
 def get_db_connection():
     """
-    สร้างการเชื่อมต่อกับฐานข้อมูล MySQL
-    ใช้ environment variables สำหรับความปลอดภัย
+    ยืม connection ฐานข้อมูล MySQL (api) จาก connection pool ของ process
+    ใช้ environment variables สำหรับความปลอดภัย (ดู dashboard/db_pool.py)
+    เรียก connection.close() เพื่อคืน connection กลับเข้า pool
     """
     try:
-        connection = mysql.connector.connect(
-            host=os.getenv('API_DB_HOST', '202.29.55.213'),
-            database=os.getenv('API_DB_NAME', 'api'),
-            user=os.getenv('API_DB_USER', 'admin_e'),
-            password=os.getenv('API_DB_PASSWORD', ''),
-            ssl_disabled=True  # Fix SSL wrap_socket error
-        )
-        return connection
+        return get_pool().acquire()
     except mysql.connector.Error as e:
         print(f"เกิดข้อผิดพลาดในการเชื่อมต่อกับฐานข้อมูล: {e}")
         return None
 
-def get_staff_summary():
-    """
-    ดึงข้อมูลสรุปของบุคลากร
-    """
+TABLE_COUNT_QUERY = "SELECT COUNT(*) FROM {table_name}"
+
+def _count_rows(table_name):
     connection = get_db_connection()
     if not connection:
         return None
-    
+
     try:
-        cursor = connection.cursor(dictionary=True)
-        
-        # ข้อมูลสรุปทั้งหมด
-        summary = {}
-        
-        # จำนวนบุคลากรทั้งหมด
-        cursor.execute("SELECT COUNT(*) as total FROM staff_info")
-        summary['total_staff'] = cursor.fetchone()['total']
-        
-        # จำนวนบุคลากรแยกตามเพศ
-        cursor.execute("SELECT GENDERNAMETH, COUNT(*) as count FROM staff_info GROUP BY GENDERNAMETH ORDER BY count DESC")
-        summary['gender_distribution'] = cursor.fetchall()
-        
-        # จำนวนบุคลากรแยกตามประเภท
-        cursor.execute("SELECT STFTYPENAME, COUNT(*) as count FROM staff_info GROUP BY STFTYPENAME ORDER BY count DESC")
-        summary['staff_type_distribution'] = cursor.fetchall()
-        
-        # จำนวนบุคลากรแยกตามหน่วยงาน
-        cursor.execute("SELECT DEPARTMENTNAME, COUNT(*) as count FROM staff_info GROUP BY DEPARTMENTNAME ORDER BY count DESC")
-        summary['department_distribution'] = cursor.fetchall()
-        
-        # ปิดการเชื่อมต่อ
+        cursor = connection.cursor()
+        cursor.execute(TABLE_COUNT_QUERY.format(table_name=table_name))
+        count = cursor.fetchone()[0]
         cursor.close()
-        connection.close()
-        
-        return summary
-        
+        return count
     except mysql.connector.Error as e:
-        print(f"เกิดข้อผิดพลาดในการดึงข้อมูล: {e}")
+        report_error(connection, e)
+        print(f"เกิดข้อผิดพลาดในการนับจำนวนข้อมูลใน {table_name}: {e}")
         return None
     finally:
-        if connection.is_connected():
-            connection.close()
+        connection.close()
 
-def get_available_years():
+def get_table_counts():
     """
-    ดึงรายการปีที่มีข้อมูลนักศึกษา
+    จำนวนแถวปัจจุบันของ staff_info และ students_info (นับพร้อมกัน)
+    คืน dict {'staff_info': n, 'students_info': n} (None ถ้านับไม่ได้)
     """
+    return fan_out({
+        table_name: (lambda table_name=table_name: _count_rows(table_name))
+        for table_name in ('staff_info', 'students_info')
+    })
+
+# ─────────────────────────────────────────────
+# Aggregate cube (โหลดจาก rollup table ครั้งเดียวต่อการ sync แล้วตอบจากหน่วยความจำ)
+# ─────────────────────────────────────────────
+
+def _load_cube(table_name):
+    """
+    สร้าง CountCube จาก rollup table ที่ sync สร้างไว้ (คืน None ถ้าเชื่อมต่อ/ดึงข้อมูลไม่ได้)
+    อ่านจาก local replica ก่อน ถ้าใช้ไม่ได้จึงอ่านจากฐานข้อมูล api
+    ถ้ายังไม่มี rollup (ยังไม่เคย sync หลังติดตั้ง) จะนับจากตารางหลักแทน
+    """
+    rollup = ROLLUPS[table_name]
+    rows = local_replica.query(table_name, rollup['read'])
+    if rows:
+        return _build_cube(rollup, rows)
+
     connection = get_db_connection()
     if not connection:
-        return []
-    
+        return None
+
     try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT 
-                SUBSTRING(student_code, 1, 2) AS year_code,
-                CASE 
-                    WHEN CAST(SUBSTRING(student_code, 1, 2) AS UNSIGNED) > 50 
-                    THEN CAST(SUBSTRING(student_code, 1, 2) AS UNSIGNED) + 2500
-                    ELSE CAST(SUBSTRING(student_code, 1, 2) AS UNSIGNED) + 2600
-                END AS buddhist_year,
-                COUNT(*) as student_count
-            FROM students_info
-            WHERE SUBSTRING(student_code, 1, 2) REGEXP '^[0-9]{2}$'
-            GROUP BY year_code, buddhist_year
-            HAVING student_count > 10
-            ORDER BY buddhist_year DESC
-        """)
-        
-        years = cursor.fetchall()
+        cursor = connection.cursor()
+        try:
+            cursor.execute(rollup['read'])
+            rows = cursor.fetchall()
+        except mysql.connector.ProgrammingError as e:
+            if e.errno not in (errorcode.ER_NO_SUCH_TABLE, errorcode.ER_BAD_FIELD_ERROR):
+                raise
+            rows = []
+        if not rows:
+            # rollup ยังไม่ถูกสร้าง/กำลังถูกสร้างครั้งแรก — นับจากตารางหลักแทน
+            cursor.execute(rollup['groups_query'])
+            rows = cursor.fetchall()
+
         cursor.close()
-        connection.close()
-        
-        return years
-        
+        return _build_cube(rollup, rows)
     except mysql.connector.Error as e:
-        print(f"เกิดข้อผิดพลาดในการดึงข้อมูลปี: {e}")
-        return []
+        report_error(connection, e)
+        print(f"เกิดข้อผิดพลาดในการสร้าง aggregate cube: {e}")
+        return None
     finally:
-        if connection and connection.is_connected():
-            connection.close()
+        connection.close()
+
+
+def _build_cube(rollup, rows):
+    cube = CountCube(rollup['dimensions'])
+    for row in rows:
+        cube.add(row[:-1], row[-1])
+    return cube
+
+def _student_cube():
+    return get_cube('students_info', lambda: _load_cube('students_info'))
+
 
+def _staff_cube():
+    return get_cube('staff_info', lambda: _load_cube('staff_info'))
+
+
+def _student_slice(cube, year_filter=None, **filters):
+    if year_filter:
+        filters['entry_year_be'] = int(year_filter)  # ปี พ.ศ. ที่เข้าศึกษา เช่น 2568
+    return cube.slice(**filters)
+
+
+def _null_first(value):
+    """key สำหรับเรียงแบบ ORDER BY ของ MySQL (NULL มาก่อนค่าอื่น)"""
+    return (value is not None, value if value is not None else '')
+
+
+def _count_by(cube_slice, columns, leading=()):
+    """
+    รวมยอดของ cube slice ตาม columns เป็น list ของ dict (รูปแบบเดียวกับผล query เดิม)
+    เรียงแบบ ORDER BY <leading>, count DESC, <คอลัมน์ที่เหลือ>
+    """
+    rows = [
+        dict(zip(columns, key), count=count)
+        for key, count in cube_slice.count_by(columns).items()
+    ]
+    rest = [column for column in columns if column not in leading]
+    rows.sort(key=lambda row: (
+        tuple(_null_first(row[column]) for column in leading),
+        -row['count'],
+        tuple(_null_first(row[column]) for column in rest),
+    ))
+    return rows
+
+
+def _year_distribution(cube_slice):
+    """
+    จำนวนนักศึกษาแยกตามปีที่เข้าศึกษา เรียงปีล่าสุดก่อน
+    (entry_year_be คำนวณจากรหัสนักศึกษาไว้แล้วตอน sync, None = รหัสปีไม่ถูกต้อง)
+    """
+    year_distribution = []
+    for (entry_year_be,), count in cube_slice.count_by(['entry_year_be']).items():
+        year_distribution.append({
+            'year_code': str(entry_year_be)[-2:] if entry_year_be else None,
+            'count': count,
+            'year': entry_year_be or 'ไม่ระบุ',
+        })
+    year_distribution.sort(key=lambda row: row['year'] if row['year_code'] else 0, reverse=True)
+    return year_distribution
+
+
+@cached_result('students_info')
+def get_available_years():
+    """
+    ดึงรายการปีที่มีข้อมูลนักศึกษา
+    """
+    cube = _student_cube()
+    if cube is None:
+        return None
+
+    years = []
+    for (entry_year_be,), student_count in cube.slice().count_by(['entry_year_be']).items():
+        if entry_year_be and student_count > 10:
+            years.append({
+                'year_code': str(entry_year_be)[-2:],
+                'buddhist_year': entry_year_be,
+                'student_count': student_count,
+            })
+    years.sort(key=lambda row: row['buddhist_year'], reverse=True)
+    return years
+
+@cached_result('students_info')
 def get_student_summary(year_filter=None):
     """
     ดึงข้อมูลสรุปของนักศึกษา
     รองรับการกรองตามปี (year_filter = buddhist year เช่น 2568)
     """
+    cube = _student_cube()
+    if cube is None:
+        return None
+
+    students = _student_slice(cube, year_filter)
+
+    # ข้อมูลสรุปทั้งหมด
+    summary = {}
+    summary['total_students'] = students.total()
+    summary['faculty_distribution'] = _count_by(students, ['faculty_name'])
+    summary['program_distribution'] = _count_by(
+        students, ['program_name', 'faculty_name', 'level_name'], leading=['faculty_name']
+    )
+    summary['education_level_distribution'] = _count_by(students, ['level_name'])
+    # เพศประมาณจาก prefix_name
+    summary['gender_distribution'] = _count_by(students, ['gender'])
+    summary['year_distribution'] = _year_distribution(students)
+    
+    return summary
+
+@cached_result('staff_info')
+def get_staff_summary():
+    """
+    ดึงข้อมูลสรุปของบุคลากร
+    """
+    cube = _staff_cube()
+    if cube is None:
+        return None
+
+    staff = cube.slice()
+
+    # ข้อมูลสรุปทั้งหมด
+    summary = {}
+    summary['total_staff'] = staff.total()
+    summary['gender_distribution'] = _count_by(staff, ['GENDERNAMETH'])
+    summary['staff_type_distribution'] = _count_by(staff, ['STFTYPENAME'])
+    summary['department_distribution'] = _count_by(staff, ['DEPARTMENTNAME'])
+    
+    return summary
+
+# รายชื่อบุคลากรในหน่วยงาน (ใช้ index idx_staff_department — ดู ensure_api_indexes)
+DEPARTMENT_STAFF_QUERY = """
+    SELECT STAFFID, PREFIXFULLNAME, STAFFNAME, STAFFSURNAME, 
+           GENDERNAMETH, POSNAMETH, STFTYPENAME
+    FROM staff_info 
+    WHERE DEPARTMENTNAME = %s 
+    ORDER BY POSNAMETH, STAFFNAME, STAFFSURNAME
+"""
+
+def _fetch_department_staff(department_name):
+    """
+    รายชื่อบุคลากรทั้งหมดในหน่วยงาน เป็น CompactRow (คืน None ถ้าดึงข้อมูลไม่ได้)
+    หน่วยงานใหญ่มีหลายพันคนและถูกเก็บใน result cache จึงไม่สร้าง dict ต่อแถว
+    """
+    staff_list = local_replica.query('staff_info', DEPARTMENT_STAFF_QUERY, (department_name,), compact=True)
+    if staff_list is not None:
+        return staff_list
+
     connection = get_db_connection()
     if not connection:
         return None
-    
+
     try:
-        cursor = connection.cursor(dictionary=True)
-        
-        # สร้าง WHERE clause สำหรับกรองปี
-        year_condition = ""
-        if year_filter:
-            year_code = str(year_filter)[-2:]  # เอา 2 หลักท้าย เช่น 2568 -> 68
-            year_condition = f"WHERE SUBSTRING(student_code, 1, 2) = '{year_code}'"
-        
-        # ข้อมูลสรุปทั้งหมด
-        summary = {}
-        
-        # จำนวนนักศึกษาทั้งหมด
-        cursor.execute(f"SELECT COUNT(*) as total FROM students_info {year_condition}")
-        result = cursor.fetchone()
-        summary['total_students'] = result['total'] if result else 0
-        
-        # จำนวนนักศึกษาแยกตามคณะ
-        try:
-            cursor.execute(f"SELECT faculty_name, COUNT(*) as count FROM students_info {year_condition} GROUP BY faculty_name ORDER BY count DESC")
-            summary['faculty_distribution'] = cursor.fetchall()
-        except mysql.connector.Error:
-            summary['faculty_distribution'] = []
-        
-        # จำนวนนักศึกษาแยกตามหลักสูตร/สาขาวิชา และคณะ
-        try:
-            cursor.execute(f"""
-                SELECT program_name, faculty_name, level_name, COUNT(*) as count 
-                FROM students_info {year_condition} 
-                GROUP BY program_name, faculty_name, level_name 
-                ORDER BY faculty_name, count DESC, program_name, level_name
-            """)
-            summary['program_distribution'] = cursor.fetchall()
-        except mysql.connector.Error:
-            summary['program_distribution'] = []
-        
-        # จำนวนนักศึกษาแยกตามระดับการศึกษา
-        try:
-            cursor.execute(f"SELECT level_name, COUNT(*) as count FROM students_info {year_condition} GROUP BY level_name ORDER BY count DESC")
-            summary['education_level_distribution'] = cursor.fetchall()
-        except mysql.connector.Error:
-            summary['education_level_distribution'] = []
-        
-        # จำนวนนักศึกษาแยกตามเพศ (ใช้ prefix_name ในการประมาณ)
-        try:
-            where_clause = year_condition if year_condition else "WHERE 1=1"
-            cursor.execute(f"""
-                SELECT 
-                    CASE 
-                        WHEN prefix_name IN ('นาย') THEN 'ชาย' 
-                        WHEN prefix_name IN ('นางสาว', 'นาง') THEN 'หญิง'
-                        ELSE 'ไม่ระบุ' 
-                    END AS gender,
-                    COUNT(*) as count 
-                FROM students_info 
-                {where_clause}
-                GROUP BY gender
-                ORDER BY count DESC
-            """)
-            summary['gender_distribution'] = cursor.fetchall()
-        except mysql.connector.Error:
-            summary['gender_distribution'] = []
-        
-        # จำนวนนักศึกษาแยกตามปีที่เข้าศึกษา (จากรหัสนักศึกษา)
-        try:
-            cursor.execute(f"""
-                SELECT 
-                    SUBSTRING(student_code, 1, 2) AS year_code,
-                    COUNT(*) as count
-                FROM students_info
-                {year_condition}
-                GROUP BY year_code
-                ORDER BY year_code DESC
-            """)
-            year_distribution = cursor.fetchall()
-            
-            # แปลงรหัสปี 2 หลัก เป็นปี พ.ศ. 4 หลัก
-            for row in year_distribution:
-                try:
-                    year_code = int(row['year_code'])
-                    if year_code > 50:  # สมมติว่าเป็นปี พ.ศ. 25xx
-                        row['year'] = 2500 + year_code
-                    else:  # สมมติว่าเป็นปี พ.ศ. 26xx
-                        row['year'] = 2600 + year_code
-                except (ValueError, TypeError):
-                    row['year'] = 'ไม่ระบุ'
-            
-            summary['year_distribution'] = year_distribution
-        except mysql.connector.Error:
-            summary['year_distribution'] = []
-        
-        # ปิดการเชื่อมต่อ
+        cursor = connection.cursor()
+        cursor.execute(DEPARTMENT_STAFF_QUERY, (department_name,))
+        staff_list = fetch_compact(cursor)
         cursor.close()
-        connection.close()
-        
-        return summary
-        
+        return staff_list
     except mysql.connector.Error as e:
-        print(f"เกิดข้อผิดพลาดในการดึงข้อมูลนักศึกษา: {e}")
+        report_error(connection, e)
+        print(f"เกิดข้อผิดพลาดในการดึงข้อมูลหน่วยงาน: {e}")
         return None
     finally:
-        if connection and connection.is_connected():
-            connection.close()
+        connection.close()
+
+# รายชื่อบุคลากรของหน่วยงานทีละหน้า (หน้า department_detail โหลดผ่าน JSON ตามต้องการ)
+# การเรียง / กรองทำใน SQL — sort และ filter รับเฉพาะค่าที่อยู่ใน dict ด้านล่าง
+ROSTER_PAGE_SIZE = 50
+ROSTER_MAX_PAGE_SIZE = 200
+
+ROSTER_SORTS = {
+    # ตรงกับ idx_staff_department จึงไม่ต้อง sort
+    'position': ('POSNAMETH', 'STAFFNAME', 'STAFFSURNAME'),
+    'name': ('STAFFNAME', 'STAFFSURNAME', 'STAFFID'),
+    'type': ('STFTYPENAME', 'POSNAMETH', 'STAFFNAME', 'STAFFSURNAME'),
+    'gender': ('GENDERNAMETH', 'STAFFNAME', 'STAFFSURNAME'),
+}
+
+ROSTER_FILTERS = {
+    'gender': 'GENDERNAMETH',
+    'type': 'STFTYPENAME',
+    'position': 'POSNAMETH',
+}
+
+# ทุกคำในคำค้นต้องพบในคอลัมน์ใดคอลัมน์หนึ่ง (ไม่ใช้ CONCAT เพื่อให้รันบน local replica ได้)
+ROSTER_SEARCH_COLUMNS = ('STAFFID', 'STAFFNAME', 'STAFFSURNAME', 'POSNAMETH')
+
+DEPARTMENT_ROSTER_QUERY = """
+    SELECT STAFFID, PREFIXFULLNAME, STAFFNAME, STAFFSURNAME,
+           GENDERNAMETH, POSNAMETH, STFTYPENAME
+    FROM staff_info
+    WHERE {where}
+    ORDER BY {order}
+    LIMIT %s OFFSET %s
+"""
+
+DEPARTMENT_ROSTER_COUNT_QUERY = """
+    SELECT COUNT(*) FROM staff_info WHERE {where}
+"""
+
+def _roster_where(department_name, query, filters):
+    """เงื่อนไข WHERE + params ของ roster (filters = {ชื่อ filter ใน ROSTER_FILTERS: ค่า})"""
+    conditions = ['DEPARTMENTNAME = %s']
+    params = [department_name]
+    for name, value in sorted(filters.items()):
+        conditions.append(f'{ROSTER_FILTERS[name]} = %s')
+        params.append(value)
+    for term in query.split():
+        conditions.append('(' + ' OR '.join(f'{column} LIKE %s' for column in ROSTER_SEARCH_COLUMNS) + ')')
+        params.extend([f'%{term}%'] * len(ROSTER_SEARCH_COLUMNS))
+    return ' AND '.join(conditions), params
+
+def _fetch_roster(sql, params, count_sql):
+    """(total, rows) จาก local replica หรือฐานข้อมูล api (คืน None ถ้าดึงข้อมูลไม่ได้)"""
+    counted = local_replica.query('staff_info', count_sql, params[:-2])
+    if counted is not None:
+        rows = local_replica.query('staff_info', sql, params, compact=True)
+        if rows is not None:
+            return counted[0][0], rows
 
-def get_department_detail(department_name):
-    """
-    ดึงข้อมูลรายละเอียดของหน่วยงานเฉพาะ
-    """
     connection = get_db_connection()
     if not connection:
         return None
-    
+
     try:
-        cursor = connection.cursor(dictionary=True)
-        
-        # ข้อมูลสรุปหน่วยงาน
-        department_info = {}
-        
-        # จำนวนบุคลากรทั้งหมดในหน่วยงาน
-        cursor.execute("SELECT COUNT(*) as total FROM staff_info WHERE DEPARTMENTNAME = %s", (department_name,))
-        result = cursor.fetchone()
-        department_info['total_staff'] = result['total'] if result else 0
-        
-        # จำนวนบุคลากรแยกตามเพศ
-        cursor.execute("""
-            SELECT GENDERNAMETH, COUNT(*) as count 
-            FROM staff_info 
-            WHERE DEPARTMENTNAME = %s 
-            GROUP BY GENDERNAMETH 
-            ORDER BY count DESC
-        """, (department_name,))
-        department_info['gender_distribution'] = cursor.fetchall()
-        
-        # จำนวนบุคลากรแยกตามตำแหน่ง
-        cursor.execute("""
-            SELECT POSNAMETH, COUNT(*) as count 
-            FROM staff_info 
-            WHERE DEPARTMENTNAME = %s 
-            GROUP BY POSNAMETH 
-            ORDER BY count DESC
-        """, (department_name,))
-        department_info['position_distribution'] = cursor.fetchall()
-        
-        # จำนวนบุคลากรแยกตามประเภทการจ้าง
-        cursor.execute("""
-            SELECT STFTYPENAME, COUNT(*) as count 
-            FROM staff_info 
-            WHERE DEPARTMENTNAME = %s 
-            GROUP BY STFTYPENAME 
-            ORDER BY count DESC
-        """, (department_name,))
-        department_info['employment_type_distribution'] = cursor.fetchall()
-        
-        # รายชื่อบุคลากรทั้งหมดในหน่วยงาน
-        cursor.execute("""
-            SELECT STAFFID, PREFIXFULLNAME, STAFFNAME, STAFFSURNAME, 
-                   GENDERNAMETH, POSNAMETH, STFTYPENAME
-            FROM staff_info 
-            WHERE DEPARTMENTNAME = %s 
-            ORDER BY POSNAMETH, STAFFNAME, STAFFSURNAME
-        """, (department_name,))
-        department_info['staff_list'] = cursor.fetchall()
-        
-        # ปิดการเชื่อมต่อ
+        cursor = connection.cursor()
+        cursor.execute(count_sql, params[:-2])
+        total = cursor.fetchone()[0]
+        cursor.execute(sql, params)
+        rows = fetch_compact(cursor)
         cursor.close()
-        connection.close()
-        
-        return department_info
-        
+        return total, rows
     except mysql.connector.Error as e:
-        print(f"เกิดข้อผิดพลาดในการดึงข้อมูลหน่วยงาน: {e}")
+        report_error(connection, e)
+        print(f"เกิดข้อผิดพลาดในการดึงรายชื่อบุคลากรของหน่วยงาน: {e}")
         return None
     finally:
-        if connection and connection.is_connected():
-            connection.close()
+        connection.close()
+
+# ทุกชุดของหน้า/คำค้น/filter เป็นคนละ key จึงใช้ search cache (LRU ขนาดจำกัด) ไม่ให้ไล่ผลลัพธ์ของ dashboard ออก
+@cached_result('staff_info', cache=search_cache)
+def get_department_roster(department_name, page=1, page_size=ROSTER_PAGE_SIZE, sort='position', query='', **filters):
+    """
+    รายชื่อบุคลากรของหน่วยงานทีละหน้า
+    sort: คีย์ของ ROSTER_SORTS, query: คำค้นในชื่อ/นามสกุล/รหัส/ตำแหน่ง
+    filters: gender / type / position (ค่าว่างหรือ None = ไม่กรอง)
+    คืน dict {'results', 'total', 'page', 'page_size', 'num_pages'} (None ถ้าดึงข้อมูลไม่ได้)
+    """
+    order = ROSTER_SORTS.get(sort, ROSTER_SORTS['position'])
+    filters = {name: value for name, value in filters.items() if name in ROSTER_FILTERS and value}
+    page_size = min(max(page_size, 1), ROSTER_MAX_PAGE_SIZE)
+    page = max(page, 1)
+
+    where, params = _roster_where(department_name, query, filters)
+    fetched = _fetch_roster(
+        DEPARTMENT_ROSTER_QUERY.format(where=where, order=', '.join(order)),
+        [*params, page_size, (page - 1) * page_size],
+        DEPARTMENT_ROSTER_COUNT_QUERY.format(where=where),
+    )
+    if fetched is None:
+        return None
+
+    total, rows = fetched
+    return {
+        'results': rows,
+        'total': total,
+        'page': page,
+        'page_size': page_size,
+        'num_pages': max((total + page_size - 1) // page_size, 1),
+    }
+
+@cached_result('staff_info')
+def get_department_detail(department_name, include_staff_list=True):
+    """
+    ดึงข้อมูลรายละเอียดของหน่วยงานเฉพาะ
+    distribution มาจาก staff cube, ดึงจากฐานข้อมูลเฉพาะรายชื่อบุคลากร
+    (โหลด cube และดึงรายชื่อพร้อมกันบน connection คนละเส้น)
+    include_staff_list=False ไม่ดึงรายชื่อ (หน้าเว็บโหลดทีละหน้าด้วย get_department_roster)
+    """
+    tasks = {'cube': _staff_cube}
+    if include_staff_list:
+        tasks['staff_list'] = lambda: _fetch_department_staff(department_name)
+    results = fan_out(tasks)
+    cube = results['cube']
+    if cube is None or (include_staff_list and results['staff_list'] is None):
+        return None
+
+    staff = cube.slice(DEPARTMENTNAME=department_name)
+
+    # ข้อมูลสรุปหน่วยงาน
+    department_info = {}
+    department_info['total_staff'] = staff.total()
+    department_info['gender_distribution'] = _count_by(staff, ['GENDERNAMETH'])
+    department_info['position_distribution'] = _count_by(staff, ['POSNAMETH'])
+    department_info['employment_type_distribution'] = _count_by(staff, ['STFTYPENAME'])
+    if include_staff_list:
+        department_info['staff_list'] = results['staff_list']
 
+    return department_info
+
+@cached_result('students_info')
 def get_faculty_detail(faculty_name, year_filter=None):
     """
     ดึงข้อมูลรายละเอียดของคณะเฉพาะ
     รองรับการกรองตามปี (year_filter = buddhist year เช่น 2568)
     """
+    cube = _student_cube()
+    if cube is None:
+        return None
+
+    students = _student_slice(cube, year_filter, faculty_name=faculty_name)
+
+    # ข้อมูลสรุปคณะ
+    faculty_info = {}
+    faculty_info['total_students'] = students.total()
+    faculty_info['gender_distribution'] = _count_by(students, ['gender'])
+    faculty_info['program_distribution'] = _count_by(
+        students, ['program_name', 'level_name', 'faculty_name'], leading=['faculty_name']
+    )
+    faculty_info['level_distribution'] = _count_by(students, ['level_name'])
+    faculty_info['year_distribution'] = _year_distribution(students)
+    
+    return faculty_info
+
+# ─────────────────────────────────────────────
+# ค้นหาบุคลากร / นักศึกษา
+# ─────────────────────────────────────────────
+
+# fulltext = ใช้ FULLTEXT index (ngram parser) ของ MySQL, like = LIKE '%q%' ทุกคอลัมน์แบบเดิม
+# memory = search index ในหน่วยความจำของ process (ดู search_index.py)
+SEARCH_BACKEND = os.getenv('AIMS_SEARCH_BACKEND', 'fulltext')
+
+# จำนวนผลค้นหาต่อหน้า
+SEARCH_PAGE_SIZE = 100
+
+# คอลัมน์ของ FULLTEXT index (ต้องตรงกับที่ manage.py ensure_api_indexes สร้าง)
+STAFF_FULLTEXT_COLUMNS = ('STAFFNAME', 'STAFFSURNAME', 'STAFFID', 'DEPARTMENTNAME')
+STUDENT_FULLTEXT_COLUMNS = ('student_name', 'student_surname', 'student_code', 'faculty_name')
+
+# ngram_token_size ของ MySQL (default 2) — คำที่สั้นกว่านี้ค้นด้วย FULLTEXT ไม่ได้
+NGRAM_TOKEN_SIZE = 2
+
+# อักขระที่เป็น operator ใน BOOLEAN MODE
+_FULLTEXT_OPERATORS = str.maketrans({char: ' ' for char in '+-<>()~*"@'})
+
+def fulltext_terms(query):
+    """
+    แปลงคำค้นเป็นเงื่อนไข BOOLEAN MODE: ทุกคำ (แยกด้วยช่องว่าง) ต้องพบ
+    แต่ละคำเป็น phrase ซึ่ง ngram parser ตัดเป็น bigram ที่ต้องเรียงติดกัน
+    (ภาษาไทยไม่มีช่องว่างระหว่างคำ จึงค้นส่วนใดของชื่อก็ได้เหมือน LIKE)
+    คืน '' ถ้าไม่มีคำที่ค้นด้วย FULLTEXT ได้
+    """
+    terms = [term for term in query.translate(_FULLTEXT_OPERATORS).split() if len(term) >= NGRAM_TOKEN_SIZE]
+    return ' '.join(f'+"{term}"' for term in terms)
+
+# Keyset pagination: ผลค้นหาเรียงตาม (score, ชื่อ, นามสกุล, รหัส) — หน้าถัดไปเริ่มหลังแถวสุดท้าย
+# ของหน้าก่อน (ไม่ใช้ OFFSET จึงดึงหน้าลึก ๆ ได้เร็วเท่าหน้าแรก)
+# {0}, {1}, {2} = คอลัมน์ชื่อ, นามสกุล, รหัส
+FULLTEXT_KEYSET = "HAVING score < %s OR (score = %s AND (COALESCE({0}, ''), COALESCE({1}, ''), {2}) > (%s, %s, %s))"
+LIKE_KEYSET = "AND (COALESCE({0}, ''), COALESCE({1}, ''), {2}) > (%s, %s, %s)"
+
+STAFF_FULLTEXT_QUERY = """
+    SELECT
+        s.STAFFID,
+        s.PREFIXFULLNAME,
+        s.STAFFNAME,
+        s.STAFFSURNAME,
+        s.POSNAMETH,
+        s.STFTYPENAME,
+        s.DEPARTMENTNAME,
+        s.STAFFCITIZENID,
+        ROUND(MATCH(s.STAFFNAME, s.STAFFSURNAME, s.STAFFID, s.DEPARTMENTNAME) AGAINST (%s IN BOOLEAN MODE), 6) AS score
+    FROM staff_info s
+    WHERE MATCH(s.STAFFNAME, s.STAFFSURNAME, s.STAFFID, s.DEPARTMENTNAME) AGAINST (%s IN BOOLEAN MODE)
+    {keyset}
+    ORDER BY score DESC, COALESCE(s.STAFFNAME, ''), COALESCE(s.STAFFSURNAME, ''), s.STAFFID
+    LIMIT %s
+"""
+
+STUDENT_FULLTEXT_QUERY = """
+    SELECT
+        s.student_code,
+        s.prefix_name,
+        s.student_name,
+        s.student_surname,
+        s.faculty_name,
+        s.program_name,
+        s.level_name,
+        ROUND(MATCH(s.student_name, s.student_surname, s.student_code, s.faculty_name) AGAINST (%s IN BOOLEAN MODE), 6) AS score
+    FROM students_info s
+    WHERE MATCH(s.student_name, s.student_surname, s.student_code, s.faculty_name) AGAINST (%s IN BOOLEAN MODE)
+    {keyset}
+    ORDER BY score DESC, COALESCE(s.student_name, ''), COALESCE(s.student_surname, ''), s.student_code
+    LIMIT %s
+"""
+
+# แบบเดิม (LIKE ทุกคอลัมน์) — ใช้เมื่อ AIMS_SEARCH_BACKEND=like, คำค้นสั้นเกินไป หรือยังไม่มี FULLTEXT index
+STAFF_SEARCH_QUERY = """
+    SELECT
+        s.STAFFID,
+        s.PREFIXFULLNAME,
+        s.STAFFNAME,
+        s.STAFFSURNAME,
+        s.POSNAMETH,
+        s.STFTYPENAME,
+        s.DEPARTMENTNAME,
+        s.STAFFCITIZENID,
+        0 AS score
+    FROM staff_info s
+    WHERE (s.STAFFNAME LIKE %s
+       OR s.STAFFSURNAME LIKE %s
+       OR s.STAFFID LIKE %s
+       OR s.DEPARTMENTNAME LIKE %s
+       OR CONCAT(s.STAFFNAME, ' ', s.STAFFSURNAME) LIKE %s)
+    {keyset}
+    ORDER BY COALESCE(s.STAFFNAME, ''), COALESCE(s.STAFFSURNAME, ''), s.STAFFID
+    LIMIT %s
+"""
+
+STUDENT_SEARCH_QUERY = """
+    SELECT
+        s.student_code,
+        s.prefix_name,
+        s.student_name,
+        s.student_surname,
+        s.faculty_name,
+        s.program_name,
+        s.level_name,
+        0 AS score
+    FROM students_info s
+    WHERE (s.student_name LIKE %s
+       OR s.student_surname LIKE %s
+       OR s.student_code LIKE %s
+       OR s.faculty_name LIKE %s
+       OR CONCAT(s.student_name, ' ', s.student_surname) LIKE %s)
+    {keyset}
+    ORDER BY COALESCE(s.student_name, ''), COALESCE(s.student_surname, ''), s.student_code
+    LIMIT %s
+"""
+
+# ค้นหาจาก search index ในหน่วยความจำ (AIMS_SEARCH_BACKEND=memory, ดู search_index.py)
+# index สร้างจาก code, ชื่อ, นามสกุล, หน่วยงาน/คณะ แล้วดึงรายละเอียดจากฐานข้อมูลเฉพาะแถวในหน้าผลลัพธ์
+STAFF_INDEX_QUERY = """
+    SELECT STAFFID, STAFFNAME, STAFFSURNAME, DEPARTMENTNAME FROM staff_info
+"""
+
+STUDENT_INDEX_QUERY = """
+    SELECT student_code, student_name, student_surname, faculty_name FROM students_info
+"""
+
+STAFF_HYDRATE_QUERY = """
+    SELECT
+        s.STAFFID,
+        s.PREFIXFULLNAME,
+        s.STAFFNAME,
+        s.STAFFSURNAME,
+        s.POSNAMETH,
+        s.STFTYPENAME,
+        s.DEPARTMENTNAME,
+        s.STAFFCITIZENID
+    FROM staff_info s
+    WHERE s.STAFFID IN ({placeholders})
+"""
+
+STUDENT_HYDRATE_QUERY = """
+    SELECT
+        s.student_code,
+        s.prefix_name,
+        s.student_name,
+        s.student_surname,
+        s.faculty_name,
+        s.program_name,
+        s.level_name
+    FROM students_info s
+    WHERE s.student_code IN ({placeholders})
+"""
+
+SEARCH_SPECS = {
+    'staff_info': {
+        'label': 'บุคลากร',
+        'key': 'STAFFID',
+        # apiapp_userprofile.userLdap ของบุคลากรคือเลขบัตรประชาชน — ใช้จับคู่ LINE ids แล้วตัดออก
+        'ldap_column': 'STAFFCITIZENID',
+        'ldap_private': True,
+        'sort_columns': ('s.STAFFNAME', 's.STAFFSURNAME', 's.STAFFID'),
+        'sort_keys': ('STAFFNAME', 'STAFFSURNAME', 'STAFFID'),
+        'fulltext': STAFF_FULLTEXT_QUERY,
+        'like': STAFF_SEARCH_QUERY,
+        'index': STAFF_INDEX_QUERY,
+        'hydrate': STAFF_HYDRATE_QUERY,
+    },
+    'students_info': {
+        'label': 'นักศึกษา',
+        'key': 'student_code',
+        'ldap_column': 'student_code',
+        'ldap_private': False,
+        'sort_columns': ('s.student_name', 's.student_surname', 's.student_code'),
+        'sort_keys': ('student_name', 'student_surname', 'student_code'),
+        'fulltext': STUDENT_FULLTEXT_QUERY,
+        'like': STUDENT_SEARCH_QUERY,
+        'index': STUDENT_INDEX_QUERY,
+        'hydrate': STUDENT_HYDRATE_QUERY,
+    },
+}
+
+def _fetch_index_rows(table_name):
+    """(code, ชื่อ, นามสกุล, หน่วยงาน/คณะ) ของทุกแถว จาก local replica หรือฐานข้อมูล api"""
+    query = SEARCH_SPECS[table_name]['index']
+    rows = local_replica.query(table_name, query)
+    if rows is not None:
+        return rows
+
     connection = get_db_connection()
     if not connection:
         return None
-    
     try:
-        cursor = connection.cursor(dictionary=True)
-        
-        # สร้าง WHERE clause สำหรับกรองปีและคณะ
-        base_condition = "WHERE faculty_name = %s"
-        params = [faculty_name]
-        
-        if year_filter:
-            year_code = str(year_filter)[-2:]  # เอา 2 หลักท้าย เช่น 2568 -> 68
-            base_condition += " AND SUBSTRING(student_code, 1, 2) = %s"
-            params.append(year_code)
-        
-        # ข้อมูลสรุปคณะ
-        faculty_info = {}
-        
-        # จำนวนนักศึกษาทั้งหมดในคณะ
-        cursor.execute(f"SELECT COUNT(*) as total FROM students_info {base_condition}", params)
-        result = cursor.fetchone()
-        faculty_info['total_students'] = result['total'] if result else 0
-        
-        # จำนวนนักศึกษาแยกตามเพศ (จาก prefix_name)
-        cursor.execute(f"""
-            SELECT 
-                CASE 
-                    WHEN prefix_name IN ('นาย') THEN 'ชาย' 
-                    WHEN prefix_name IN ('นางสาว', 'นาง') THEN 'หญิง'
-                    ELSE 'ไม่ระบุ' 
-                END AS gender,
-                COUNT(*) as count 
-            FROM students_info 
-            {base_condition}
-            GROUP BY gender
-            ORDER BY count DESC
-        """, params)
-        faculty_info['gender_distribution'] = cursor.fetchall()
-        
-        # จำนวนนักศึกษาแยกตามสาขาวิชา ระดับการศึกษา และคณะ
-        cursor.execute(f"""
-            SELECT program_name, level_name, faculty_name, COUNT(*) as count 
-            FROM students_info 
-            {base_condition} 
-            GROUP BY program_name, level_name, faculty_name 
-            ORDER BY faculty_name, count DESC, program_name, level_name
-        """, params)
-        faculty_info['program_distribution'] = cursor.fetchall()
-        
-        # จำนวนนักศึกษาแยกตามระดับการศึกษา
-        cursor.execute(f"""
-            SELECT level_name, COUNT(*) as count 
-            FROM students_info 
-            {base_condition} 
-            GROUP BY level_name 
-            ORDER BY count DESC
-        """, params)
-        faculty_info['level_distribution'] = cursor.fetchall()
-        
-        # จำนวนนักศึกษาแยกตามปีเข้าศึกษา
-        cursor.execute(f"""
-            SELECT 
-                SUBSTRING(student_code, 1, 2) AS year_code,
-                COUNT(*) as count
-            FROM students_info
-            {base_condition}
-            GROUP BY year_code
-            ORDER BY year_code DESC
-        """, params)
-        year_distribution = cursor.fetchall()
-        
-        # แปลงรหัสปี 2 หลัก เป็นปี พ.ศ. 4 หลัก
-        for row in year_distribution:
-            try:
-                year_code = int(row['year_code'])
-                if year_code > 50:  # สมมติว่าเป็นปี พ.ศ. 25xx
-                    row['year'] = 2500 + year_code
-                else:  # สมมติว่าเป็นปี พ.ศ. 26xx
-                    row['year'] = 2600 + year_code
-            except (ValueError, TypeError):
-                row['year'] = 'ไม่ระบุ'
-        
-        faculty_info['year_distribution'] = year_distribution
-        
-        # ปิดการเชื่อมต่อ
+        cursor = connection.cursor()
+        cursor.execute(query)
+        rows = cursor.fetchall()
         cursor.close()
-        connection.close()
-        
-        return faculty_info
-        
+        return rows
     except mysql.connector.Error as e:
-        print(f"เกิดข้อผิดพลาดในการดึงข้อมูลคณะ: {e}")
+        report_error(connection, e)
+        print(f"เกิดข้อผิดพลาดในการสร้าง search index ({table_name}): {e}")
         return None
     finally:
-        if connection and connection.is_connected():
-            connection.close()
+        connection.close()
+
+def _load_search_index(table_name):
+    """สร้าง SearchIndex (คืน None ถ้าดึงข้อมูลไม่ได้)"""
+    rows = _fetch_index_rows(table_name)
+    if rows is None:
+        return None
+    return SearchIndex(
+        (code, (name or '', surname or '', code or ''), (name, surname, code, unit))
+        for code, name, surname, unit in rows
+    )
+
+def _load_suggest_index(table_name):
+    """สร้าง PrefixIndex สำหรับ typeahead (คืน None ถ้าดึงข้อมูลไม่ได้)"""
+    rows = _fetch_index_rows(table_name)
+    if rows is None:
+        return None
+    return PrefixIndex(
+        (
+            {'id': code, 'name': ' '.join(part for part in (name, surname) if part), 'unit': unit},
+            (name, surname, f"{name or ''} {surname or ''}", code),
+        )
+        for code, name, surname, unit in rows
+    )
+
+def _search_index(table_name):
+    return get_for_generation('search_index', table_name, lambda: _load_search_index(table_name))
+
+def _hydrate(cursor, spec, keys):
+    """ดึงรายละเอียดของแถวตาม keys แล้วเรียงตามลำดับเดิมของ keys"""
+    if not keys:
+        return []
+    cursor.execute(spec['hydrate'].format(placeholders=', '.join(['%s'] * len(keys))), tuple(keys))
+    rows = {row[spec['key']]: row for row in fetch_compact(cursor)}
+    return [rows[key] for key in keys if key in rows]
+
+def _search(table_name, query, limit, after=None):
+    # คืน None เมื่อเกิดข้อผิดพลาด (ไม่ถูก cache)
+    # after = (score, ชื่อ, นามสกุล, รหัส) ของแถวสุดท้ายในหน้าก่อน
+    spec = SEARCH_SPECS[table_name]
+    found = None
+    if SEARCH_BACKEND == 'memory':
+        index = _search_index(table_name)
+        if index is not None:
+            found = index.search(query, limit, after and (after[0], after[1:]))
 
-def search_staff(query, limit=100):
-    """
-    ค้นหาบุคลากรจากชื่อ-สกุล รหัสบุคลากร หรือหน่วยงาน
-    พร้อม LEFT JOIN apiapp_userprofile เพื่อแสดง LINE userId
-    """
     connection = get_db_connection()
     if not connection:
-        return []
+        return None
 
     try:
-        cursor = connection.cursor(dictionary=True)
-        like_query = f"%{query}%"
-        cursor.execute("""
-            SELECT
-                s.STAFFID,
-                s.PREFIXFULLNAME,
-                s.STAFFNAME,
-                s.STAFFSURNAME,
-                s.POSNAMETH,
-                s.STFTYPENAME,
-                s.DEPARTMENTNAME,
-                GROUP_CONCAT(u.userId SEPARATOR ', ') AS line_user_id
-            FROM staff_info s
-            LEFT JOIN apiapp_userprofile u ON u.userLdap = s.STAFFCITIZENID
-            WHERE s.STAFFNAME LIKE %s
-               OR s.STAFFSURNAME LIKE %s
-               OR s.STAFFID LIKE %s
-               OR s.DEPARTMENTNAME LIKE %s
-               OR CONCAT(s.STAFFNAME, ' ', s.STAFFSURNAME) LIKE %s
-            GROUP BY s.STAFFID, s.PREFIXFULLNAME, s.STAFFNAME, s.STAFFSURNAME,
-                     s.POSNAMETH, s.STFTYPENAME, s.DEPARTMENTNAME
-            ORDER BY s.STAFFNAME, s.STAFFSURNAME
-            LIMIT %s
-        """, (like_query, like_query, like_query, like_query, like_query, limit))
-        results = cursor.fetchall()
+        # ผลการค้นหาเป็น CompactRow (ถูกเก็บใน search cache จำนวนมาก)
+        cursor = connection.cursor()
+        if found is not None:
+            results = _hydrate(cursor, spec, [key for _, key in found])
+            scores = {key: score for score, key in found}
+            cursor.close()
+            return add_column(results, 'score', [scores[row[spec['key']]] for row in results])
+
+        terms = fulltext_terms(query) if SEARCH_BACKEND == 'fulltext' else ''
+        results = None
+        if terms:
+            keyset = FULLTEXT_KEYSET.format(*spec['sort_columns']) if after else ''
+            keyset_params = (after[0], *after) if after else ()
+            try:
+                cursor.execute(spec['fulltext'].format(keyset=keyset), (terms, terms, *keyset_params, limit))
+                results = fetch_compact(cursor)
+            except mysql.connector.ProgrammingError as e:
+                if e.errno != errorcode.ER_FT_MATCHING_KEY_NOT_FOUND:
+                    raise
+                print(f"ยังไม่มี FULLTEXT index สำหรับค้นหา{spec['label']} (manage.py ensure_api_indexes) ใช้ LIKE แทน: {e}")
+        if results is None:
+            like_query = f"%{query}%"
+            keyset = LIKE_KEYSET.format(*spec['sort_columns']) if after else ''
+            keyset_params = after[1:] if after else ()
+            cursor.execute(
+                spec['like'].format(keyset=keyset),
+                (like_query, like_query, like_query, like_query, like_query, *keyset_params, limit),
+            )
+            results = fetch_compact(cursor)
         cursor.close()
-        connection.close()
         return results
     except mysql.connector.Error as e:
-        print(f"เกิดข้อผิดพลาดในการค้นหาบุคลากร: {e}")
-        return []
+        report_error(connection, e)
+        print(f"เกิดข้อผิดพลาดในการค้นหา{spec['label']}: {e}")
+        return None
     finally:
-        if connection and connection.is_connected():
-            connection.close()
+        connection.close()
+
+def encode_search_cursor(table_name, row):
+    """cursor ของหน้าถัดไป (string สำหรับใส่ใน URL) จากแถวสุดท้ายของหน้าปัจจุบัน"""
+    key = [row['score'], *(row[column] or '' for column in SEARCH_SPECS[table_name]['sort_keys'])]
+    return base64.urlsafe_b64encode(json.dumps(key, ensure_ascii=False).encode('utf-8')).decode('ascii').rstrip('=')
 
+def decode_search_cursor(cursor):
+    """แปลง cursor กลับเป็น (score, ชื่อ, นามสกุล, รหัส) — คืน None ถ้าไม่มีหรือไม่ถูกต้อง (เริ่มหน้าแรก)"""
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    # json.loads รับ NaN / Infinity ได้ — score ที่ไม่ใช่ตัวเลขจำกัดทำให้การเทียบ keyset ผิด (ซ้ำ/ข้ามแถว)
+    if (
+        not isinstance(key, list) or len(key) != 4
+        or isinstance(key[0], bool) or not isinstance(key[0], (int, float)) or not math.isfinite(key[0])
+        or not all(isinstance(part, str) for part in key[1:])
+    ):
+        return None
+    return tuple(key)
 
-def search_students(query, limit=100):
+def suggest(table_name, prefix, limit=10):
     """
-    ค้นหานักศึกษาจากชื่อ-สกุล รหัสนักศึกษา หรือคณะ
-    พร้อม LEFT JOIN apiapp_userprofile เพื่อแสดง LINE userId
+    typeahead: รายการที่ชื่อ นามสกุล ชื่อ-สกุล หรือรหัส ขึ้นต้นด้วย prefix
+    คืน list ของ {'id', 'name', 'unit'} (ไม่ถามฐานข้อมูลนอกจากตอนสร้าง index หลัง sync)
     """
-    connection = get_db_connection()
-    if not connection:
+    index = get_for_generation('suggest_index', table_name, lambda: _load_suggest_index(table_name))
+    if index is None:
         return []
+    return index.suggest(prefix, limit)
 
-    try:
-        cursor = connection.cursor(dictionary=True)
-        like_query = f"%{query}%"
-        cursor.execute("""
-            SELECT
-                s.student_code,
-                s.prefix_name,
-                s.student_name,
-                s.student_surname,
-                s.faculty_name,
-                s.program_name,
-                s.level_name,
-                GROUP_CONCAT(u.userId SEPARATOR ', ') AS line_user_id
-            FROM students_info s
-            LEFT JOIN apiapp_userprofile u ON u.userLdap = s.student_code
-            WHERE s.student_name LIKE %s
-               OR s.student_surname LIKE %s
-               OR s.student_code LIKE %s
-               OR s.faculty_name LIKE %s
-               OR CONCAT(s.student_name, ' ', s.student_surname) LIKE %s
-            GROUP BY s.student_code, s.prefix_name, s.student_name, s.student_surname,
-                     s.faculty_name, s.program_name, s.level_name
-            ORDER BY s.student_name, s.student_surname
-            LIMIT %s
-        """, (like_query, like_query, like_query, like_query, like_query, limit))
-        results = cursor.fetchall()
-        cursor.close()
-        connection.close()
-        return results
-    except mysql.connector.Error as e:
-        print(f"เกิดข้อผิดพลาดในการค้นหานักศึกษา: {e}")
-        return []
-    finally:
-        if connection and connection.is_connected():
-            connection.close()
+# ผลการค้นหาถูก cache ด้วยคำค้นที่ normalize แล้ว (NFC, casefold, ยุบช่องว่าง — collation ของ
+# ฐานข้อมูล api ไม่สนตัวพิมพ์เล็ก/ใหญ่อยู่แล้ว) รวมถึงผลลัพธ์ว่าง (เช่น คำค้นที่สะกดผิด)
+# จึงถามฐานข้อมูลครั้งเดียวต่อคำค้นต่อ generation
+@cached_result('staff_info', cache=search_cache)
+def _search_staff(query, limit, after=None):
+    return _search('staff_info', query, limit, after)
+
+@cached_result('students_info', cache=search_cache)
+def _search_students(query, limit, after=None):
+    return _search('students_info', query, limit, after)
+
+def _with_line_ids(table_name, rows):
+    """
+    เติม line_ids / line_user_id จากแผนที่ LINE userId (ดู line_ids.py) ให้ผลการค้นหา
+    (ผลการค้นหาเก่าจาก result cache ยังคงถูกทำเครื่องหมาย is_stale)
+    """
+    spec = SEARCH_SPECS[table_name]
+    enriched = add_line_ids(rows, spec['ldap_column'], drop_ldap=spec['ldap_private'])
+    return mark_stale(enriched) if is_stale(rows) else enriched
+
+def _search_page(table_name, search, query, cursor, page_size):
+    rows = search(normalize(query), page_size + 1, decode_search_cursor(cursor)) or []
+    next_cursor = None
+    if len(rows) > page_size:
+        stale = is_stale(rows)
+        rows = rows[:page_size]
+        if stale:
+            rows = mark_stale(rows)
+        next_cursor = encode_search_cursor(table_name, rows[-1])
+    return _with_line_ids(table_name, rows), next_cursor
+
+def search_staff_page(query, cursor=None, page_size=SEARCH_PAGE_SIZE):
+    """
+    ค้นหาบุคลากรทีละหน้า (keyset pagination)
+    คืน (results, next_cursor) — next_cursor เป็น None เมื่อเป็นหน้าสุดท้าย
+    """
+    return _search_page('staff_info', _search_staff, query, cursor, page_size)
+
+def search_students_page(query, cursor=None, page_size=SEARCH_PAGE_SIZE):
+    """
+    ค้นหานักศึกษาทีละหน้า (keyset pagination)
+    คืน (results, next_cursor) — next_cursor เป็น None เมื่อเป็นหน้าสุดท้าย
+    """
+    return _search_page('students_info', _search_students, query, cursor, page_size)
+
+# จำนวนผลลัพธ์สูงสุดของแต่ละประเภทในการค้นหาแบบรวม (search_all)
+SEARCH_ALL_LIMIT = 50
+
+def search_all(query, limit=SEARCH_ALL_LIMIT):
+    """
+    ค้นหาทั้งบุคลากรและนักศึกษาพร้อมกัน (คนละ connection ผ่าน fan_out — ใช้เวลาเท่ากับ
+    การค้นหาที่ช้ากว่า) แล้วรวมเป็น list เดียว แต่ละแถวมี 'kind' = 'staff' / 'student'
+    เรียงตามคะแนนที่เทียบกับคะแนนสูงสุดของประเภทเดียวกัน (คะแนนของสองตารางเทียบกันตรง ๆ ไม่ได้)
+    แล้วตามชื่อ-สกุล
+    """
+    query = normalize(query)
+    found = fan_out({
+        'staff': lambda: _search_staff(query, limit, None),
+        'student': lambda: _search_students(query, limit, None),
+    })
 
+    merged = []
+    stale = False
+    for kind, table_name in (('staff', 'staff_info'), ('student', 'students_info')):
+        rows = found[kind] or []
+        stale = stale or is_stale(rows)
+        best = max((row['score'] for row in rows), default=0) or 1
+        sort_keys = SEARCH_SPECS[table_name]['sort_keys']
+        for row in _with_line_ids(table_name, rows):
+            row['kind'] = kind
+            merged.append((-row['score'] / best, *(row[column] or '' for column in sort_keys[:2]), row))
+    merged.sort(key=lambda item: item[:-1])
+    results = [item[-1] for item in merged]
+    return mark_stale(results) if stale else results
 
+
+@cached_result('students_info')
 def get_level_detail(level_name, year_filter=None):
     """
     ดึงข้อมูลรายละเอียดของระดับการศึกษาเฉพาะ
     รองรับการกรองตามปี (year_filter = buddhist year เช่น 2568)
     """
-    connection = get_db_connection()
-    if not connection:
+    cube = _student_cube()
+    if cube is None:
         return None
+
+    students = _student_slice(cube, year_filter, level_name=level_name)
+
+    # ข้อมูลสรุประดับการศึกษา
+    level_info = {}
+    level_info['total_students'] = students.total()
+    level_info['gender_distribution'] = _count_by(students, ['gender'])
+    level_info['faculty_distribution'] = _count_by(students, ['faculty_name'])
+
+    # จำนวนนักศึกษาแยกตามสาขาวิชา (กรุ๊ปตามคณะ)
+    programs_by_faculty = _count_by(
+        students, ['faculty_name', 'program_name'], leading=['faculty_name']
+    )
     
-    try:
-        cursor = connection.cursor(dictionary=True)
-        
-        # สร้าง WHERE clause สำหรับกรองปีและระดับการศึกษา
-        base_condition = "WHERE level_name = %s"
-        params = [level_name]
-        
-        if year_filter:
-            year_code = str(year_filter)[-2:]  # เอา 2 หลักท้าย เช่น 2568 -> 68
-            base_condition += " AND SUBSTRING(student_code, 1, 2) = %s"
-            params.append(year_code)
-        
-        # ข้อมูลสรุประดับการศึกษา
-        level_info = {}
-        
-        # จำนวนนักศึกษาทั้งหมดในระดับการศึกษา
-        cursor.execute(f"SELECT COUNT(*) as total FROM students_info {base_condition}", params)
-        result = cursor.fetchone()
-        level_info['total_students'] = result['total'] if result else 0
-        
-        # จำนวนนักศึกษาแยกตามเพศ (จาก prefix_name)
-        cursor.execute(f"""
-            SELECT 
-                CASE 
-                    WHEN prefix_name IN ('นาย') THEN 'ชาย' 
-                    WHEN prefix_name IN ('นางสาว', 'นาง') THEN 'หญิง'
-                    ELSE 'ไม่ระบุ' 
-                END AS gender,
-                COUNT(*) as count 
-            FROM students_info 
-            {base_condition}
-            GROUP BY gender
-            ORDER BY count DESC
-        """, params)
-        level_info['gender_distribution'] = cursor.fetchall()
-        
-        # จำนวนนักศึกษาแยกตามคณะ
-        cursor.execute(f"""
-            SELECT faculty_name, COUNT(*) as count 
-            FROM students_info 
-            {base_condition} 
-            GROUP BY faculty_name 
-            ORDER BY count DESC
-        """, params)
-        level_info['faculty_distribution'] = cursor.fetchall()
-        
-        # จำนวนนักศึกษาแยกตามสาขาวิชา (กรุ๊ปตามคณะ)
-        cursor.execute(f"""
-            SELECT faculty_name, program_name, COUNT(*) as count 
-            FROM students_info 
-            {base_condition} 
-            GROUP BY faculty_name, program_name 
-            ORDER BY faculty_name, count DESC
-        """, params)
-        programs_by_faculty = cursor.fetchall()
-        
-        # จัดกรุ๊ปข้อมูลตามคณะ และคำนวณผลรวมของแต่ละคณะ
-        faculty_programs = {}
-        faculty_totals = {}
-        total_programs = 0
-        
-        for item in programs_by_faculty:
-            faculty = item['faculty_name'] or 'ไม่ระบุคณะ'
-            if faculty not in faculty_programs:
-                faculty_programs[faculty] = []
-                faculty_totals[faculty] = 0
-            
-            faculty_programs[faculty].append({
-                'program_name': item['program_name'],
-                'count': item['count']
-            })
-            faculty_totals[faculty] += item['count']
-            total_programs += 1
-        
-        level_info['faculty_programs'] = faculty_programs
-        level_info['faculty_totals'] = faculty_totals
-        level_info['total_programs'] = total_programs
-        level_info['program_distribution'] = programs_by_faculty
-        
-        # จำนวนนักศึกษาแยกตามปีเข้าศึกษา
-        cursor.execute(f"""
-            SELECT 
-                SUBSTRING(student_code, 1, 2) AS year_code,
-                COUNT(*) as count
-            FROM students_info
-            {base_condition}
-            GROUP BY year_code
-            ORDER BY year_code DESC
-        """, params)
-        year_distribution = cursor.fetchall()
-        
-        # แปลงรหัสปี 2 หลัก เป็นปี พ.ศ. 4 หลัก
-        for row in year_distribution:
-            try:
-                year_code = int(row['year_code'])
-                if year_code > 50:  # สมมติว่าเป็นปี พ.ศ. 25xx
-                    row['year'] = 2500 + year_code
-                else:  # สมมติว่าเป็นปี พ.ศ. 26xx
-                    row['year'] = 2600 + year_code
-            except (ValueError, TypeError):
-                row['year'] = 'ไม่ระบุ'
-        
-        level_info['year_distribution'] = year_distribution
-        
-        # ปิดการเชื่อมต่อ
-        cursor.close()
-        connection.close()
-        
-        return level_info
-        
-    except mysql.connector.Error as e:
-        print(f"เกิดข้อผิดพลาดในการดึงข้อมูลระดับการศึกษา: {e}")
-        return None
-    finally:
-        if connection and connection.is_connected():
-            connection.close()
\ No newline at end of file
+    # จัดกรุ๊ปข้อมูลตามคณะ และคำนวณผลรวมของแต่ละคณะ
+    faculty_programs = {}
+    faculty_totals = {}
+    total_programs = 0
+    
+    for item in programs_by_faculty:
+        faculty = item['faculty_name'] or 'ไม่ระบุคณะ'
+        if faculty not in faculty_programs:
+            faculty_programs[faculty] = []
+            faculty_totals[faculty] = 0
+        
+        faculty_programs[faculty].append({
+            'program_name': item['program_name'],
+            'count': item['count']
+        })
+        faculty_totals[faculty] += item['count']
+        total_programs += 1
+    
+    level_info['faculty_programs'] = faculty_programs
+    level_info['faculty_totals'] = faculty_totals
+    level_info['total_programs'] = total_programs
+    level_info['program_distribution'] = programs_by_faculty
+    level_info['year_distribution'] = _year_distribution(students)
+    
+    return level_info
@@ -0,0 +1,448 @@
+"""
+Connection pool สำหรับฐานข้อมูล api (MySQL 202.29.55.213)
+
+ทุกส่วนที่อ่าน/เขียนฐานข้อมูล api (database_utils, views, sync commands)
+ยืม connection จาก pool เดียวกันของ process แทนการเปิด connection ใหม่ทุกครั้ง
+ทำให้ waitress threads ใช้ connection ที่อุ่นอยู่แล้วซ้ำได้ ไม่ต้องเสีย
+TCP + auth handshake ทุก request
+
+ตั้งค่าผ่าน environment variables:
+    API_DB_POOL_SIZE      จำนวน connection สูงสุด (default 8 = WAITRESS_THREADS)
+    API_DB_POOL_TIMEOUT   วินาทีที่รอ connection ว่างก่อน timeout (default 10)
+    API_DB_POOL_RECYCLE   อายุสูงสุดของ connection เป็นวินาที (default 3600)
+    API_DB_POOL_IDLE      ปิด connection ที่ว่างนานเกินกี่วินาที (default 300)
+    API_DB_POOL_PING      ping ก่อนยืมถ้าว่างนานเกินกี่วินาที (default 30)
+    API_DB_CONNECT_TIMEOUT    วินาทีสูงสุดในการเปิด connection ใหม่ (default 5)
+    API_DB_QUERY_TIMEOUT      วินาทีสูงสุดของแต่ละ SELECT (MAX_EXECUTION_TIME, default 10, 0 = ไม่จำกัด)
+    API_DB_BREAKER_THRESHOLD  จำนวนความล้มเหลวภายใน API_DB_BREAKER_WINDOW วินาทีที่ทำให้ตัดวงจร (default 5)
+    API_DB_BREAKER_WINDOW     ช่วงเวลาที่นับความล้มเหลว (default 30)
+    API_DB_BREAKER_RESET      วินาทีที่ตัดวงจรก่อนลองเชื่อมต่อใหม่ (default 30)
+
+Circuit breaker: เมื่อฐานข้อมูล api ช้า/ล่ม (เชื่อมต่อไม่ได้, query เกินเวลา,
+connection หลุด) ติดต่อกันหลายครั้ง pool จะปฏิเสธการยืมทันที (CircuitOpen)
+แทนที่ทุก waitress thread จะรอจน timeout — ผู้เรียกใช้ผลลัพธ์ล่าสุดที่มีแทน
+(ดู result_cache.py) หลัง API_DB_BREAKER_RESET วินาทีจะปล่อยให้ลองหนึ่ง connection
+ถ้าสำเร็จวงจรจะกลับมาปกติ
+"""
+import os
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+from mysql.connector import errorcode, errors
+
+# error ที่แสดงว่าฐานข้อมูล api มีปัญหา (ไม่ใช่ query ผิด) — นับเป็นความล้มเหลวของ circuit breaker
+HOST_FAILURE_ERRNOS = {
+    errorcode.ER_QUERY_TIMEOUT,      # เกิน MAX_EXECUTION_TIME
+    errorcode.ER_QUERY_INTERRUPTED,
+    errorcode.CR_SERVER_LOST,
+    errorcode.CR_SERVER_GONE_ERROR,
+    errorcode.CR_CONN_HOST_ERROR,
+    errorcode.CR_CONNECTION_ERROR,
+}
+
+
+class PoolTimeout(errors.PoolError):
+    """รอ connection ว่างเกินเวลาที่กำหนด"""
+
+
+class CircuitOpen(errors.PoolError):
+    """circuit breaker ตัดวงจรอยู่ — ไม่ติดต่อฐานข้อมูล api ชั่วคราว"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker แบบ closed / open / half-open
+    - closed: ทำงานปกติ, ตัดวงจร (open) เมื่อล้มเหลวครบ threshold ครั้งภายใน window วินาที
+    - open: ปฏิเสธทุกคำขอจนครบ reset_after วินาที
+    - half-open: ปล่อยให้ลองหนึ่งคำขอ สำเร็จ = closed, ล้มเหลว = open อีกครั้ง
+    """
+
+    def __init__(self, threshold=5, window=30.0, reset_after=30.0):
+        self.threshold = threshold
+        self.window = window
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = deque()  # เวลาที่ล้มเหลว (ภายใน window)
+        self._opened_at = 0.0
+        self._trial = False
+        self._stats = {'trips': 0, 'rejected': 0}
+
+    def allow(self):
+        """คืน (อนุญาตหรือไม่, เป็นคำขอทดลองของ half-open หรือไม่)"""
+        with self._lock:
+            if self._state == 'closed':
+                return True, False
+            if self._state == 'open' and time.monotonic() - self._opened_at >= self.reset_after:
+                self._state = 'half-open'
+                self._trial = False
+            if self._state == 'half-open' and not self._trial:
+                self._trial = True
+                return True, True
+            self._stats['rejected'] += 1
+            return False, False
+
+    def record_success(self, trial):
+        with self._lock:
+            if trial and self._state == 'half-open':
+                self._state = 'closed'
+                self._failures.clear()
+                self._trial = False
+
+    def release_trial(self, trial):
+        """คำขอทดลองไม่ได้ติดต่อฐานข้อมูล (เช่น pool เต็ม) — ให้คำขอถัดไปเป็นผู้ทดลองแทน"""
+        with self._lock:
+            if trial and self._state == 'half-open':
+                self._trial = False
+
+    def record_failure(self, trial=False):
+        now = time.monotonic()
+        with self._lock:
+            if self._state == 'half-open':
+                # นับเฉพาะคำขอทดลอง (connection ที่ยืมไปก่อนตัดวงจรไม่มีผล)
+                if trial:
+                    self._open(now)
+                return
+            if self._state == 'open':
+                return
+            self._failures.append(now)
+            while self._failures and now - self._failures[0] > self.window:
+                self._failures.popleft()
+            if len(self._failures) >= self.threshold:
+                self._open(now)
+
+    def _open(self, now):
+        # เรียกขณะถือ lock
+        self._state = 'open'
+        self._opened_at = now
+        self._trial = False
+        self._failures.clear()
+        self._stats['trips'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['state'] = self._state
+            stats['recent_failures'] = len(self._failures)
+        return stats
+
+
+class PooledConnection:
+    """
+    ตัวห่อ connection ที่ยืมมาจาก pool
+    ใช้งานได้เหมือน mysql.connector connection ปกติ แต่ close() จะคืน
+    connection กลับเข้า pool แทนการปิดจริง
+    """
+
+    def __init__(self, pool, raw, created_at, query_timeout, trial=False):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._query_timeout = query_timeout  # ค่า max_execution_time (ms) ของ session
+        self._trial = trial
+        self._failed = False
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise errors.OperationalError('Connection has been returned to the pool')
+        return getattr(self._raw, name)
+
+    def is_connected(self):
+        return self._raw is not None and self._raw.is_connected()
+
+    def report_error(self, error):
+        """แจ้ง error จากการใช้ connection นี้ (นับเฉพาะ error ที่แสดงว่าฐานข้อมูลมีปัญหา)"""
+        if getattr(error, 'errno', None) in HOST_FAILURE_ERRNOS:
+            self._failed = True
+            self._pool.breaker.record_failure(self._trial)
+
+    def close(self):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool._release(raw, self._created_at, self._query_timeout, self._trial, self._failed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Pool ของ mysql.connector connections แบบ thread-safe
+    - จำกัดจำนวน connection ไม่เกิน size (ถ้าเต็ม จะรอได้ไม่เกิน timeout)
+    - ตรวจสุขภาพ connection ก่อนยืม (ping เมื่อว่างนาน)
+    - ปิด connection ที่ว่างนานหรือมีอายุเกิน recycle
+    - จำกัดเวลาของแต่ละ SELECT ด้วย max_execution_time ของ session (query_timeout วินาที, None = ไม่ตั้ง)
+    - ตัดวงจรเมื่อฐานข้อมูลล้มเหลวซ้ำ ๆ (breaker)
+    - เก็บสถิติการใช้งาน (checkouts, waits, timeouts ฯลฯ)
+    """
+
+    def __init__(self, connect_kwargs, size=8, timeout=10.0, recycle=3600.0,
+                 idle_timeout=300.0, ping_after=30.0, query_timeout=10.0, breaker=None):
+        self.connect_kwargs = connect_kwargs
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.idle_timeout = idle_timeout
+        self.ping_after = ping_after
+        self.query_timeout = query_timeout
+        self.breaker = breaker or CircuitBreaker()
+
+        self._cond = threading.Condition()
+        # (raw, created_at, returned_at, query_timeout_ms) — ขวาสุดคือ connection ที่อุ่นที่สุด
+        self._idle = deque()
+        self._open = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'connects': 0,
+            'connect_errors': 0,
+            'recycled': 0,
+            'health_check_failures': 0,
+        }
+
+    def acquire(self, timeout=None, query_timeout=None):
+        """
+        ยืม connection จาก pool
+        query_timeout: วินาทีสูงสุดของแต่ละ SELECT (None = ค่าของ pool, 0 = ไม่จำกัด เช่น sync commands)
+        raise PoolTimeout ถ้ารอนานเกินไป, CircuitOpen ถ้าตัดวงจรอยู่
+        """
+        allowed, trial = self.breaker.allow()
+        if not allowed:
+            raise CircuitOpen('api DB circuit breaker is open (recent failures); try again later')
+        try:
+            connection = self._acquire(timeout)
+        except PoolTimeout:
+            # pool ของ process เต็ม ไม่ใช่ฐานข้อมูลล้มเหลว — ไม่นับใน breaker แต่คืนสิทธิ์ทดลองของ half-open
+            self.breaker.release_trial(trial)
+            raise
+        except (errors.Error, OSError):
+            # เปิด connection ใหม่ไม่ได้
+            self.breaker.record_failure(trial)
+            raise
+        connection._trial = trial
+
+        try:
+            self._set_query_timeout(connection, self.query_timeout if query_timeout is None else query_timeout)
+        except errors.Error as e:
+            connection.report_error(e)
+            connection.close()
+            raise
+        return connection
+
+    def _set_query_timeout(self, connection, query_timeout):
+        if self.query_timeout is None:
+            return
+        milliseconds = int(query_timeout * 1000)
+        if connection._query_timeout == milliseconds:
+            return
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SET SESSION max_execution_time = %s', (milliseconds,))
+        except errors.Error as e:
+            if e.errno != errorcode.ER_UNKNOWN_SYSTEM_VARIABLE:
+                raise
+            # server ไม่รองรับ (MySQL < 5.7.8) — ใช้เฉพาะ connect timeout
+            print(f"ฐานข้อมูล api ไม่รองรับ max_execution_time ปิดการจำกัดเวลา query: {e}")
+            self.query_timeout = None
+            return
+        finally:
+            cursor.close()
+        connection._query_timeout = milliseconds
+
+    def _acquire(self, timeout):
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = False
+
+        while True:
+            stale = []
+            with self._cond:
+                self._prune_idle(stale)
+                if self._idle:
+                    raw, created_at, returned_at, query_timeout = self._idle.pop()
+                    create = False
+                elif self._open < self.size:
+                    self._open += 1
+                    create = True
+                else:
+                    if not waited:
+                        self._stats['waits'] += 1
+                        waited = True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f'No api DB connection available within {timeout}s '
+                            f'(pool size={self.size})'
+                        )
+                    self._cond.wait(remaining)
+                    continue
+            self._close_all(stale)
+
+            if create:
+                return self._connect()
+
+            if time.monotonic() - returned_at > self.ping_after and not self._is_healthy(raw):
+                with self._cond:
+                    self._stats['health_check_failures'] += 1
+                self._discard(raw)
+                continue
+
+            with self._cond:
+                self._stats['checkouts'] += 1
+            return PooledConnection(self, raw, created_at, query_timeout)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['size'] = self.size
+            stats['open'] = self._open
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._open - len(self._idle)
+        stats['breaker'] = self.breaker.stats()
+        return stats
+
+    def close_all(self):
+        """ปิด connection ที่ว่างอยู่ทั้งหมด (connection ที่ถูกยืมอยู่จะถูกปิดเมื่อคืน)"""
+        with self._cond:
+            idle = [item[0] for item in self._idle]
+            self._idle.clear()
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for raw in idle:
+            self._quiet_close(raw)
+
+    def _connect(self):
+        try:
+            raw = mysql.connector.connect(**self.connect_kwargs)
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._stats['connect_errors'] += 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['connects'] += 1
+            self._stats['checkouts'] += 1
+        # max_execution_time ของ session ใหม่เป็นค่า default ของ server (0)
+        return PooledConnection(self, raw, time.monotonic(), 0)
+
+    def _release(self, raw, created_at, query_timeout, trial=False, failed=False):
+        now = time.monotonic()
+        connected = True
+        try:
+            # ปิด transaction ที่ค้างอยู่ เพื่อไม่ให้ผู้ยืมรายถัดไปเห็น snapshot เก่า
+            # (in_transaction มาจากสถานะใน packet ล่าสุด ไม่ต้องถาม server — การตรวจว่า
+            # connection ยังอยู่ทำตอนยืมเมื่อว่างนานเกิน ping_after)
+            if raw.in_transaction:
+                raw.rollback()
+        except Exception:
+            connected = False
+
+        if not connected:
+            # connection หลุดระหว่างใช้งาน
+            self.breaker.record_failure(trial)
+        elif not failed:
+            self.breaker.record_success(trial)
+
+        # connection ที่เจอ error ของ host (report_error) อาจหลุดไปแล้ว จึงไม่คืนเข้า pool
+        if not connected or failed or now - created_at >= self.recycle:
+            self._discard(raw)
+            return
+        with self._cond:
+            self._idle.append((raw, created_at, now, query_timeout))
+            self._cond.notify()
+
+    def _prune_idle(self, stale):
+        # เรียกขณะถือ lock: ดึง connection ที่ว่างนาน/อายุเกินออกจาก pool (ปิดภายนอก lock)
+        now = time.monotonic()
+        while self._idle:
+            raw, created_at, returned_at, _ = self._idle[0]
+            if now - returned_at < self.idle_timeout and now - created_at < self.recycle:
+                break
+            self._idle.popleft()
+            self._open -= 1
+            self._stats['recycled'] += 1
+            stale.append(raw)
+
+    def _close_all(self, raws):
+        for raw in raws:
+            self._quiet_close(raw)
+
+    def _is_healthy(self, raw):
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, raw):
+        self._quiet_close(raw)
+        with self._cond:
+            self._open -= 1
+            self._stats['recycled'] += 1
+            self._cond.notify()
+
+    @staticmethod
+    def _quiet_close(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """คืน pool ของฐานข้อมูล api (สร้างครั้งแรกเมื่อถูกเรียก)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    connect_kwargs={
+                        'host': os.getenv('API_DB_HOST', '202.29.55.213'),
+                        'port': int(os.getenv('API_DB_PORT', '3306')),
+                        'database': os.getenv('API_DB_NAME', 'api'),
+                        'user': os.getenv('API_DB_USER', 'admin_e'),
+                        'password': os.getenv('API_DB_PASSWORD', ''),
+                        'charset': 'utf8mb4',
+                        'collation': 'utf8mb4_general_ci',
+                        'ssl_disabled': True,  # Fix SSL wrap_socket error
+                        'connection_timeout': int(os.getenv('API_DB_CONNECT_TIMEOUT', '5')),
+                    },
+                    size=int(os.getenv('API_DB_POOL_SIZE', '8')),
+                    timeout=float(os.getenv('API_DB_POOL_TIMEOUT', '10')),
+                    recycle=float(os.getenv('API_DB_POOL_RECYCLE', '3600')),
+                    idle_timeout=float(os.getenv('API_DB_POOL_IDLE', '300')),
+                    ping_after=float(os.getenv('API_DB_POOL_PING', '30')),
+                    query_timeout=float(os.getenv('API_DB_QUERY_TIMEOUT', '10')),
+                    breaker=CircuitBreaker(
+                        threshold=int(os.getenv('API_DB_BREAKER_THRESHOLD', '5')),
+                        window=float(os.getenv('API_DB_BREAKER_WINDOW', '30')),
+                        reset_after=float(os.getenv('API_DB_BREAKER_RESET', '30')),
+                    ),
+                )
+    return _pool
+
+
+def report_error(connection, error):
+    """
+    แจ้ง error ที่เกิดระหว่างใช้ connection จาก pool ให้ circuit breaker
+    (connection ที่ไม่ได้มาจาก pool หรือ None จะถูกข้าม)
+    """
+    if isinstance(connection, PooledConnection):
+        connection.report_error(error)
+
+
+def get_pool_stats():
+    """สถิติของ pool (None ถ้ายังไม่เคยสร้าง pool ใน process นี้)"""
+    return _pool.stats() if _pool is not None else None
@@ -0,0 +1,63 @@
+"""
+Fan-out ของ query อิสระไปยังฐานข้อมูล api พร้อมกัน
+
+ข้อมูลบางหน้าต้องใช้หลาย query ที่รวมเป็น statement เดียวไม่ได้
+(เช่น รายชื่อบุคลากร + distribution ของหน่วยงาน) แต่ละ query ต้องวิ่งข้าม
+WAN ไปยัง 202.29.55.213 — ถ้ารันพร้อมกันบน connection คนละเส้นจาก pool
+เวลารวมจะเท่ากับ query ที่ช้าที่สุด แทนผลรวมของทุก query
+
+ใช้ thread pool ขนาดจำกัดร่วมกันทั้ง process (API_DB_FANOUT_WORKERS, default 4)
+ควรน้อยกว่า API_DB_POOL_SIZE เพื่อเหลือ connection ให้ request อื่น
+task ที่ส่งเข้า fan_out ห้ามเรียก fan_out ซ้อนอีกชั้น (worker อาจหมดแล้วรอกันเอง)
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+FANOUT_WORKERS = int(os.getenv('API_DB_FANOUT_WORKERS', '4'))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=FANOUT_WORKERS,
+                    thread_name_prefix='aims-fanout',
+                )
+    return _executor
+
+
+def _run(task):
+    try:
+        return task()
+    finally:
+        # task อาจใช้ Django ORM (เช่น อ่าน SyncLog) — ปิด connection ของ worker thread
+        close_old_connections()
+
+
+def fan_out(tasks):
+    """
+    รัน task หลายตัวพร้อมกัน แล้วคืนผลลัพธ์เป็น dict ตาม key เดิม
+    tasks: {key: callable ที่ไม่รับ argument}
+    task แรกรันใน thread ที่เรียก ที่เหลือส่งเข้า thread pool
+    exception จาก task ใดจะถูก raise ต่อให้ผู้เรียก
+    """
+    items = list(tasks.items())
+    if not items:
+        return {}
+
+    executor = _get_executor()
+    futures = [(key, executor.submit(_run, task)) for key, task in items[1:]]
+
+    first_key, first_task = items[0]
+    results = {first_key: first_task()}
+    for key, future in futures:
+        results[key] = future.result()
+    return results
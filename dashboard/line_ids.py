@@ -0,0 +1,101 @@
+"""
+แผนที่ LINE userId ของผู้ใช้ (apiapp_userprofile) ในหน่วยความจำ
+
+apiapp_userprofile ผูก userLdap (เลขบัตรประชาชนของบุคลากร / รหัสนักศึกษา)
+กับ LINE userId ได้หลายรายการ ข้อมูลนี้เปลี่ยนได้ตลอดเวลา (ผู้ใช้ผูก LINE เอง)
+แต่ตารางมีขนาดเล็ก จึงอ่านทั้งตารางมาเก็บเป็น dict {userLdap: (userId, ...)}
+แล้วเติม LINE ids ให้ผลการค้นหาหลังค้นเสร็จ — query ค้นหาไม่ต้อง JOIN / GROUP BY
+
+แผนที่ถูกโหลดใหม่เมื่อเก่ากว่า LINE_IDS_REFRESH_INTERVAL วินาที โดย thread เดียว
+ระหว่างนั้นผู้อ่านคนอื่นใช้แผนที่เดิมต่อได้ทันที (ไม่ต้องรอ)
+
+ตั้งค่าผ่าน environment variables:
+    LINE_IDS_REFRESH_INTERVAL   อายุ (วินาที) ของแผนที่ก่อนโหลดใหม่ (default 60)
+"""
+import os
+import threading
+import time
+
+import mysql.connector
+
+from .db_pool import get_pool, report_error
+
+LINE_IDS_REFRESH_INTERVAL = float(os.getenv('LINE_IDS_REFRESH_INTERVAL', '60'))
+
+LINE_IDS_QUERY = """
+    SELECT userLdap, userId
+    FROM apiapp_userprofile
+    WHERE userLdap IS NOT NULL AND userLdap <> '' AND userId IS NOT NULL
+"""
+
+_line_ids = None     # (mapping, loaded_at)
+_refresh_lock = threading.Lock()
+
+
+def _load():
+    """อ่าน apiapp_userprofile ทั้งตาราง คืน {userLdap: (userId, ...)} (None ถ้าอ่านไม่ได้)"""
+    try:
+        connection = get_pool().acquire()
+    except mysql.connector.Error as e:
+        print(f"เกิดข้อผิดพลาดในการเชื่อมต่อกับฐานข้อมูล: {e}")
+        return None
+
+    try:
+        cursor = connection.cursor()
+        cursor.execute(LINE_IDS_QUERY)
+        grouped = {}
+        for user_ldap, user_id in cursor.fetchall():
+            grouped.setdefault(user_ldap, []).append(user_id)
+        cursor.close()
+    except mysql.connector.Error as e:
+        report_error(connection, e)
+        print(f"เกิดข้อผิดพลาดในการดึงข้อมูล LINE userId: {e}")
+        return None
+    finally:
+        connection.close()
+    return {user_ldap: tuple(user_ids) for user_ldap, user_ids in grouped.items()}
+
+
+def get_line_id_map():
+    """
+    คืน {userLdap: (userId, ...)} ปัจจุบัน โหลดใหม่เมื่อเก่ากว่า LINE_IDS_REFRESH_INTERVAL
+    ถ้าโหลดไม่ได้จะใช้แผนที่เดิมต่อ (หรือ {} ถ้ายังไม่เคยโหลดสำเร็จ)
+    """
+    global _line_ids
+    current = _line_ids
+    if current and time.monotonic() - current[1] < LINE_IDS_REFRESH_INTERVAL:
+        return current[0]
+
+    # มีแผนที่เดิมอยู่แล้ว: ให้ thread เดียวโหลดใหม่ ที่เหลือใช้ของเดิมไปก่อน
+    if not _refresh_lock.acquire(blocking=current is None):
+        return current[0]
+    try:
+        if _line_ids is not current:
+            return _line_ids[0]
+        mapping = _load()
+        if mapping is None:
+            if current is None:
+                return {}
+            mapping = current[0]
+        _line_ids = (mapping, time.monotonic())
+        return mapping
+    finally:
+        _refresh_lock.release()
+
+
+def add_line_ids(rows, ldap_column, drop_ldap=False):
+    """
+    คืน list ของ dict ใหม่ (แถวเดิมอาจถูกใช้ร่วมกันผ่าน result cache) พร้อม
+        line_ids       list ของ LINE userId
+        line_user_id   userId คั่นด้วย ', ' (None ถ้าไม่มี) — รูปแบบเดิมของผลการค้นหา
+    drop_ldap=True จะตัดคอลัมน์ ldap_column ออก (เช่น เลขบัตรประชาชนที่ใช้แค่จับคู่)
+    """
+    line_id_map = get_line_id_map()
+    enriched = []
+    for row in rows:
+        row = dict(row)
+        line_ids = list(line_id_map.get(row.pop(ldap_column) if drop_ldap else row[ldap_column], ()))
+        row['line_ids'] = line_ids
+        row['line_user_id'] = ', '.join(line_ids) or None
+        enriched.append(row)
+    return enriched
@@ -0,0 +1,170 @@
+"""
+Local read replica ของ staff_info / students_info บนเครื่อง web server
+
+ข้อมูลในฐานข้อมูล api เปลี่ยนวันละครั้ง (sync 02:00 / 02:30) แต่ทุกหน้า
+dashboard ต้องวิ่งข้ามเครือข่ายไปยัง 202.29.55.213 — หลัง sync สำเร็จ
+sync command จะเขียน snapshot แบบย่อ (เฉพาะคอลัมน์ที่ dashboard ใช้ ไม่รวม
+รหัสผ่าน/วันเกิด/เลขบัตรประชาชน) ลงไฟล์ SQLite บนเครื่อง พร้อม index และ rollup table
+แล้ว database_utils อ่านจากไฟล์นี้ (memory-mapped) แทนฐานข้อมูล api
+
+- replica ของตารางใดจะถูกใช้เฉพาะเมื่อสร้างจาก generation เดียวกับปัจจุบัน
+  (ดู data_generation.py) ถ้าไม่มีไฟล์ / ยังไม่ refresh / อ่านไม่ได้
+  query() จะคืน None และผู้เรียกต้องถามฐานข้อมูล api แทน
+- LINE userId (apiapp_userprofile) ไม่อยู่ใน replica เพราะเปลี่ยนได้ตลอดเวลา
+  (ดู line_ids.py)
+
+ตั้งค่าผ่าน environment variables:
+    LOCAL_REPLICA_PATH   path ของไฟล์ replica (ค่าว่าง = ปิดการใช้งาน)
+    LOCAL_REPLICA_MMAP   ขนาด memory map เป็น bytes (default 256MB)
+"""
+import os
+import sqlite3
+import threading
+
+from django.conf import settings
+
+from .compact_rows import fetch_compact
+from .data_generation import get_generation
+from .rollups import ROLLUPS
+from .sync_stream import stream_chunks
+
+REPLICA_PATH = os.getenv(
+    'LOCAL_REPLICA_PATH',
+    os.path.join(settings.BASE_DIR, 'data', 'api_replica.sqlite3'),
+)
+REPLICA_MMAP_SIZE = int(os.getenv('LOCAL_REPLICA_MMAP', str(256 * 1024 * 1024)))
+
+# คอลัมน์และ index ที่เก็บใน replica (ตรงกับ query ใน database_utils)
+REPLICA_TABLES = {
+    'staff_info': {
+        'columns': (
+            'STAFFID', 'PREFIXFULLNAME', 'STAFFNAME', 'STAFFSURNAME',
+            'GENDERNAMETH', 'POSNAMETH', 'STFTYPENAME', 'DEPARTMENTNAME',
+        ),
+        'indexes': [
+            ('idx_staff_department', ('DEPARTMENTNAME', 'POSNAMETH', 'STAFFNAME', 'STAFFSURNAME')),
+            ('idx_staff_staffid', ('STAFFID',)),
+        ],
+    },
+    'students_info': {
+        'columns': (
+            'student_code', 'prefix_name', 'student_name', 'student_surname',
+            'level_name', 'program_name', 'faculty_name', 'entry_year_be', 'gender',
+        ),
+        'indexes': [
+            ('idx_students_code', ('student_code',)),
+            ('idx_students_faculty', ('faculty_name',)),
+            ('idx_students_level', ('level_name',)),
+        ],
+    },
+}
+
+_local = threading.local()
+
+
+def _sql(query):
+    """แปลง placeholder ของ mysql.connector (%s) เป็นของ sqlite3 (?)"""
+    return query.replace('%s', '?')
+
+
+def _connect_readonly():
+    # ใช้ connection ต่อ thread (sqlite3 connection ใช้ข้าม thread ไม่ได้)
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        if not REPLICA_PATH or not os.path.exists(REPLICA_PATH):
+            return None
+        connection = sqlite3.connect(REPLICA_PATH)
+        connection.execute('PRAGMA query_only = ON')
+        connection.execute(f'PRAGMA mmap_size = {REPLICA_MMAP_SIZE}')
+        _local.connection = connection
+    return connection
+
+
+def _replica_generation(connection, table_name):
+    row = connection.execute(
+        'SELECT generation FROM replica_meta WHERE table_name = ?', (table_name,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def query(table_name, sql, params=(), dictionary=False, compact=False):
+    """
+    รัน query กับ replica ของ table_name
+    คืน list ของ tuple (หรือ dict ถ้า dictionary=True, CompactRow ถ้า compact=True)
+    คืน None ถ้า replica ใช้ไม่ได้หรือไม่ตรงกับ generation ปัจจุบัน
+    """
+    try:
+        connection = _connect_readonly()
+        if connection is None:
+            return None
+        if _replica_generation(connection, table_name) != get_generation(table_name):
+            return None
+        cursor = connection.execute(_sql(sql), params)
+        if compact:
+            return fetch_compact(cursor)
+        rows = cursor.fetchall()
+        if dictionary:
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in rows]
+        return rows
+    except sqlite3.Error as e:
+        print(f"เกิดข้อผิดพลาดในการอ่าน local replica ({table_name}): {e}")
+        _local.connection = None
+        return None
+
+
+def refresh_replica(mysql_cursor, table_name, generation):
+    """
+    เขียน snapshot ของ table_name (และ rollup) จากฐานข้อมูล api ลง replica
+    เรียกจาก sync command หลังบันทึก SyncLog สำเร็จ (generation = id ของ SyncLog)
+    คืน True ถ้าสำเร็จ — ความผิดพลาดจะถูก print และไม่ทำให้การ sync ล้มเหลว
+    """
+    if not REPLICA_PATH:
+        return False
+
+    spec = REPLICA_TABLES[table_name]
+    rollup = ROLLUPS[table_name]
+    columns = spec['columns']
+    rollup_columns = (*rollup['dimensions'], rollup['count_column'])
+    try:
+        os.makedirs(os.path.dirname(REPLICA_PATH), exist_ok=True)
+        connection = sqlite3.connect(REPLICA_PATH, timeout=30, isolation_level=None)
+        try:
+            # WAL: ผู้อ่านเห็นข้อมูลชุดเดิมจนกว่าการเขียนจะ commit
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS replica_meta ('
+                'table_name TEXT PRIMARY KEY, generation INTEGER NOT NULL, '
+                'built_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)'
+            )
+            for name, names, source_query in (
+                (table_name, columns, f"SELECT {', '.join(columns)} FROM {table_name}"),
+                (rollup['table'], rollup_columns, rollup['read']),
+            ):
+                connection.execute(f'DROP TABLE IF EXISTS {name}')
+                # NOCASE ใกล้เคียง utf8mb4_general_ci ของฐานข้อมูล api
+                connection.execute(
+                    f"CREATE TABLE {name} ({', '.join(f'{column} COLLATE NOCASE' for column in names)})"
+                )
+                # อ่านจากฐานข้อมูล api ทีละ chunk แล้วเขียนต่อทันที (ไม่ fetchall ทั้งตาราง)
+                insert_sql = f"INSERT INTO {name} VALUES ({', '.join('?' * len(names))})"
+                mysql_cursor.execute(source_query)
+                for rows in stream_chunks(mysql_cursor):
+                    connection.executemany(insert_sql, rows)
+            for index_name, index_columns in spec['indexes']:
+                connection.execute(
+                    f"CREATE INDEX {index_name} ON {table_name} ({', '.join(index_columns)})"
+                )
+            connection.execute(
+                'INSERT OR REPLACE INTO replica_meta (table_name, generation) VALUES (?, ?)',
+                (table_name, generation),
+            )
+            connection.execute('COMMIT')
+            connection.execute('ANALYZE')
+        finally:
+            connection.close()
+        return True
+    except Exception as e:
+        print(f"เกิดข้อผิดพลาดในการสร้าง local replica ({table_name}): {e}")
+        return False
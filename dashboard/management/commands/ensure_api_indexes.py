@@ -0,0 +1,435 @@
+import mysql.connector
+from django.core.management.base import BaseCommand, CommandError
+from mysql.connector import errorcode
+
+from dashboard import database_utils
+from dashboard.line_ids import LINE_IDS_QUERY
+from dashboard.db_pool import get_pool
+from dashboard.rollups import ROLLUPS
+from dashboard.table_swap import disable_fulltext_stopwords
+
+
+# Indexes the dashboard queries rely on. staff_info / students_info /
+# apiapp_userprofile are created outside Django, so they are declared here.
+# An index is considered present if any existing index starts with the same
+# columns (in the same order), whatever its name.
+REQUIRED_INDEXES = {
+    'staff_info': [
+        # department_detail: WHERE DEPARTMENTNAME = ? ORDER BY POSNAMETH, STAFFNAME, STAFFSURNAME
+        ('idx_staff_department', ('DEPARTMENTNAME', 'POSNAMETH', 'STAFFNAME', 'STAFFSURNAME')),
+        ('idx_staff_staffid', ('STAFFID',)),
+        ('idx_staff_citizenid', ('STAFFCITIZENID',)),
+    ],
+    'students_info': [
+        ('idx_students_code', ('student_code',)),
+        ('idx_students_faculty', ('faculty_name',)),
+        ('idx_students_level', ('level_name',)),
+        ('idx_students_entry_year_be', ('entry_year_be',)),
+        ('idx_students_gender', ('gender',)),
+    ],
+    'apiapp_userprofile': [
+        # LINE user lookup: userLdap = STAFFCITIZENID / student_code
+        ('idx_userprofile_userldap', ('userLdap',)),
+    ],
+}
+
+# Indexes created by earlier versions of this command that no query can use (search
+# and keyset pages order by COALESCE(name, ''), roster name sorts filter on
+# DEPARTMENTNAME first); they only slow down every sync, so they are dropped.
+RETIRED_INDEXES = {
+    'staff_info': ['idx_staff_name'],
+    'students_info': ['idx_students_name'],
+}
+
+# Full-text indexes (ngram parser: Thai has no spaces between words).
+# A FULLTEXT index only serves MATCH() with exactly the same column set.
+FULLTEXT_INDEXES = {
+    'staff_info': [
+        ('ft_staff_search', database_utils.STAFF_FULLTEXT_COLUMNS),
+    ],
+    'students_info': [
+        ('ft_students_search', database_utils.STUDENT_FULLTEXT_COLUMNS),
+    ],
+}
+
+SAMPLE_TERMS = database_utils.fulltext_terms('ab')
+
+# Full-text stopword probe: a Latin name containing 'a' or 'i' (both InnoDB default
+# stopwords). With stopwords active when the index was built, ngram drops every token
+# containing one, so the row cannot be found by its own name.
+LATIN_NAME_QUERY = """
+    SELECT {key} AS row_key, {name} AS name, {surname} AS surname
+    FROM {table_name}
+    WHERE {name} REGEXP '^[A-Za-z]*[AaIi][A-Za-z]*$' AND CHAR_LENGTH({name}) >= 2
+    LIMIT 1
+"""
+
+# Queries executed by dashboard/database_utils.py, checked with EXPLAIN.
+# (name, sql, sample params, allowed problems {kind: reason})
+# kind is 'scan' or 'filesort'; an allowed problem is reported but does not fail.
+QUERY_CHECKS = [
+    (
+        'department staff list',
+        database_utils.DEPARTMENT_STAFF_QUERY,
+        ('SELECT DEPARTMENTNAME FROM staff_info WHERE DEPARTMENTNAME IS NOT NULL LIMIT 1',),
+        {},
+    ),
+    (
+        'department roster page',
+        database_utils.DEPARTMENT_ROSTER_QUERY.format(
+            where='DEPARTMENTNAME = %s', order=', '.join(database_utils.ROSTER_SORTS['position']),
+        ),
+        ('Department', database_utils.ROSTER_PAGE_SIZE, 0),
+        {},
+    ),
+] + [
+    (
+        f'department roster page ({sort} sort)',
+        database_utils.DEPARTMENT_ROSTER_QUERY.format(
+            where='DEPARTMENTNAME = %s', order=', '.join(database_utils.ROSTER_SORTS[sort]),
+        ),
+        ('Department', database_utils.ROSTER_PAGE_SIZE, 0),
+        {'filesort': 'sorts only one department\'s rows (found through idx_staff_department)'},
+    )
+    for sort in database_utils.ROSTER_SORTS if sort != 'position'
+] + [
+    (
+        f'department roster page ({name})',
+        database_utils.DEPARTMENT_ROSTER_QUERY.format(
+            where=where, order=', '.join(database_utils.ROSTER_SORTS['position']),
+        ),
+        (*params, database_utils.ROSTER_PAGE_SIZE, 0),
+        {},
+    )
+    for name, (where, params) in {
+        **{
+            f'{filter_name} filter': database_utils._roster_where('Department', '', {filter_name: 'x'})
+            for filter_name in database_utils.ROSTER_FILTERS
+        },
+        'name search': database_utils._roster_where('Department', 'ab', {}),
+    }.items()
+] + [
+    (
+        'department roster count',
+        database_utils.DEPARTMENT_ROSTER_COUNT_QUERY.format(where='DEPARTMENTNAME = %s'),
+        ('SELECT DEPARTMENTNAME FROM staff_info WHERE DEPARTMENTNAME IS NOT NULL LIMIT 1',),
+        {},
+    ),
+    (
+        'staff full-text search',
+        database_utils.STAFF_FULLTEXT_QUERY.format(keyset=''),
+        (SAMPLE_TERMS, SAMPLE_TERMS, 100),
+        {'filesort': 'ranking sorts only the rows matched by the full-text index'},
+    ),
+    (
+        'student full-text search',
+        database_utils.STUDENT_FULLTEXT_QUERY.format(keyset=''),
+        (SAMPLE_TERMS, SAMPLE_TERMS, 100),
+        {'filesort': 'ranking sorts only the rows matched by the full-text index'},
+    ),
+] + [
+    (
+        f'{table_name} full-text search next page',
+        spec['fulltext'].format(keyset=database_utils.FULLTEXT_KEYSET.format(*spec['sort_columns'])),
+        (SAMPLE_TERMS, SAMPLE_TERMS, 1.0, 1.0, 'a', 'a', 'a', 100),
+        {'filesort': 'ranking sorts only the rows matched by the full-text index'},
+    )
+    for table_name, spec in database_utils.SEARCH_SPECS.items()
+] + [
+    (
+        f'{table_name} LIKE search next page',
+        spec['like'].format(keyset=database_utils.LIKE_KEYSET.format(*spec['sort_columns'])),
+        ('%a%',) * 5 + ('a', 'a', 'a', 100),
+        {
+            'scan': 'fallback used only when the full-text index is unavailable',
+            'filesort': 'fallback used only when the full-text index is unavailable',
+        },
+    )
+    for table_name, spec in database_utils.SEARCH_SPECS.items()
+] + [
+    (
+        f'{table_name} in-memory search index build',
+        spec['index'],
+        (),
+        {'scan': 'the whole table is read once per sync to build the in-memory search index'},
+    )
+    for table_name, spec in database_utils.SEARCH_SPECS.items()
+] + [
+    (
+        'staff search hydration',
+        database_utils.STAFF_HYDRATE_QUERY.format(placeholders='%s'),
+        ('SELECT STAFFID FROM staff_info LIMIT 1',),
+        {},
+    ),
+    (
+        'student search hydration',
+        database_utils.STUDENT_HYDRATE_QUERY.format(placeholders='%s'),
+        ('SELECT student_code FROM students_info LIMIT 1',),
+        {},
+    ),
+    (
+        'staff LIKE search',
+        database_utils.STAFF_SEARCH_QUERY.format(keyset=''),
+        ('%a%',) * 5 + (100,),
+        {
+            'scan': 'fallback used only when the full-text index is unavailable',
+            'filesort': 'fallback used only when the full-text index is unavailable',
+        },
+    ),
+    (
+        'student LIKE search',
+        database_utils.STUDENT_SEARCH_QUERY.format(keyset=''),
+        ('%a%',) * 5 + (100,),
+        {
+            'scan': 'fallback used only when the full-text index is unavailable',
+            'filesort': 'fallback used only when the full-text index is unavailable',
+        },
+    ),
+    (
+        'LINE userId map',
+        LINE_IDS_QUERY,
+        (),
+        {'scan': 'the whole table is read once per LINE_IDS_REFRESH_INTERVAL'},
+    ),
+] + [
+    (
+        f'{table_name} row count',
+        database_utils.TABLE_COUNT_QUERY.format(table_name=table_name),
+        (),
+        {'scan': 'InnoDB keeps no exact row count; COUNT(*) reads the smallest index, only on the sync monitor page'},
+    )
+    for table_name in ('staff_info', 'students_info')
+] + [
+    (
+        f'{table_name} rollup read',
+        rollup['read'],
+        (),
+        {'scan': 'rollup table holds only the pre-aggregated cells and is read whole once per sync'},
+    )
+    for table_name, rollup in ROLLUPS.items()
+] + [
+    (
+        f'{table_name} rollup fallback',
+        rollup['groups_query'],
+        (),
+        {
+            'scan': 'only used before the first sync has built the rollup table',
+            'filesort': 'only used before the first sync has built the rollup table',
+        },
+    )
+    for table_name, rollup in ROLLUPS.items()
+]
+
+
+def existing_indexes(cursor, table_name):
+    """Return {index_name: (index_type, (column, ...))} for the table."""
+    cursor.execute(f"SHOW INDEX FROM {table_name}")
+    indexes = {}
+    for row in cursor.fetchall():
+        index_type, columns = indexes.setdefault(row['Key_name'], (row['Index_type'], []))
+        columns.append((row['Seq_in_index'], row['Column_name']))
+    return {
+        name: (index_type, tuple(column for _, column in sorted(columns)))
+        for name, (index_type, columns) in indexes.items()
+    }
+
+
+def is_covered(columns, indexes):
+    return any(
+        index_type != 'FULLTEXT' and existing[:len(columns)] == columns
+        for index_type, existing in indexes.values()
+    )
+
+
+def is_fulltext_covered(columns, indexes):
+    return any(
+        index_type == 'FULLTEXT' and set(existing) == set(columns)
+        for index_type, existing in indexes.values()
+    )
+
+
+# "ALGORITHM=INPLACE / LOCK=NONE is not supported" (SQLSTATE 0A000, raised as NotSupportedError)
+ONLINE_DDL_UNSUPPORTED = (
+    errorcode.ER_ALTER_OPERATION_NOT_SUPPORTED,
+    errorcode.ER_ALTER_OPERATION_NOT_SUPPORTED_REASON,
+)
+
+
+def create_index(cursor, table_name, index_name, columns, fulltext=False, warn=None):
+    column_list = ', '.join(columns)
+    if fulltext:
+        definition = f"ADD FULLTEXT INDEX {index_name} ({column_list}) WITH PARSER ngram"
+    else:
+        definition = f"ADD INDEX {index_name} ({column_list})"
+    try:
+        # Online DDL: the table stays readable/writable while the index is built
+        cursor.execute(f"ALTER TABLE {table_name} {definition}, ALGORITHM=INPLACE, LOCK=NONE")
+    except mysql.connector.Error as e:
+        if e.errno not in ONLINE_DDL_UNSUPPORTED:
+            raise
+        # e.g. FULLTEXT indexes need LOCK=SHARED: writes to the table block until the build ends
+        if warn is not None:
+            warn(f'  {table_name}.{index_name}: online build not supported ({e.msg}), writes will block')
+        cursor.execute(f"ALTER TABLE {table_name} {definition}")
+
+
+def drop_index(cursor, table_name, index_name):
+    # Dropping a secondary index is an in-place, metadata-only change
+    cursor.execute(f"ALTER TABLE {table_name} DROP INDEX {index_name}, ALGORITHM=INPLACE, LOCK=NONE")
+
+
+def sample_params(cursor, params):
+    """Resolve a one-element tuple holding a SELECT into a real value from the table."""
+    if len(params) == 1 and str(params[0]).lstrip().upper().startswith('SELECT'):
+        cursor.execute(params[0])
+        row = cursor.fetchone()
+        return (next(iter(row.values())) if row else '',)
+    return params
+
+
+def plan_problems(plan):
+    """Return [(kind, message), ...] for full scans and filesorts in an EXPLAIN result."""
+    problems = []
+    for row in plan:
+        extra = row.get('Extra') or ''
+        if row.get('type') in ('ALL', 'index'):
+            problems.append(('scan', f"full scan on {row.get('table')} (type={row.get('type')})"))
+        if 'Using filesort' in extra:
+            problems.append(('filesort', f"filesort on {row.get('table')}"))
+    return problems
+
+
+class Command(BaseCommand):
+    help = 'Create missing indexes on the api tables and verify dashboard query plans with EXPLAIN'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check-only',
+            action='store_true',
+            help='Report missing indexes without creating them',
+        )
+        parser.add_argument(
+            '--warn-only',
+            action='store_true',
+            help='Report bad query plans without failing',
+        )
+
+    def handle(self, *args, **kwargs):
+        check_only = kwargs.get('check_only', False)
+        warn_only = kwargs.get('warn_only', False)
+
+        connection = get_pool().acquire(query_timeout=0)
+        try:
+            cursor = connection.cursor(dictionary=True)
+            missing = self.ensure_indexes(cursor, check_only)
+            failures = self.verify_plans(cursor)
+            failures += self.verify_fulltext(cursor)
+            cursor.close()
+        finally:
+            connection.close()
+
+        if missing:
+            failures.append(f'{len(missing)} required index(es) missing')
+        if failures and not warn_only:
+            raise CommandError('Index verification failed: ' + '; '.join(failures))
+        self.stdout.write(self.style.SUCCESS('Index verification completed'))
+
+    def ensure_indexes(self, cursor, check_only):
+        missing = []
+        for table_name in dict.fromkeys([*REQUIRED_INDEXES, *FULLTEXT_INDEXES, *RETIRED_INDEXES]):
+            indexes = existing_indexes(cursor, table_name)
+            required = [
+                (index_name, columns, False) for index_name, columns in REQUIRED_INDEXES.get(table_name, [])
+            ] + [
+                (index_name, columns, True) for index_name, columns in FULLTEXT_INDEXES.get(table_name, [])
+            ]
+            for index_name, columns, fulltext in required:
+                covered = is_fulltext_covered if fulltext else is_covered
+                if covered(columns, indexes):
+                    self.stdout.write(f'  {table_name}.{index_name}: ok')
+                    continue
+                if check_only:
+                    self.stdout.write(self.style.WARNING(
+                        f'  {table_name}.{index_name}: missing ({", ".join(columns)})'
+                    ))
+                    missing.append((table_name, index_name))
+                    continue
+                if fulltext and not disable_fulltext_stopwords(cursor):
+                    raise CommandError(
+                        f'{table_name}.{index_name}: innodb_ft_enable_stopword could not be turned off; '
+                        'Latin names would not be searchable'
+                    )
+                self.stdout.write(f'  {table_name}.{index_name}: creating ({", ".join(columns)})...')
+                create_index(
+                    cursor, table_name, index_name, columns, fulltext=fulltext,
+                    warn=lambda message: self.stdout.write(self.style.WARNING(message)),
+                )
+                indexes[index_name] = ('FULLTEXT' if fulltext else 'BTREE', columns)
+                self.stdout.write(self.style.SUCCESS(f'  {table_name}.{index_name}: created'))
+            for index_name in RETIRED_INDEXES.get(table_name, []):
+                if index_name not in indexes:
+                    continue
+                if check_only:
+                    self.stdout.write(self.style.WARNING(f'  {table_name}.{index_name}: unused, would be dropped'))
+                    continue
+                drop_index(cursor, table_name, index_name)
+                del indexes[index_name]
+                self.stdout.write(self.style.SUCCESS(f'  {table_name}.{index_name}: unused, dropped'))
+        return missing
+
+    def verify_plans(self, cursor):
+        failures = []
+        for name, query, params, allowed in QUERY_CHECKS:
+            try:
+                cursor.execute('EXPLAIN ' + query, sample_params(cursor, params))
+                problems = plan_problems(cursor.fetchall())
+            except Exception as e:
+                if allowed:
+                    # e.g. rollup table not created yet
+                    self.stdout.write(f'  {name}: skipped ({e})')
+                    continue
+                failures.append(f'{name}: {e}')
+                self.stdout.write(self.style.ERROR(f'  {name}: EXPLAIN failed ({e})'))
+                continue
+
+            if not problems:
+                self.stdout.write(f'  {name}: ok')
+                continue
+            for kind, problem in problems:
+                if kind in allowed:
+                    self.stdout.write(f'  {name}: {problem} (allowed: {allowed[kind]})')
+                else:
+                    failures.append(f'{name}: {problem}')
+                    self.stdout.write(self.style.ERROR(f'  {name}: {problem}'))
+        return failures
+
+    def verify_fulltext(self, cursor):
+        """Search a Latin-named row by its own name to catch indexes built with InnoDB stopwords."""
+        failures = []
+        for table_name, indexes in FULLTEXT_INDEXES.items():
+            spec = database_utils.SEARCH_SPECS[table_name]
+            name, surname, key = spec['sort_keys']
+            try:
+                cursor.execute(LATIN_NAME_QUERY.format(table_name=table_name, key=key, name=name, surname=surname))
+                sample = cursor.fetchone()
+                if sample is None:
+                    self.stdout.write(f'  {table_name} full-text stopwords: skipped (no Latin names)')
+                    continue
+                terms = database_utils.fulltext_terms(f"{sample['name']} {sample['surname'] or ''}")
+                cursor.execute(spec['fulltext'].format(keyset=''), (terms, terms, database_utils.SEARCH_PAGE_SIZE))
+                found = any(row[key] == sample['row_key'] for row in cursor.fetchall())
+            except Exception as e:
+                failures.append(f'{table_name} full-text stopwords: {e}')
+                self.stdout.write(self.style.ERROR(f'  {table_name} full-text stopwords: check failed ({e})'))
+                continue
+
+            if found:
+                self.stdout.write(f"  {table_name} full-text stopwords: ok ({sample['name']!r} found)")
+                continue
+            index_names = ', '.join(index_name for index_name, _ in indexes)
+            failures.append(f"{table_name}: {sample['name']!r} not found by full-text search")
+            self.stdout.write(self.style.ERROR(
+                f"  {table_name} full-text stopwords: {sample['name']!r} not found — {index_names} was built "
+                'with InnoDB stopwords; drop it and run this command again'
+            ))
+        return failures
@@ -5,6 +5,12 @@ from django.utils import timezone
 
 import mysql.connector
 
+from dashboard.db_pool import get_pool
+from dashboard.local_replica import refresh_replica
+from dashboard.sync_diff import RowDiff, delete_keys, ensure_row_hash_column, load_hashes
+from dashboard.sync_stream import run_pipeline, stream_chunks
+from dashboard.rollups import ensure_rollup_table, rebuild_rollup
+
 
 SOURCE_QUERY = """
 SELECT
@@ -36,8 +42,8 @@ UPSERT_QUERY = """
 INSERT INTO staff_info (
     STAFFID, STAFFCITIZENID, PREFIXFULLNAME, STAFFNAME, STAFFSURNAME,
     STAFFBIRTHDATE, GENDERNAMETH, POSNAMETH, STFTYPENAME, SUBSTFTYPENAME,
-    STFSTANAME, DEPARTMENTNAME
-) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    STFSTANAME, DEPARTMENTNAME, row_hash
+) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
 ON DUPLICATE KEY UPDATE
     STAFFCITIZENID = VALUES(STAFFCITIZENID),
     PREFIXFULLNAME = VALUES(PREFIXFULLNAME),
@@ -49,7 +55,8 @@ ON DUPLICATE KEY UPDATE
     STFTYPENAME = VALUES(STFTYPENAME),
     SUBSTFTYPENAME = VALUES(SUBSTFTYPENAME),
     STFSTANAME = VALUES(STFSTANAME),
-    DEPARTMENTNAME = VALUES(DEPARTMENTNAME)
+    DEPARTMENTNAME = VALUES(DEPARTMENTNAME),
+    row_hash = VALUES(row_hash)
 """
 
 
@@ -60,7 +67,7 @@ def convert_date(date_str):
         return None
 
 
-def run_sync_staff(triggered_by='manual', triggered_user=None, existing_log=None):
+def run_sync_staff(triggered_by='manual', triggered_user=None, existing_log=None, progress=None, full=False):
     from dashboard.models import SyncLog
 
     if existing_log is not None:
@@ -83,67 +90,71 @@ def run_sync_staff(triggered_by='manual', triggered_user=None, existing_log=None
             database=os.getenv('STAFF_SRC_DB', 'cp665407_npu_staff'),
             ssl_disabled=True,
         )
-        target_conn = mysql.connector.connect(
-            host=os.getenv('API_DB_HOST', '202.29.55.213'),
-            user=os.getenv('API_DB_USER', 'admin_e'),
-            password=os.getenv('API_DB_PASSWORD', ''),
-            database=os.getenv('API_DB_NAME', 'api'),
-            charset='utf8mb4',
-            collation='utf8mb4_general_ci',
-            ssl_disabled=True,
-        )
+        target_conn = get_pool().acquire(query_timeout=0)
 
         src_cursor = source_conn.cursor(prepared=True)
         tgt_cursor = target_conn.cursor()
 
+        # Rollup table / row_hash column must exist before the transaction starts (DDL auto-commits)
+        ensure_rollup_table(tgt_cursor, 'staff_info')
+        ensure_row_hash_column(tgt_cursor, 'staff_info')
+
         # Count records before
         tgt_cursor.execute("SELECT COUNT(*) FROM staff_info")
         records_before = tgt_cursor.fetchone()[0]
         log.records_before = records_before
         log.save(update_fields=['records_before'])
 
-        # Fetch source data
-        src_cursor.execute(SOURCE_QUERY)
-        rows = src_cursor.fetchall()
-
-        # UPSERT in batches + track synced STAFFIDs
-        synced = 0
-        synced_ids = []
-        batch = []
-        BATCH_SIZE = 500
-        for row in rows:
-            row = list(row)
-            synced_ids.append(row[0])  # STAFFID is col 0
-            row[5] = convert_date(row[5])
-            batch.append(row)
-            if len(batch) >= BATCH_SIZE:
+        # Differential: compare each source row's content hash with the stored one and
+        # UPSERT only new/changed rows (--full rewrites every row)
+        diff = RowDiff(load_hashes(tgt_cursor, 'staff_info', 'STAFFID'), write_all=full)
+
+        def convert(rows):
+            batch = []
+            for row in rows:
+                row = list(row)
+                row[5] = convert_date(row[5])
+                batch.append(tuple(row))
+            return diff.changes(batch)
+
+        def write(batch):
+            if batch:
                 tgt_cursor.executemany(UPSERT_QUERY, batch)
-                target_conn.commit()
-                synced += len(batch)
-                batch = []
-        if batch:
-            tgt_cursor.executemany(UPSERT_QUERY, batch)
-            target_conn.commit()
-            synced += len(batch)
+
+        # Pipeline: a reader thread streams source chunks (unbuffered cursor), converts
+        # and diffs them while this thread UPSERTs the previous chunk
+        # (single transaction: upsert + delete stale + rollup commit together)
+        src_cursor.execute(SOURCE_QUERY)
+        run_pipeline(
+            (convert(rows) for rows in stream_chunks(src_cursor)),
+            write,
+            'staff_info ',
+            progress,
+        )
 
         # DELETE stale records (not in source active set)
-        if synced_ids:
-            placeholders = ','.join(['%s'] * len(synced_ids))
-            tgt_cursor.execute(
-                f"DELETE FROM staff_info WHERE STAFFID NOT IN ({placeholders})",
-                synced_ids,
-            )
-            target_conn.commit()
+        delete_keys(tgt_cursor, 'staff_info', 'STAFFID', diff.deleted_keys())
+
+        if diff.has_changes or full:
+            rebuild_rollup(tgt_cursor, 'staff_info')
+        target_conn.commit()
 
         # Count records after
         tgt_cursor.execute("SELECT COUNT(*) FROM staff_info")
         records_after = tgt_cursor.fetchone()[0]
 
         log.status = 'success'
-        log.records_synced = synced
+        log.records_synced = len(diff.seen)
         log.records_after = records_after
         log.finished_at = timezone.now()
-        log.save(update_fields=['status', 'records_synced', 'records_after', 'finished_at'])
+        diff.record(log)
+        log.save(update_fields=[
+            'status', 'records_synced', 'records_after', 'finished_at',
+            'records_inserted', 'records_updated', 'records_deleted', 'records_unchanged',
+        ])
+
+        # Refresh the web host's local read replica (failure only logs; the sync already succeeded)
+        refresh_replica(tgt_cursor, 'staff_info', log.id)
 
         src_cursor.close()
         tgt_cursor.close()
@@ -158,7 +169,8 @@ def run_sync_staff(triggered_by='manual', triggered_user=None, existing_log=None
     finally:
         if source_conn and source_conn.is_connected():
             source_conn.close()
-        if target_conn and target_conn.is_connected():
+        # Always hand a pooled connection back, even a dropped one (the pool discards it)
+        if target_conn is not None:
             target_conn.close()
 
 
@@ -171,15 +183,24 @@ class Command(BaseCommand):
             default='manual',
             help='Who triggered this sync (manual, schedule, etc.)',
         )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Rewrite every row instead of only the rows whose content hash changed',
+        )
 
     def handle(self, *args, **kwargs):
         triggered_by = kwargs.get('triggered_by', 'manual')
         self.stdout.write(f'Starting staff_info sync (triggered_by={triggered_by})...')
         try:
-            log = run_sync_staff(triggered_by=triggered_by)
+            log = run_sync_staff(
+                triggered_by=triggered_by, progress=self.stdout.write, full=kwargs.get('full', False),
+            )
             self.stdout.write(self.style.SUCCESS(
                 f'Sync completed: {log.records_synced} records synced '
-                f'(before={log.records_before}, after={log.records_after}, '
+                f'(inserted={log.records_inserted}, updated={log.records_updated}, '
+                f'deleted={log.records_deleted}, unchanged={log.records_unchanged}; '
+                f'before={log.records_before}, after={log.records_after}, '
                 f'duration={log.duration_seconds}s)'
             ))
         except Exception as e:
@@ -1,8 +1,16 @@
 import os
+from contextlib import closing
+from functools import partial
+
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
-import mysql.connector
+from dashboard.db_pool import get_pool
+from dashboard.local_replica import refresh_replica
+from dashboard.sync_stream import merge_chunks, run_pipeline, stream_chunks, tune_oracle_cursor
+from dashboard.rollups import ROLLUPS, ensure_rollup_table, load_rollup, rebuild_rollup
+from dashboard.sync_diff import RowDiff, delete_keys, ensure_row_hash_column, load_hashes
+from dashboard.table_swap import build_indexes, create_shadow, drop_old_tables, rollback_tables, swap_tables
 
 try:
     import oracledb
@@ -20,14 +28,183 @@ AND V.STUDENTSTATUS < 40
 ORDER BY V.LEVELID, NLSSORT(V.PROGRAMNAME, 'NLS_SORT=THAI_DICTIONARY'), V.STUDENTCODE
 """
 
+# Parallel extraction: ORACLE_QUERY split into ORACLE_PARALLELISM contiguous STUDENTCODE
+# ranges, each fetched on its own pooled session. A plain range on the key column can be
+# pushed into the view (and served by an index on STUDENTCODE), so each session joins only
+# its own rows instead of every session evaluating the whole view and filtering afterwards.
+# The ranges are queried at slightly different times, so they are keyed on the immutable
+# student code: a row whose faculty/level changes mid-sync still lands in exactly one range
+# (never missed, then deleted by the differential load). Range bounds are quantiles of the
+# codes loaded by the previous sync; the first and last ranges are open-ended so new
+# students are always covered. ORACLE_PARALLELISM=1, or no previous sync, runs the single query.
+ORACLE_PARALLELISM = int(os.getenv('ORACLE_PARALLELISM', '4'))
+
+# Same rows as ORACLE_QUERY for one STUDENTCODE range; no ORDER BY (the loader does not need it)
+ORACLE_PARTITION_QUERY = """
+SELECT V.STUDENTCODE, V.PREFIXNAME, V.STUDENTNAME, V.STUDENTSURNAME,
+       V.LEVELID, V.LEVELNAME, V.PROGRAMNAME, V.DEGREENAME, V.FACULTYNAME,
+       VP.APASSWORD
+FROM AVSREG.VIEWSTUDENTINFO V, AVSREG.VIEWSYSSTUDENTPASSWORD VP
+WHERE V.STUDENTID = VP.STUDENTID
+AND V.STUDENTSTATUS < 40
+AND {condition}
+"""
+
 INSERT_QUERY = """
-INSERT INTO students_info (student_code, prefix_name, student_name, student_surname,
-                           level_id, level_name, program_name, degree_name, faculty_name, apassword)
-VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+INSERT INTO {table} (student_code, prefix_name, student_name, student_surname,
+                           level_id, level_name, program_name, degree_name, faculty_name, apassword,
+                           entry_year_be, gender, row_hash)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
 """
 
+UPDATE_QUERY = """
+UPDATE students_info
+SET prefix_name = %s, student_name = %s, student_surname = %s, level_id = %s, level_name = %s,
+    program_name = %s, degree_name = %s, faculty_name = %s, apassword = %s,
+    entry_year_be = %s, gender = %s, row_hash = %s
+WHERE student_code = %s
+"""
+
+# Normalized columns precomputed at sync time so dashboards can filter/group on
+# indexed columns instead of SUBSTRING(student_code) / CASE prefix_name
+DERIVED_COLUMNS = [
+    ('entry_year_be', 'SMALLINT UNSIGNED NULL', 'idx_students_entry_year_be'),
+    ('gender', 'VARCHAR(20) NULL', 'idx_students_gender'),
+]
+
+# students_info and its rollup are swapped in (and rolled back) together
+SWAP_TABLES = ['students_info', ROLLUPS['students_info']['table']]
+
+
+def entry_year_be(student_code):
+    """Buddhist entry year from the first 2 digits of student_code (68 -> 2568, 55 -> 2555)."""
+    year_code = (student_code or '')[:2]
+    if len(year_code) != 2 or not year_code.isdigit():
+        return None
+    year_code = int(year_code)
+    return 2500 + year_code if year_code > 50 else 2600 + year_code
+
+
+def student_gender(prefix_name):
+    """Gender estimated from the Thai name prefix (same rule the dashboards used)."""
+    if prefix_name == 'นาย':
+        return 'ชาย'
+    if prefix_name in ('นางสาว', 'นาง'):
+        return 'หญิง'
+    return 'ไม่ระบุ'
+
+
+def ensure_derived_columns(cursor):
+    """Add entry_year_be / gender (+ indexes) to students_info if missing. DDL — call outside the load transaction."""
+    cursor.execute(
+        "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'students_info'"
+    )
+    existing = {row[0] for row in cursor.fetchall()}
+    for column, definition, index_name in DERIVED_COLUMNS:
+        if column not in existing:
+            cursor.execute(
+                f"ALTER TABLE students_info ADD COLUMN {column} {definition}, "
+                f"ADD INDEX {index_name} ({column})"
+            )
+
+
+def partition_bounds(codes, partitions=ORACLE_PARALLELISM):
+    """
+    Split points between STUDENTCODE ranges of roughly equal size, from the codes of the
+    previous sync. Returns [] (single query) when there are too few codes to split.
+    """
+    codes = sorted(code for code in codes if code)
+    if partitions < 2 or len(codes) < partitions:
+        return []
+    return sorted({codes[len(codes) * n // partitions] for n in range(1, partitions)})
+
+
+def fetch_partition(pool, low, high):
+    """Stream one STUDENTCODE range [low, high) on its own pooled Oracle session (None = open end)."""
+    conditions, params = [], {}
+    if low is not None:
+        conditions.append('V.STUDENTCODE >= :low')
+        params['low'] = low
+    if high is not None:
+        conditions.append('V.STUDENTCODE < :high')
+        params['high'] = high
+    with pool.acquire() as connection:
+        cursor = connection.cursor()
+        tune_oracle_cursor(cursor)
+        cursor.execute(ORACLE_PARTITION_QUERY.format(condition=' AND '.join(conditions)), params)
+        yield from stream_chunks(cursor)
+
+
+def partition_sources(pool, bounds):
+    """One merge_chunks source per STUDENTCODE range between consecutive bounds."""
+    edges = [None, *bounds, None]
+    return [partial(fetch_partition, pool, low, high) for low, high in zip(edges, edges[1:])]
+
+
+def transform(rows):
+    """Oracle rows -> students_info column values (row_hash is appended by RowDiff)."""
+    return [
+        (
+            row[0], row[1], row[2], row[3], row[4],
+            row[5], row[6], row[7], row[8], row[9],
+            entry_year_be(row[0]), student_gender(row[1]),
+        )
+        for row in rows
+    ]
+
+
+def load_full(mysql_conn, mysql_cursor, chunks, progress=None):
+    """Bulk-load every row into a shadow table, then swap it in with the rollup in one RENAME."""
+    # Bulk load into an index-less shadow table; readers keep using students_info
+    shadow, indexes = create_shadow(mysql_cursor, 'students_info')
+    insert_query = INSERT_QUERY.format(table=shadow)
+
+    # Pipeline: a reader thread fetches + transforms Oracle chunks while this thread
+    # inserts the previous chunk into the shadow table; each chunk commits on its
+    # own (the shadow has no readers)
+    def write(batch):
+        mysql_cursor.executemany(insert_query, batch)
+        mysql_conn.commit()
+
+    run_pipeline(chunks, write, 'students_info ', progress)
+
+    # Indexes once the data is in, then the rollup from the shadow copy
+    build_indexes(mysql_cursor, shadow, indexes)
+    rollup_shadow, _ = create_shadow(mysql_cursor, SWAP_TABLES[1])
+    load_rollup(mysql_cursor, 'students_info', shadow, rollup_shadow)
+    mysql_conn.commit()
+
+    # One atomic RENAME swaps both tables in; the previous copies are kept as *_old
+    swap_tables(mysql_cursor, SWAP_TABLES)
+
+
+def load_delta(mysql_conn, mysql_cursor, chunks, diff, progress=None):
+    """Apply only the inserted / updated / deleted rows to students_info in one short transaction."""
+    insert_query = INSERT_QUERY.format(table='students_info')
+
+    def write(batch):
+        inserts = [row for row in batch if diff.is_new(row)]
+        updates = [(*row[1:], row[0]) for row in batch if not diff.is_new(row)]
+        if inserts:
+            mysql_cursor.executemany(insert_query, inserts)
+        if updates:
+            mysql_cursor.executemany(UPDATE_QUERY, updates)
+
+    run_pipeline(chunks, write, 'students_info ', progress)
+    delete_keys(mysql_cursor, 'students_info', 'student_code', diff.deleted_keys())
+
+    if not diff.has_changes:
+        mysql_conn.rollback()
+        return
+    # Rollup in the same transaction so readers never see it out of step
+    rebuild_rollup(mysql_cursor, 'students_info')
+    mysql_conn.commit()
+    # students_info_old no longer holds the previous sync: a rollback would undo this delta too
+    drop_old_tables(mysql_cursor, SWAP_TABLES)
 
-def run_sync_students(triggered_by='manual', triggered_user=None, existing_log=None):
+
+def run_sync_students(triggered_by='manual', triggered_user=None, existing_log=None, progress=None, full=False):
     from dashboard.models import SyncLog
 
     if existing_log is not None:
@@ -48,6 +225,7 @@ def run_sync_students(triggered_by='manual', triggered_user=None, existing_log=N
         raise ImportError('oracledb not installed')
 
     oracle_conn = None
+    oracle_pool = None
     mysql_conn = None
     try:
         # Init Oracle client (thick mode) if lib_dir is configured
@@ -61,64 +239,70 @@ def run_sync_students(triggered_by='manual', triggered_user=None, existing_log=N
             f"(HOST={os.getenv('ORACLE_HOST','202.29.55.15')})(PORT={os.getenv('ORACLE_PORT','1521')})))"
             f"(CONNECT_DATA=(SERVICE_NAME={os.getenv('ORACLE_SERVICE','npu')})))"
         )
-        oracle_conn = oracledb.connect(
-            user=os.getenv('ORACLE_USER', 'admin_e'),
-            password=os.getenv('ORACLE_PASSWORD', ''),
-            dsn=oracle_dsn,
-        )
-        oracle_cursor = oracle_conn.cursor()
-
-        mysql_conn = mysql.connector.connect(
-            host=os.getenv('API_DB_HOST', '202.29.55.213'),
-            user=os.getenv('API_DB_USER', 'admin_e'),
-            password=os.getenv('API_DB_PASSWORD', ''),
-            database=os.getenv('API_DB_NAME', 'api'),
-            ssl_disabled=True,
-        )
+        oracle_params = {
+            'user': os.getenv('ORACLE_USER', 'admin_e'),
+            'password': os.getenv('ORACLE_PASSWORD', ''),
+            'dsn': oracle_dsn,
+        }
+        mysql_conn = get_pool().acquire(query_timeout=0)
         mysql_cursor = mysql_conn.cursor()
 
+        # Schema changes on the live tables first, so the shadow copies pick them up
+        ensure_derived_columns(mysql_cursor)
+        ensure_row_hash_column(mysql_cursor, 'students_info')
+        ensure_rollup_table(mysql_cursor, 'students_info')
+
         # Count records before
         mysql_cursor.execute("SELECT COUNT(*) FROM students_info")
         records_before = mysql_cursor.fetchone()[0]
         log.records_before = records_before
         log.save(update_fields=['records_before'])
 
-        # Fetch Oracle data
-        oracle_cursor.execute(ORACLE_QUERY)
-        oracle_data = oracle_cursor.fetchall()
-
-        # DELETE all + bulk INSERT in a single transaction (atomic, InnoDB MVCC safe)
-        BATCH_SIZE = 500
-        mysql_cursor.execute("DELETE FROM students_info")
+        # Compare each row's content hash with the stored one. Without stored hashes
+        # (first sync after row_hash was added, or an empty table) a full load is
+        # cheaper than updating every row in place.
+        hashes = load_hashes(mysql_cursor, 'students_info', 'student_code')
+        full = full or not any(hashes.values())
+        diff = RowDiff(hashes, write_all=full)
 
-        synced = 0
-        batch = []
-        for row in oracle_data:
-            batch.append((
-                row[0], row[1], row[2], row[3], row[4],
-                row[5], row[6], row[7], row[8], row[9],
-            ))
-            if len(batch) >= BATCH_SIZE:
-                mysql_cursor.executemany(INSERT_QUERY, batch)
-                synced += len(batch)
-                batch = []
-        if batch:
-            mysql_cursor.executemany(INSERT_QUERY, batch)
-            synced += len(batch)
-
-        mysql_conn.commit()
+        bounds = partition_bounds(hashes)
+        if bounds:
+            # Code ranges fetched in parallel, merged into the single loader pipeline
+            partitions = len(bounds) + 1
+            oracle_pool = oracledb.create_pool(min=1, max=partitions, increment=1, **oracle_params)
+            source = merge_chunks(partition_sources(oracle_pool, bounds), partitions)
+        else:
+            oracle_conn = oracledb.connect(**oracle_params)
+            oracle_cursor = oracle_conn.cursor()
+            tune_oracle_cursor(oracle_cursor)
+            oracle_cursor.execute(ORACLE_QUERY)
+            source = stream_chunks(oracle_cursor)
+        # closing() stops the partition reader threads (and returns their sessions)
+        # even when the load fails, before the pool is closed below
+        with closing(source):
+            chunks = (diff.changes(transform(rows)) for rows in source)
+            if full:
+                load_full(mysql_conn, mysql_cursor, chunks, progress)
+            else:
+                load_delta(mysql_conn, mysql_cursor, chunks, diff, progress)
 
         # Count records after
         mysql_cursor.execute("SELECT COUNT(*) FROM students_info")
         records_after = mysql_cursor.fetchone()[0]
 
         log.status = 'success'
-        log.records_synced = synced
+        log.records_synced = len(diff.seen)
         log.records_after = records_after
         log.finished_at = timezone.now()
-        log.save(update_fields=['status', 'records_synced', 'records_after', 'finished_at'])
+        diff.record(log)
+        log.save(update_fields=[
+            'status', 'records_synced', 'records_after', 'finished_at',
+            'records_inserted', 'records_updated', 'records_deleted', 'records_unchanged',
+        ])
+
+        # Refresh the web host's local read replica (failure only logs; the sync already succeeded)
+        refresh_replica(mysql_cursor, 'students_info', log.id)
 
-        oracle_cursor.close()
         mysql_cursor.close()
         return log
 
@@ -131,7 +315,51 @@ def run_sync_students(triggered_by='manual', triggered_user=None, existing_log=N
     finally:
         if oracle_conn:
             oracle_conn.close()
-        if mysql_conn and mysql_conn.is_connected():
+        if oracle_pool:
+            oracle_pool.close(force=True)
+        # Always hand a pooled connection back, even a dropped one (the pool discards it)
+        if mysql_conn is not None:
+            mysql_conn.close()
+
+
+def run_rollback_students(triggered_by='manual', triggered_user=None):
+    """Swap students_info_old (the copy replaced by the last full sync) back in, with its rollup."""
+    from dashboard.models import SyncLog
+
+    log = SyncLog.objects.create(
+        table_name='students_info',
+        status='running',
+        triggered_by=triggered_by,
+        triggered_user=triggered_user,
+    )
+    mysql_conn = None
+    try:
+        mysql_conn = get_pool().acquire(query_timeout=0)
+        mysql_cursor = mysql_conn.cursor()
+
+        mysql_cursor.execute("SELECT COUNT(*) FROM students_info")
+        log.records_before = mysql_cursor.fetchone()[0]
+
+        rollback_tables(mysql_cursor, SWAP_TABLES)
+
+        mysql_cursor.execute("SELECT COUNT(*) FROM students_info")
+        log.records_after = mysql_cursor.fetchone()[0]
+        log.status = 'success'
+        log.finished_at = timezone.now()
+        log.save(update_fields=['status', 'records_before', 'records_after', 'finished_at'])
+
+        refresh_replica(mysql_cursor, 'students_info', log.id)
+        mysql_cursor.close()
+        return log
+
+    except Exception as e:
+        log.status = 'failed'
+        log.error_message = str(e)
+        log.finished_at = timezone.now()
+        log.save(update_fields=['status', 'error_message', 'finished_at'])
+        raise
+    finally:
+        if mysql_conn is not None:
             mysql_conn.close()
 
 
@@ -144,15 +372,39 @@ class Command(BaseCommand):
             default='manual',
             help='Who triggered this sync (manual, schedule, etc.)',
         )
+        parser.add_argument(
+            '--rollback',
+            action='store_true',
+            help='Swap back the students_info copy replaced by the last full sync instead of syncing',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Reload the whole table through a shadow table instead of applying only changed rows',
+        )
 
     def handle(self, *args, **kwargs):
         triggered_by = kwargs.get('triggered_by', 'manual')
+        if kwargs.get('rollback'):
+            self.stdout.write('Rolling back students_info to the previous sync...')
+            try:
+                log = run_rollback_students(triggered_by=triggered_by)
+                self.stdout.write(self.style.SUCCESS(
+                    f'Rollback completed (before={log.records_before}, after={log.records_after})'
+                ))
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f'Rollback failed: {e}'))
+            return
         self.stdout.write(f'Starting students_info sync (triggered_by={triggered_by})...')
         try:
-            log = run_sync_students(triggered_by=triggered_by)
+            log = run_sync_students(
+                triggered_by=triggered_by, progress=self.stdout.write, full=kwargs.get('full', False),
+            )
             self.stdout.write(self.style.SUCCESS(
                 f'Sync completed: {log.records_synced} records synced '
-                f'(before={log.records_before}, after={log.records_after}, '
+                f'(inserted={log.records_inserted}, updated={log.records_updated}, '
+                f'deleted={log.records_deleted}, unchanged={log.records_unchanged}; '
+                f'before={log.records_before}, after={log.records_after}, '
                 f'duration={log.duration_seconds}s)'
             ))
         except Exception as e:
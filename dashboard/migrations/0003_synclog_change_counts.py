@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0002_add_synclog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synclog',
+            name='records_inserted',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='synclog',
+            name='records_updated',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='synclog',
+            name='records_deleted',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='synclog',
+            name='records_unchanged',
+            field=models.IntegerField(default=0),
+        ),
+    ]
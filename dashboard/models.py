@@ -44,6 +44,11 @@ class SyncLog(models.Model):
     records_before = models.IntegerField(default=0)
     records_after = models.IntegerField(default=0)
     records_synced = models.IntegerField(default=0)
+    # Differential sync: how the rows read from the source compared with the target
+    records_inserted = models.IntegerField(default=0)
+    records_updated = models.IntegerField(default=0)
+    records_deleted = models.IntegerField(default=0)
+    records_unchanged = models.IntegerField(default=0)
     error_message = models.TextField(blank=True, default='')
     triggered_by = models.CharField(max_length=20, default='manual')  # 'manual' | 'schedule'
     triggered_user = models.ForeignKey(
@@ -0,0 +1,145 @@
+"""
+Cache ผลลัพธ์ของฟังก์ชันอ่านข้อมูลใน database_utils ตาม data generation
+
+key ของแต่ละรายการคือ ชื่อฟังก์ชัน + arguments + generation ของตารางที่ใช้
+(ดู data_generation.py) เมื่อ sync สำเร็จ generation เปลี่ยน key เดิมจะไม่ถูก
+เรียกอีก และค่อย ๆ ถูก evict ออกตามลำดับ LRU — ไม่ต้องล้าง cache เอง
+
+ผลการค้นหาบุคลากร/นักศึกษาใช้ cache แยก (search cache) เพื่อไม่ให้คำค้นจำนวนมาก
+ไล่ผลลัพธ์ของหน้า dashboard ออกจาก cache
+
+ตั้งค่าผ่าน environment variables:
+    RESULT_CACHE_SIZE   จำนวนผลลัพธ์สูงสุดที่เก็บ (default 512)
+    SEARCH_CACHE_SIZE   จำนวนผลการค้นหาสูงสุดที่เก็บ (default 2048)
+
+เมื่อฟังก์ชันล้มเหลว (คืน None — เช่น ฐานข้อมูล api ล่มหรือ circuit breaker ตัดวงจร
+ดู db_pool.py) จะคืนผลลัพธ์ล่าสุดที่สำเร็จของ arguments เดียวกัน (จาก generation ใดก็ได้)
+แทน โดยทำเครื่องหมายว่าเป็นข้อมูลเก่า (ดู mark_stale) — หน้าเว็บยังแสดงได้ระหว่างฐานข้อมูลล่ม
+
+หมายเหตุ: ผลลัพธ์ที่คืนจาก cache เป็น object เดียวกันทุกครั้ง ผู้เรียกไม่ควรแก้ไข
+"""
+import functools
+import os
+import threading
+from collections import OrderedDict
+
+from .data_generation import get_generation
+
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '512'))
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '2048'))
+
+
+class ResultCache:
+    """LRU cache แบบ thread-safe พร้อมสถิติ hit / miss / eviction"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> value
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        """คืน (True, value) ถ้ามีใน cache, ไม่งั้น (False, None)"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return True, self._entries[key]
+            self._stats['misses'] += 1
+            return False, None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+            stats['max_size'] = self.max_size
+        return stats
+
+
+_cache = ResultCache(RESULT_CACHE_SIZE)
+search_cache = ResultCache(SEARCH_CACHE_SIZE)
+# ผลลัพธ์ล่าสุดที่สำเร็จของแต่ละการเรียก (ไม่ขึ้นกับ generation) สำหรับใช้ตอนดึงข้อมูลใหม่ไม่ได้
+_last_good = ResultCache(RESULT_CACHE_SIZE + SEARCH_CACHE_SIZE)
+
+
+class StaleList(list):
+    """list ของผลลัพธ์เก่า (ใช้แทน list เดิมเมื่อดึงข้อมูลใหม่ไม่ได้)"""
+
+    is_stale = True
+
+
+def mark_stale(value):
+    """
+    ทำเครื่องหมายผลลัพธ์ว่าเป็นข้อมูลเก่า: dict ได้ key 'is_stale' = True,
+    list กลายเป็น StaleList (attribute is_stale) — ชนิดอื่นคืนค่าเดิม
+    """
+    if isinstance(value, dict):
+        return dict(value, is_stale=True)
+    if isinstance(value, list):
+        return StaleList(value)
+    return value
+
+
+def is_stale(value):
+    """ผลลัพธ์นี้เป็นข้อมูลเก่าจาก mark_stale หรือไม่"""
+    if isinstance(value, dict):
+        return bool(value.get('is_stale'))
+    return getattr(value, 'is_stale', False)
+
+
+def cached_result(*tables, cache=None):
+    """
+    Decorator: cache ผลลัพธ์ของฟังก์ชันตาม arguments + generation ของ tables
+    cache: ResultCache ที่ใช้เก็บ (default คือ result cache หลัก)
+    ผลลัพธ์ None (เกิดข้อผิดพลาด) จะไม่ถูก cache แต่ผลลัพธ์ว่าง ([] / {}) ถูก cache
+    ถ้าเกิดข้อผิดพลาดและเคยมีผลลัพธ์ที่สำเร็จ จะคืนผลลัพธ์นั้นแบบ mark_stale แทน None
+    """
+    def decorator(func):
+        store = cache if cache is not None else _cache
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            generations = tuple(get_generation(table) for table in tables)
+            call = (func.__qualname__, args, tuple(sorted(kwargs.items())))
+            key = call + (generations,)
+            try:
+                found, value = store.get(key)
+            except TypeError:
+                # arguments ที่ hash ไม่ได้ — ไม่ใช้ cache
+                return func(*args, **kwargs)
+            if found:
+                return value
+
+            value = func(*args, **kwargs)
+            if value is None:
+                found, last_good = _last_good.get(call)
+                return mark_stale(last_good) if found else None
+            store.set(key, value)
+            _last_good.set(call, value)
+            return value
+        return wrapper
+    return decorator
+
+
+def get_cache_stats():
+    """สถิติของ result cache (รวมจำนวนผลลัพธ์ล่าสุดที่เก็บไว้ใช้ตอนฐานข้อมูลล่ม)"""
+    stats = _cache.stats()
+    stats['last_good'] = _last_good.stats()['size']
+    return stats
+
+
+def get_search_cache_stats():
+    """สถิติของ search cache"""
+    return search_cache.stats()
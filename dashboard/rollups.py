@@ -0,0 +1,151 @@
+"""
+Rollup tables ในฐานข้อมูล api
+
+ตารางสรุปขนาดเล็ก (จำนวนนับแบบละเอียดสุดของทุกมิติที่ dashboard ใช้)
+ถูกสร้างใหม่โดย sync_staff ใน transaction เดียวกับที่โหลดตารางหลัก และโดย
+sync_students ลง shadow table แล้วสลับเข้าพร้อมตารางหลักด้วย RENAME เดียว
+(ดู table_swap.py) จึงตรงกับข้อมูลในตารางหลักเสมอ
+
+ทุกระบบที่ใช้ฐานข้อมูล api ร่วมกัน (AIMS, Task Scheduler, ระบบพอร์ต 8010–8014)
+อ่านยอดรวมจากตารางเหล่านี้ได้ด้วย SUM(...) GROUP BY แทนการ scan ตารางหลัก
+"""
+
+STUDENTS_ROLLUP_TABLE = 'students_info_rollup'
+STAFF_ROLLUP_TABLE = 'staff_info_rollup'
+
+# นับนักศึกษาแบบละเอียดสุด (คณะ × สาขา × ระดับ × เพศ × ปีเข้า)
+# (MySQL ไม่รองรับ GROUPING SETS จึงเก็บระดับละเอียดสุดซึ่งมีไม่กี่พันแถว)
+# ใช้คอลัมน์ gender / entry_year_be ที่ sync_students คำนวณไว้แล้ว
+STUDENT_GROUPS_QUERY = """
+    SELECT faculty_name, program_name, level_name, gender, entry_year_be, COUNT(*) AS count
+    FROM students_info
+    GROUP BY faculty_name, program_name, level_name, gender, entry_year_be
+"""
+
+# แบบเดียวกับ STUDENT_GROUPS_QUERY แต่คำนวณเพศ/ปีเข้าจาก prefix_name และ student_code
+# ใช้เฉพาะกรณียังไม่เคย sync หลังติดตั้ง (ยังไม่มี rollup และคอลัมน์ที่คำนวณไว้)
+STUDENT_GROUPS_DERIVED_QUERY = """
+    SELECT
+        faculty_name,
+        program_name,
+        level_name,
+        CASE
+            WHEN prefix_name IN ('นาย') THEN 'ชาย'
+            WHEN prefix_name IN ('นางสาว', 'นาง') THEN 'หญิง'
+            ELSE 'ไม่ระบุ'
+        END AS gender,
+        CASE
+            WHEN SUBSTRING(student_code, 1, 2) NOT REGEXP '^[0-9]{2}$' THEN NULL
+            WHEN CAST(SUBSTRING(student_code, 1, 2) AS UNSIGNED) > 50
+            THEN CAST(SUBSTRING(student_code, 1, 2) AS UNSIGNED) + 2500
+            ELSE CAST(SUBSTRING(student_code, 1, 2) AS UNSIGNED) + 2600
+        END AS entry_year_be,
+        COUNT(*) AS count
+    FROM students_info
+    GROUP BY faculty_name, program_name, level_name, gender, entry_year_be
+"""
+
+# นับบุคลากรแบบละเอียดสุด (หน่วยงาน × ประเภท × เพศ × ตำแหน่ง)
+STAFF_GROUPS_QUERY = """
+    SELECT DEPARTMENTNAME, STFTYPENAME, GENDERNAMETH, POSNAMETH, COUNT(*) AS count
+    FROM staff_info
+    GROUP BY DEPARTMENTNAME, STFTYPENAME, GENDERNAMETH, POSNAMETH
+"""
+
+ROLLUPS = {
+    'students_info': {
+        'table': STUDENTS_ROLLUP_TABLE,
+        'dimensions': ('faculty_name', 'program_name', 'level_name', 'gender', 'entry_year_be'),
+        'count_column': 'student_count',
+        'groups_query': STUDENT_GROUPS_DERIVED_QUERY,
+        'create': f"""
+            CREATE TABLE IF NOT EXISTS {STUDENTS_ROLLUP_TABLE} (
+                faculty_name VARCHAR(255) NULL,
+                program_name VARCHAR(255) NULL,
+                level_name VARCHAR(255) NULL,
+                gender VARCHAR(20) NOT NULL,
+                entry_year_be SMALLINT UNSIGNED NULL,
+                student_count INT UNSIGNED NOT NULL,
+                built_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+        """,
+        'delete': f"DELETE FROM {STUDENTS_ROLLUP_TABLE}",
+        'insert': f"""
+            INSERT INTO {STUDENTS_ROLLUP_TABLE}
+                (faculty_name, program_name, level_name, gender, entry_year_be, student_count)
+            {STUDENT_GROUPS_QUERY}
+        """,
+        'read': f"""
+            SELECT faculty_name, program_name, level_name, gender, entry_year_be, student_count
+            FROM {STUDENTS_ROLLUP_TABLE}
+        """,
+    },
+    'staff_info': {
+        'table': STAFF_ROLLUP_TABLE,
+        'dimensions': ('DEPARTMENTNAME', 'STFTYPENAME', 'GENDERNAMETH', 'POSNAMETH'),
+        'count_column': 'staff_count',
+        'groups_query': STAFF_GROUPS_QUERY,
+        'create': f"""
+            CREATE TABLE IF NOT EXISTS {STAFF_ROLLUP_TABLE} (
+                DEPARTMENTNAME VARCHAR(255) NULL,
+                STFTYPENAME VARCHAR(255) NULL,
+                GENDERNAMETH VARCHAR(50) NULL,
+                POSNAMETH VARCHAR(255) NULL,
+                staff_count INT UNSIGNED NOT NULL,
+                built_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+        """,
+        'delete': f"DELETE FROM {STAFF_ROLLUP_TABLE}",
+        'insert': f"""
+            INSERT INTO {STAFF_ROLLUP_TABLE}
+                (DEPARTMENTNAME, STFTYPENAME, GENDERNAMETH, POSNAMETH, staff_count)
+            {STAFF_GROUPS_QUERY}
+        """,
+        'read': f"""
+            SELECT DEPARTMENTNAME, STFTYPENAME, GENDERNAMETH, POSNAMETH, staff_count
+            FROM {STAFF_ROLLUP_TABLE}
+        """,
+    },
+}
+
+
+def ensure_rollup_table(cursor, table_name):
+    """
+    สร้างตาราง rollup ถ้ายังไม่มี (หรือสร้างใหม่ถ้าโครงสร้างคอลัมน์เปลี่ยน
+    เพราะเป็นข้อมูลที่คำนวณได้จากตารางหลักเสมอ)
+    ต้องเรียกก่อนเริ่ม transaction ของการ sync (DDL ทำให้ MySQL commit อัตโนมัติ)
+    """
+    rollup = ROLLUPS[table_name]
+    cursor.execute(
+        "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        (rollup['table'],),
+    )
+    existing = {row[0] for row in cursor.fetchall()}
+    expected = {*rollup['dimensions'], rollup['count_column'], 'built_at'}
+    if existing and existing != expected:
+        cursor.execute(f"DROP TABLE {rollup['table']}")
+    cursor.execute(rollup['create'])
+
+
+def rebuild_rollup(cursor, table_name):
+    """
+    สร้างข้อมูลใน rollup ใหม่จากตารางหลัก ภายใน transaction ปัจจุบัน
+    (ผู้อ่านจะเห็นข้อมูลชุดใหม่พร้อมกับตารางหลักเมื่อ commit)
+    """
+    rollup = ROLLUPS[table_name]
+    cursor.execute(rollup['delete'])
+    cursor.execute(rollup['insert'])
+
+
+def load_rollup(cursor, table_name, source_table, rollup_table):
+    """
+    นับยอดจาก source_table ลง rollup_table (เช่น shadow table ที่ยังไม่ถูกสลับเข้าแทน
+    ตารางจริง — ดู table_swap.py) ใช้มิติเดียวกับ rollup ของ table_name
+    """
+    rollup = ROLLUPS[table_name]
+    dimensions = ', '.join(rollup['dimensions'])
+    cursor.execute(
+        f"INSERT INTO {rollup_table} ({dimensions}, {rollup['count_column']}) "
+        f"SELECT {dimensions}, COUNT(*) FROM {source_table} GROUP BY {dimensions}"
+    )
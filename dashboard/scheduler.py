@@ -10,7 +10,10 @@ def sync_staff_job():
     from dashboard.management.commands.sync_staff import run_sync_staff
     try:
         log = run_sync_staff(triggered_by='schedule')
-        logger.info(f'[scheduler] sync_staff complete: {log.records_synced} records')
+        logger.info(
+            f'[scheduler] sync_staff complete: {log.records_synced} records '
+            f'(+{log.records_inserted} ~{log.records_updated} -{log.records_deleted})'
+        )
     except Exception as e:
         logger.error(f'[scheduler] sync_staff failed: {e}')
 
@@ -19,7 +22,10 @@ def sync_students_job():
     from dashboard.management.commands.sync_students import run_sync_students
     try:
         log = run_sync_students(triggered_by='schedule')
-        logger.info(f'[scheduler] sync_students complete: {log.records_synced} records')
+        logger.info(
+            f'[scheduler] sync_students complete: {log.records_synced} records '
+            f'(+{log.records_inserted} ~{log.records_updated} -{log.records_deleted})'
+        )
     except Exception as e:
         logger.error(f'[scheduler] sync_students failed: {e}')
 
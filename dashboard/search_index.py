@@ -0,0 +1,259 @@
+"""
+Search index ในหน่วยความจำ สำหรับค้นหาบุคลากร / นักศึกษา
+
+เก็บ posting list ของ n-gram (2 และ 3 ตัวอักษร) ของชื่อ นามสกุล รหัส และ
+หน่วยงาน/คณะ ของทุกแถว การค้นหาคือการ intersect posting list ของ n-gram
+ในคำค้น แล้วตรวจ/จัดอันดับเฉพาะแถวที่เหลือ — ไม่ต้อง scan ทั้งตาราง
+และไม่ต้องถามฐานข้อมูล (ยกเว้นตอนดึงรายละเอียดของหน้าผลลัพธ์สุดท้าย)
+
+index ถูกสร้างครั้งเดียวต่อ data generation (ดู data_generation.py)
+เมื่อ sync สำเร็จ index ใหม่จะถูกสร้างและสลับเข้าแทนของเดิมทีเดียว
+"""
+import heapq
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+
+GRAM_SIZES = (2, 3)
+PREFIX_LENGTH = 3
+
+# คะแนนความตรงของคำค้นแต่ละคำ (ใช้ค่าที่ดีที่สุดจากทุก field)
+SCORE_EXACT = 3
+SCORE_PREFIX = 2
+SCORE_SUBSTRING = 1
+
+
+def normalize(text):
+    """NFC + casefold + ยุบช่องว่าง (ใช้ทั้งตอนสร้าง index และตอนค้นหา)"""
+    return ' '.join(unicodedata.normalize('NFC', text or '').casefold().split())
+
+
+def _grams(text, size):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def _contains(posting, doc):
+    i = bisect_left(posting, doc)
+    return i < len(posting) and posting[i] == doc
+
+
+def _intersect(postings, start=0):
+    """ไล่เลขเอกสาร (ตั้งแต่ start) ที่อยู่ในทุก posting list ตามลำดับ (เริ่มจาก list ที่สั้นที่สุด)"""
+    postings = sorted(postings, key=len)
+    first, rest = postings[0], postings[1:]
+    first = first[bisect_left(first, start):]
+    return (doc for doc in first if all(_contains(posting, doc) for posting in rest))
+
+
+def _add(postings, token, doc):
+    posting = postings.get(token)
+    if posting is None:
+        posting = postings[token] = array('I')
+    posting.append(doc)
+
+
+class SearchIndex:
+    """
+    Index ของเอกสาร (แถว) ที่ค้นได้
+    rows: iterable ของ (key, sort_key, fields)
+        key       ค่าที่ใช้ดึงรายละเอียดจากฐานข้อมูล (STAFFID / student_code)
+        sort_key  tuple สำหรับเรียงผลลัพธ์ที่คะแนนเท่ากัน (ชื่อ, นามสกุล, รหัส — ห้ามมี None)
+        fields    tuple ของข้อความที่ค้นได้
+
+    เลขเอกสารถูกกำหนดตามลำดับ sort_key ดังนั้นการไล่ posting list ตามลำดับ
+    ก็คือการไล่ผลลัพธ์ตามลำดับที่แสดง — หยุดได้ทันทีเมื่อได้ครบ limit
+    """
+
+    def __init__(self, rows):
+        self.keys = []
+        self.sort_keys = []  # เรียงจากน้อยไปมาก (เลขเอกสาร = ลำดับใน list นี้)
+        self._fields = []
+        self._postings = {}  # gram -> array ของเลขเอกสาร (เรียงจากน้อยไปมาก)
+        self._prefixes = {}  # ตัวอักษร 1..PREFIX_LENGTH ตัวแรกของ field -> เลขเอกสาร
+        self._exact = {}     # ค่าทั้ง field -> เลขเอกสาร
+        for doc, (key, sort_key, fields) in enumerate(sorted(rows, key=lambda row: row[1])):
+            fields = tuple(normalize(field) for field in fields)
+            self.keys.append(key)
+            self.sort_keys.append(tuple(sort_key))
+            self._fields.append(fields)
+            grams = set()
+            prefixes = set()
+            for field in fields:
+                for size in GRAM_SIZES:
+                    grams |= _grams(field, size)
+                prefixes.update(field[:n] for n in range(1, min(len(field), PREFIX_LENGTH) + 1))
+            for gram in grams:
+                _add(self._postings, gram, doc)
+            for prefix in prefixes:
+                _add(self._prefixes, prefix, doc)
+            for field in set(fields):
+                if field:
+                    _add(self._exact, field, doc)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, query, limit=100, after=None):
+        """
+        คืน [(score, key), ...] ของแถวที่ตรงกับทุกคำในคำค้น เรียงตามคะแนนแล้วตาม sort_key
+        after=(score, sort_key) ของแถวสุดท้ายในหน้าก่อน (keyset) — คืนเฉพาะแถวที่อยู่ถัดไป
+        """
+        terms = normalize(query).split()
+        if not terms:
+            return []
+        if after is None:
+            after_score, start = None, 0
+        else:
+            after_score, start = after[0], bisect_right(self.sort_keys, tuple(after[1]))
+        if len(terms) == 1:
+            found = self._search_term(terms[0], limit, after_score, start)
+        else:
+            scored = self._match(terms)
+            if after_score is not None:
+                scored = [
+                    (negative, doc) for negative, doc in scored
+                    if -negative < after_score or (-negative == after_score and doc >= start)
+                ]
+            found = [(-negative, doc) for negative, doc in heapq.nsmallest(limit, scored)]
+        return [(score, self.keys[doc]) for score, doc in found]
+
+    def _search_term(self, term, limit, after_score, start):
+        # คำเดียว: ไล่ทีละระดับคะแนน (ตรงทั้ง field, ขึ้นต้นด้วย, มีอยู่ใน) ตามลำดับ sort_key
+        # แต่ละระดับคืนเฉพาะแถวที่คะแนนดีที่สุดอยู่ในระดับนั้น จึงไม่ซ้ำกันข้ามระดับ
+        found = []
+        for score, tier in (
+            (SCORE_EXACT, self._exact_matches),
+            (SCORE_PREFIX, self._prefix_matches),
+            (SCORE_SUBSTRING, self._substring_matches),
+        ):
+            if after_score is not None and score > after_score:
+                continue
+            tier_start = start if score == after_score else 0
+            for doc in tier(term, tier_start):
+                if score == SCORE_EXACT or self._score(self._fields[doc], (term,)) == score:
+                    found.append((score, doc))
+                    if len(found) >= limit:
+                        return found
+        return found
+
+    def _exact_matches(self, term, start):
+        posting = self._exact.get(term)
+        if posting is None:
+            return ()
+        return posting[bisect_left(posting, start):]
+
+    def _prefix_matches(self, term, start):
+        posting = self._prefixes.get(term[:PREFIX_LENGTH])
+        if posting is None:
+            return ()
+        if len(term) <= PREFIX_LENGTH:
+            return posting[bisect_left(posting, start):]
+        postings = self._term_postings(term)
+        if postings is None:
+            return ()
+        return _intersect([posting, *postings], start)
+
+    def _substring_matches(self, term, start):
+        postings = self._term_postings(term)
+        if postings is None:
+            return ()
+        if not postings:
+            return range(start, len(self.keys))
+        return _intersect(postings, start)
+
+    def _term_postings(self, term):
+        """posting list ของ n-gram ในคำ ([] ถ้าคำสั้นกว่า n-gram, None ถ้ามี n-gram ที่ไม่พบเลย)"""
+        size = min(len(term), GRAM_SIZES[-1])
+        if size < GRAM_SIZES[0]:
+            return []
+        postings = []
+        for gram in _grams(term, size):
+            posting = self._postings.get(gram)
+            if posting is None:
+                return None
+            postings.append(posting)
+        return postings
+
+    def _match(self, terms):
+        """หลายคำ: คืน [(-score, doc), ...] ของแถวที่มีทุกคำ"""
+        postings = []
+        for term in terms:
+            term_postings = self._term_postings(term)
+            if term_postings is None:
+                return []
+            postings.extend(term_postings)
+
+        candidates = _intersect(postings) if postings else range(len(self.keys))
+
+        scored = []
+        for doc in candidates:
+            score = self._score(self._fields[doc], terms)
+            if score:
+                scored.append((-score, doc))
+        return scored
+
+    @staticmethod
+    def _score(fields, terms):
+        total = 0
+        for term in terms:
+            best = 0
+            for field in fields:
+                if field == term:
+                    best = SCORE_EXACT
+                    break
+                if field.startswith(term):
+                    best = SCORE_PREFIX
+                elif best < SCORE_SUBSTRING and term in field:
+                    best = SCORE_SUBSTRING
+            if not best:
+                return 0
+            total += best
+        return total
+
+
+class PrefixIndex:
+    """
+    Index สำหรับ typeahead: token ที่ normalize แล้ว (ชื่อ, นามสกุล, ชื่อ-สกุล, รหัส)
+    เรียงเป็น array เดียว การหา token ที่ขึ้นต้นด้วยคำค้นคือ bisect หนึ่งครั้ง
+    แล้วไล่ต่อไปตามลำดับ (token ที่สั้นกว่า/ตรงกว่ามาก่อนเสมอ)
+    rows: iterable ของ (item, tokens) — item คือข้อมูลที่คืนให้ผู้เรียก
+    """
+
+    # จำนวน token สูงสุดที่ไล่ต่อหนึ่งผลลัพธ์ (กันกรณี token ซ้ำของแถวเดิมจำนวนมาก)
+    SCAN_FACTOR = 8
+
+    def __init__(self, rows):
+        self.items = []
+        entries = []
+        for doc, (item, tokens) in enumerate(rows):
+            self.items.append(item)
+            for token in {normalize(token) for token in tokens}:
+                if token:
+                    entries.append((token, doc))
+        entries.sort()
+        self._tokens = [token for token, _ in entries]
+        self._docs = array('I', (doc for _, doc in entries))
+
+    def __len__(self):
+        return len(self.items)
+
+    def suggest(self, prefix, limit=10):
+        """คืน item ของแถวที่มี token ขึ้นต้นด้วย prefix (ไม่เกิน limit รายการ)"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        found = []
+        seen = set()
+        tokens = self._tokens
+        start = bisect_left(tokens, prefix)
+        end = min(len(tokens), start + limit * self.SCAN_FACTOR)
+        for i in range(start, end):
+            if not tokens[i].startswith(prefix):
+                break
+            doc = self._docs[i]
+            if doc not in seen:
+                seen.add(doc)
+                found.append(self.items[doc])
+                if len(found) >= limit:
+                    break
+        return found
@@ -0,0 +1,124 @@
+"""
+Differential sync ด้วย hash ของเนื้อหาแต่ละแถว
+
+ข้อมูลนักศึกษา/บุคลากรส่วนใหญ่ไม่เปลี่ยนระหว่างคืน แต่การ sync เดิมเขียนใหม่ทุกแถว
+ตารางปลายทางจึงเก็บ row_hash (hash ของค่าที่ sync เขียนลงแถวนั้น) ไว้ การ sync
+อ่าน {key: row_hash} ของปลายทางครั้งเดียว แล้วเทียบกับ hash ของแถวจากต้นทาง
+    ไม่มี key ในปลายทาง    -> inserted
+    hash ต่างกัน            -> updated
+    hash เท่ากัน            -> unchanged (ไม่เขียน)
+    key ที่ไม่พบในต้นทาง    -> deleted
+ปริมาณการเขียน / binlog / เวลาที่ถือ lock จึงเหลือเท่ากับส่วนที่เปลี่ยนจริงในวันนั้น
+"""
+import hashlib
+
+ROW_HASH_DEFINITION = 'CHAR(32) NULL'
+
+_NULL = b'\xff\xff\xff\xff'
+
+
+def row_hash(values):
+    """
+    hash (hex 32 ตัว) ของค่าในแถว — คงที่ข้ามรอบ sync และข้าม process (ไม่ใช้ hash() ของ Python)
+    แต่ละค่าขึ้นต้นด้วยความยาว จึงแยก None / '' / ค่าที่มีตัวคั่นปนอยู่ได้
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for value in values:
+        if value is None:
+            digest.update(_NULL)
+            continue
+        encoded = str(value).encode('utf-8')
+        digest.update(len(encoded).to_bytes(4, 'big'))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+def ensure_row_hash_column(cursor, table_name):
+    """เพิ่มคอลัมน์ row_hash ถ้ายังไม่มี (DDL — ต้องเรียกนอก transaction ของการ sync)"""
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = 'row_hash'",
+        (table_name,),
+    )
+    if not cursor.fetchone()[0]:
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN row_hash {ROW_HASH_DEFINITION}")
+
+
+def load_hashes(cursor, table_name, key_column):
+    """คืน {key: row_hash} ของทุกแถวในปลายทาง (row_hash เป็น None สำหรับแถวที่ยังไม่เคยคำนวณ)"""
+    cursor.execute(f"SELECT {key_column}, row_hash FROM {table_name}")
+    return dict(cursor.fetchall())
+
+
+class RowDiff:
+    """
+    เทียบแถวจากต้นทางกับ hash ของปลายทาง (จาก load_hashes) ทีละ chunk และนับการเปลี่ยนแปลง
+    แถวคือ tuple ของค่าที่จะเขียน โดย key อยู่ที่ตำแหน่งแรก
+    write_all=True คืนทุกแถวให้เขียน (เช่น sync แบบ --full) แต่ยังนับประเภทการเปลี่ยนแปลงเหมือนเดิม
+    """
+
+    def __init__(self, hashes, write_all=False):
+        self.hashes = hashes
+        self.write_all = write_all
+        self.seen = set()
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+
+    def changes(self, rows):
+        """
+        คืน list ของแถวที่ต้องเขียน แต่ละแถวต่อท้ายด้วย row_hash
+        key ซ้ำในต้นทางนับครั้งแรกครั้งเดียว (และเขียนซ้ำเฉพาะเมื่อ write_all)
+        """
+        changed = []
+        for row in rows:
+            key = row[0]
+            digest = row_hash(row)
+            if key in self.seen:
+                if self.write_all:
+                    changed.append((*row, digest))
+                continue
+            self.seen.add(key)
+            if key not in self.hashes:
+                self.inserted += 1
+            elif self.hashes[key] != digest:
+                self.updated += 1
+            else:
+                self.unchanged += 1
+                if not self.write_all:
+                    continue
+            changed.append((*row, digest))
+        return changed
+
+    def is_new(self, row):
+        return row[0] not in self.hashes
+
+    def deleted_keys(self):
+        """
+        key ที่อยู่ในปลายทางแต่ไม่พบในต้นทาง (เรียกหลังอ่านต้นทางครบแล้ว)
+        ต้นทางที่ไม่มีแถวเลยถือว่าผิดปกติ จึงไม่ลบอะไร (แทนการลบทั้งตาราง)
+        """
+        if not self.seen:
+            return []
+        return [key for key in self.hashes if key not in self.seen]
+
+    @property
+    def has_changes(self):
+        return bool(self.inserted or self.updated or self.deleted_keys())
+
+    def record(self, log):
+        """บันทึกจำนวนแต่ละประเภทลง SyncLog (ยังไม่ save)"""
+        log.records_inserted = self.inserted
+        log.records_updated = self.updated
+        log.records_unchanged = self.unchanged
+        log.records_deleted = len(self.deleted_keys())
+
+
+def delete_keys(cursor, table_name, key_column, keys, batch_size=1000):
+    """ลบแถวตาม key ทีละ batch (DELETE ... WHERE key IN (...)) ภายใน transaction ปัจจุบัน"""
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        cursor.execute(
+            f"DELETE FROM {table_name} WHERE {key_column} IN ({', '.join(['%s'] * len(batch))})",
+            batch,
+        )
@@ -0,0 +1,183 @@
+"""
+อ่านข้อมูลต้นทางของการ sync แบบ streaming และเขียนแบบ pipeline
+
+sync_students / sync_staff เคยเรียก fetchall() กับผลลัพธ์ทั้งหมดก่อนเขียน
+หน่วยความจำสูงสุดจึงโตตามจำนวนนักศึกษา/บุคลากรทั้งหมด stream_chunks อ่านด้วย
+fetchmany ทีละ chunk — ในหน่วยความจำมีแค่ไม่กี่ chunk
+
+run_pipeline แยกการอ่าน (+ แปลงข้อมูล) กับการเขียนเป็นสอง thread ต่อกันด้วย
+queue ที่จำกัดขนาด: thread ผู้ผลิตดึง chunk จากต้นทาง ขณะที่ thread ที่เรียก
+เขียน chunk ก่อนหน้าลงปลายทางด้วย executemany เวลารวมจึงใกล้ max(อ่าน, เขียน)
+แทน อ่าน + เขียน ถ้าฝั่งเขียนช้ากว่า queue ที่เต็มจะหยุดผู้ผลิตไว้ (back-pressure)
+exception จากฝั่งใดฝั่งหนึ่งจะหยุดอีกฝั่งและถูก raise ต่อให้ผู้เรียก
+
+merge_chunks อ่านหลาย source (เช่น partition ของต้นทาง แต่ละตัวบน session ของตัวเอง)
+พร้อมกันหลาย thread แล้วรวม chunk เป็นลำดับเดียวส่งต่อให้ run_pipeline
+
+ตั้งค่าผ่าน environment variables:
+    SYNC_FETCH_SIZE       จำนวนแถวต่อ chunk (= arraysize / prefetchrows ของ Oracle
+                          และจำนวนแถวต่อ executemany ฝั่งเขียน) (default 1000)
+    SYNC_PIPELINE_DEPTH   จำนวน chunk สูงสุดที่รอเขียนใน queue (default 4)
+"""
+import os
+import queue
+import threading
+import time
+
+SYNC_FETCH_SIZE = int(os.getenv('SYNC_FETCH_SIZE', '1000'))
+SYNC_PIPELINE_DEPTH = int(os.getenv('SYNC_PIPELINE_DEPTH', '4'))
+
+_DONE = object()
+
+
+def tune_oracle_cursor(cursor, size=SYNC_FETCH_SIZE):
+    """
+    ตั้ง arraysize / prefetchrows ของ cursor oracledb (ต้องเรียกก่อน execute)
+    ให้ round-trip หนึ่งครั้งได้แถวเท่ากับหนึ่ง chunk พอดี (ค่า default คือ 100 / 2)
+    """
+    cursor.arraysize = size
+    cursor.prefetchrows = size + 1
+
+
+def stream_chunks(cursor, size=SYNC_FETCH_SIZE):
+    """
+    ไล่ผลลัพธ์ของ cursor ที่ execute แล้วทีละ chunk (list ของแถว ไม่เกิน size แถว)
+    cursor ของ MySQL ต้องเป็นแบบ unbuffered (ค่า default ของ mysql.connector)
+    """
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+
+def _put(pending, item, stop):
+    """ใส่ item ลง queue (รอถ้าเต็ม) คืน False ถ้าผู้อ่านสั่งหยุดก่อน"""
+    while not stop.is_set():
+        try:
+            pending.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _produce(chunks, pending, stop):
+    """thread ผู้ผลิต: ใส่ chunk ลง queue จนหมด แล้วตามด้วย _DONE (หรือ exception ที่เกิดขึ้น)"""
+    chunks = iter(chunks)
+    try:
+        for rows in chunks:
+            if not _put(pending, rows, stop):
+                return
+        item = _DONE
+    except BaseException as e:
+        item = e
+    finally:
+        # หยุดกลางคัน (ฝั่งเขียนล้มเหลว): ปิด generator ต้นทางให้คืน thread / session ของตัวเอง
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+    _put(pending, item, stop)
+
+
+def run_pipeline(chunks, write, label='', progress=None, depth=SYNC_PIPELINE_DEPTH):
+    """
+    อ่าน chunks (iterable ของ list แถว เช่น stream_chunks ที่แปลงข้อมูลแล้ว) ใน thread ผู้ผลิต
+    และเรียก write(rows) ทีละ chunk ใน thread ที่เรียก (connection ปลายทางอยู่ thread เดียว)
+    คืนจำนวนแถวที่เขียนทั้งหมด
+    progress(message) ถ้ากำหนด จะถูกเรียกหลังเขียนแต่ละ chunk พร้อมเวลาที่รอต้นทาง
+    เวลาที่ใช้เขียน และความเร็วเฉลี่ย (แถว/วินาที)
+    """
+    pending = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    producer = threading.Thread(target=_produce, args=(chunks, pending, stop), name=f'sync-reader {label}'.strip())
+    producer.daemon = True
+    started = time.monotonic()
+    producer.start()
+
+    total = 0
+    number = 0
+    try:
+        while True:
+            wait_started = time.monotonic()
+            rows = pending.get()
+            if rows is _DONE:
+                return total
+            if isinstance(rows, BaseException):
+                raise rows
+            waited = time.monotonic() - wait_started
+
+            write_started = time.monotonic()
+            write(rows)
+            number += 1
+            total += len(rows)
+            if progress is not None:
+                now = time.monotonic()
+                progress(
+                    f'{label}chunk {number}: {len(rows)} rows, waited {waited:.2f}s for source, '
+                    f'wrote in {now - write_started:.2f}s, total {total} '
+                    f'({total / max(now - started, 1e-6):,.0f} rows/s)'
+                )
+    finally:
+        stop.set()
+        producer.join()
+
+
+def _drain_sources(sources, pending, stop):
+    """thread ของ merge_chunks: หยิบ source จาก sources ทีละตัวจนหมด แล้วใส่ _DONE"""
+    try:
+        while not stop.is_set():
+            try:
+                source = sources.get_nowait()
+            except queue.Empty:
+                break
+            chunks = source()
+            try:
+                for rows in chunks:
+                    if not _put(pending, rows, stop):
+                        return
+            finally:
+                # ปิด generator ทันที (คืน session ของต้นทาง) แม้จะหยุดกลางคัน
+                close = getattr(chunks, 'close', None)
+                if close is not None:
+                    close()
+        item = _DONE
+    except BaseException as e:
+        item = e
+    _put(pending, item, stop)
+
+
+def merge_chunks(sources, workers, depth=SYNC_PIPELINE_DEPTH):
+    """
+    อ่าน sources (list ของ callable ที่ไม่รับ argument และคืน iterable ของ chunk — ถูกเรียก
+    ใน thread ที่อ่าน จึงเปิด connection ของตัวเองได้) พร้อมกันไม่เกิน workers ตัว
+    แล้วไล่ chunk จากทุก source รวมกัน (ลำดับระหว่าง source ไม่แน่นอน)
+    source ที่อยู่ต้น list เริ่มก่อน — ให้ใส่ตัวที่ใหญ่ที่สุดไว้ก่อนเพื่อไม่ให้จบช้าตัวเดียว
+    exception ของ source ใดจะหยุด source ที่เหลือและถูก raise ต่อให้ผู้ไล่
+    """
+    tasks = queue.SimpleQueue()
+    for source in sources:
+        tasks.put(source)
+    pending = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=_drain_sources, args=(tasks, pending, stop), name=f'sync-source-{n}', daemon=True)
+        for n in range(max(1, min(workers, len(sources))))
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        finished = 0
+        while finished < len(threads):
+            item = pending.get()
+            if item is _DONE:
+                finished += 1
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
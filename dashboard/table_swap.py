@@ -0,0 +1,146 @@
+"""
+โหลดตารางใหม่ทั้งตารางผ่าน shadow table แล้วสลับเข้าแทนด้วย RENAME TABLE ครั้งเดียว
+
+แทนการ DELETE ทั้งตาราง + INSERT ใหม่ใน transaction ยาว (undo log บวม, lock นาน
+และผู้อ่านต้องอ่านตารางที่กำลังถูกเขียนใหม่) ขั้นตอนคือ
+    1. create_shadow   สร้าง {table}_new ว่าง โครงสร้างเดียวกับตารางจริง แต่ยังไม่มี secondary index
+    2. (ผู้เรียก)      bulk insert ลง shadow — commit ทีละ batch ได้เพราะยังไม่มีใครอ่าน
+    3. build_indexes   สร้าง index หลังโหลดเสร็จ (เรียงข้อมูลครั้งเดียว เร็วกว่าอัปเดต index ทีละแถว)
+    4. swap_tables     RENAME TABLE ครั้งเดียว: ตารางจริง -> {table}_old, shadow -> ตารางจริง
+                       (หลายตารางใน statement เดียวสลับพร้อมกันแบบ atomic เช่นตารางหลัก + rollup)
+
+{table}_old ถูกเก็บไว้หนึ่งรอบ sync สำหรับ rollback_tables และถูกลบตอน swap รอบถัดไป
+(หรือเมื่อ differential sync แก้ตารางจริงในที่ — ดู drop_old_tables)
+ผู้อ่านเห็นข้อมูลชุดเดิมครบ หรือชุดใหม่ครบ — ไม่เคยเห็นตารางที่โหลดไม่เสร็จ
+"""
+
+SHADOW_SUFFIX = '_new'
+OLD_SUFFIX = '_old'
+
+
+def shadow_name(table_name):
+    return f'{table_name}{SHADOW_SUFFIX}'
+
+
+def old_name(table_name):
+    return f'{table_name}{OLD_SUFFIX}'
+
+
+def table_exists(cursor, table_name):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.TABLES "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        (table_name,),
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def secondary_indexes(cursor, table_name):
+    """
+    คืน [(index_name, unique, fulltext, (column_sql, ...)), ...] ของทุก index ยกเว้น PRIMARY
+    column_sql รวม prefix length ถ้ามี เช่น 'faculty_name(100)'
+    """
+    cursor.execute(
+        "SELECT INDEX_NAME, NON_UNIQUE, INDEX_TYPE, COLUMN_NAME, SUB_PART "
+        "FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME <> 'PRIMARY' "
+        "ORDER BY INDEX_NAME, SEQ_IN_INDEX",
+        (table_name,),
+    )
+    indexes = {}
+    for index_name, non_unique, index_type, column, sub_part in cursor.fetchall():
+        _, _, _, columns = indexes.setdefault(
+            index_name, (index_name, not non_unique, index_type == 'FULLTEXT', [])
+        )
+        columns.append(f'{column}({sub_part})' if sub_part else column)
+    return [(name, unique, fulltext, tuple(columns)) for name, unique, fulltext, columns in indexes.values()]
+
+
+def create_shadow(cursor, table_name):
+    """
+    สร้าง shadow table ว่าง (ลบของเก่าที่ค้างจากรอบที่ล้มเหลวก่อน) ด้วย CREATE TABLE ... LIKE
+    แล้วลบ secondary index ออกเพื่อให้ bulk insert เร็ว
+    คืน (ชื่อ shadow, index ที่ต้องสร้างด้วย build_indexes หลังโหลดเสร็จ)
+    DDL — ต้องเรียกนอก transaction
+    """
+    shadow = shadow_name(table_name)
+    indexes = secondary_indexes(cursor, table_name)
+    cursor.execute(f"DROP TABLE IF EXISTS {shadow}")
+    cursor.execute(f"CREATE TABLE {shadow} LIKE {table_name}")
+    if indexes:
+        cursor.execute(
+            f"ALTER TABLE {shadow} " + ', '.join(f"DROP INDEX {name}" for name, _, _, _ in indexes)
+        )
+    return shadow, indexes
+
+
+def disable_fulltext_stopwords(cursor):
+    """
+    ปิด stopword ของ InnoDB FULLTEXT ใน session นี้ — ต้องเรียกก่อนสร้าง FULLTEXT index
+    (ค่า ณ ตอนสร้างถูกเก็บไว้กับ index) ngram parser ทิ้งทุก token ที่มี stopword อยู่ข้างใน
+    เช่น 'a', 'i', 'in' ชื่อภาษาอังกฤษส่วนใหญ่จึงค้นไม่เจอ คืน True ถ้าปิดได้
+    """
+    cursor.execute("SET SESSION innodb_ft_enable_stopword = OFF")
+    cursor.execute("SELECT @@SESSION.innodb_ft_enable_stopword")
+    row = cursor.fetchone()
+    return not (next(iter(row.values())) if isinstance(row, dict) else row[0])
+
+
+def build_indexes(cursor, table_name, indexes):
+    """
+    สร้าง index (จาก create_shadow) บนตารางที่โหลดข้อมูลเสร็จแล้ว
+    B-tree ทั้งหมดใน ALTER เดียว (อ่านตารางรอบเดียว) ส่วน FULLTEXT ทีละตัว
+    (InnoDB สร้าง FULLTEXT ได้ครั้งละหนึ่ง index) ด้วย ngram parser และไม่มี stopword
+    แบบเดียวกับ ensure_api_indexes
+    """
+    btree = [
+        f"ADD {'UNIQUE ' if unique else ''}INDEX {name} ({', '.join(columns)})"
+        for name, unique, fulltext, columns in indexes if not fulltext
+    ]
+    if btree:
+        cursor.execute(f"ALTER TABLE {table_name} " + ', '.join(btree))
+    if any(fulltext for _, _, fulltext, _ in indexes):
+        disable_fulltext_stopwords(cursor)
+    for name, _, fulltext, columns in indexes:
+        if fulltext:
+            cursor.execute(
+                f"ALTER TABLE {table_name} ADD FULLTEXT INDEX {name} ({', '.join(columns)}) WITH PARSER ngram"
+            )
+
+
+def swap_tables(cursor, table_names):
+    """
+    สลับ shadow ของทุกตารางใน table_names เข้าแทนตารางจริงด้วย RENAME TABLE ครั้งเดียว
+    ตารางจริงเดิมกลายเป็น {table}_old (ของรอบก่อนหน้าถูกลบ)
+    """
+    drop_old_tables(cursor, table_names)
+    renames = []
+    for name in table_names:
+        renames.append(f"{name} TO {old_name(name)}")
+        renames.append(f"{shadow_name(name)} TO {name}")
+    cursor.execute("RENAME TABLE " + ', '.join(renames))
+
+
+def drop_old_tables(cursor, table_names):
+    """
+    ลบ {table}_old ของทุกตาราง — เช่นเมื่อตารางจริงถูกแก้ไขในที่ (differential sync)
+    จน {table}_old ไม่ใช่ข้อมูลของรอบก่อนหน้าแล้ว (rollback จะย้อนเกินหนึ่งรอบ)
+    """
+    cursor.execute(f"DROP TABLE IF EXISTS {', '.join(old_name(name) for name in table_names)}")
+
+
+def rollback_tables(cursor, table_names):
+    """
+    สลับ {table}_old กลับเป็นตารางจริงด้วย RENAME TABLE ครั้งเดียว (ตารางปัจจุบันกลายเป็น {table}_old
+    จึงสลับกลับได้อีกครั้ง) — raise ValueError ถ้าไม่มีตาราง _old ของตารางใดตารางหนึ่ง
+    """
+    missing = [name for name in table_names if not table_exists(cursor, old_name(name))]
+    if missing:
+        raise ValueError(f"No previous copy to roll back to: {', '.join(old_name(name) for name in missing)}")
+    cursor.execute(f"DROP TABLE IF EXISTS {', '.join(shadow_name(name) for name in table_names)}")
+    renames = []
+    for name in table_names:
+        renames.append(f"{name} TO {shadow_name(name)}")
+        renames.append(f"{old_name(name)} TO {name}")
+        renames.append(f"{shadow_name(name)} TO {old_name(name)}")
+    cursor.execute("RENAME TABLE " + ', '.join(renames))
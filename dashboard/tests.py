@@ -1,3 +1,1161 @@
-from django.test import TestCase
-
-# Create your tests here.
+import base64
+import contextlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+from mysql.connector import errors
+
+from . import database_utils, line_ids, local_replica, table_swap
+from .aggregate_cube import CountCube
+from .compact_rows import add_column, fetch_compact, row_class
+from .db_pool import CircuitBreaker, CircuitOpen, ConnectionPool, PoolTimeout
+from .management.commands.sync_students import partition_bounds, partition_sources
+from .result_cache import ResultCache, StaleList, cached_result, is_stale
+from .rollups import ROLLUPS
+from .search_index import SCORE_EXACT, SCORE_PREFIX, SCORE_SUBSTRING, PrefixIndex, SearchIndex, normalize
+from .sync_diff import RowDiff, row_hash
+from .sync_stream import merge_chunks, run_pipeline
+
+
+def _patch(test, target, **kwargs):
+    patcher = mock.patch(target, **kwargs)
+    test.addCleanup(patcher.stop)
+    return patcher.start()
+
+
+def _fresh_result_cache(test):
+    """ให้ test ได้ generation ใหม่และไม่มีผลลัพธ์ล่าสุดจาก test อื่น (ไม่ใช้ค่าที่ cache ไว้)"""
+    _patch(test, 'dashboard.result_cache._last_good', new=ResultCache(16))
+    return _patch(test, 'dashboard.result_cache.get_generation', return_value=object())
+
+
+class Clock:
+    """time.monotonic() ที่เลื่อนเวลาได้เอง"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        _patch(self, 'dashboard.db_pool.time.monotonic', new=self.clock)
+        self.connect = _patch(
+            self, 'dashboard.db_pool.mysql.connector.connect',
+            side_effect=lambda **kwargs: mock.Mock(in_transaction=False),
+        )
+        self.pool = ConnectionPool({}, size=1, timeout=0, ping_after=30.0, query_timeout=None)
+
+    def test_timeout_is_counted(self):
+        connection = self.pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            self.pool.acquire()
+
+        stats = self.pool.stats()
+        self.assertEqual((stats['waits'], stats['timeouts']), (1, 1))
+        self.assertEqual((stats['open'], stats['in_use']), (1, 1))
+
+        connection.close()
+        self.pool.acquire().close()
+        stats = self.pool.stats()
+        self.assertEqual((stats['checkouts'], stats['connects'], stats['timeouts']), (2, 1, 1))
+        self.assertEqual((stats['open'], stats['idle'], stats['in_use']), (1, 1, 0))
+        self.assertEqual(self.connect.call_count, 1)
+
+    def test_waiter_gets_released_connection(self):
+        # รอจริงผ่าน threading.Condition จึงใช้นาฬิกาจริง
+        _patch(self, 'dashboard.db_pool.time.monotonic', new=time.monotonic)
+        connection = self.pool.acquire()
+        threading.Timer(0.01, connection.close).start()
+        self.pool.acquire(timeout=5).close()
+
+        stats = self.pool.stats()
+        self.assertEqual((stats['waits'], stats['timeouts'], stats['connects']), (1, 0, 1))
+
+    def test_release_rolls_back_open_transaction_without_ping(self):
+        connection = self.pool.acquire()
+        raw = connection._raw
+        raw.in_transaction = True
+        connection.close()
+
+        raw.rollback.assert_called_once_with()
+        raw.ping.assert_not_called()
+        self.assertEqual(self.pool.stats()['idle'], 1)
+        with self.assertRaises(errors.OperationalError):
+            connection.cursor()
+
+    def test_dropped_connection_is_discarded_on_release(self):
+        connection = self.pool.acquire()
+        raw = connection._raw
+        raw.in_transaction = True
+        raw.rollback.side_effect = OSError('connection lost')
+        connection.close()
+
+        raw.close.assert_called_once_with()
+        stats = self.pool.stats()
+        self.assertEqual((stats['open'], stats['idle'], stats['recycled']), (0, 0, 1))
+
+    def test_idle_connection_is_pinged_before_reuse(self):
+        connection = self.pool.acquire()
+        raw = connection._raw
+        connection.close()
+
+        self.pool.acquire().close()
+        raw.ping.assert_not_called()
+
+        self.clock.now += 31
+        raw.ping.side_effect = OSError('gone')
+        replacement = self.pool.acquire()
+        self.assertIsNot(replacement._raw, raw)
+        replacement.close()
+        stats = self.pool.stats()
+        self.assertEqual((stats['health_check_failures'], stats['connects']), (1, 2))
+
+
+class StaffSummaryTests(SimpleTestCase):
+    CELLS = [
+        (('สำนักคอมพิวเตอร์', 'ข้าราชการ', 'ชาย', 'นักวิชาการคอมพิวเตอร์'), 3),
+        (('สำนักคอมพิวเตอร์', 'พนักงานมหาวิทยาลัย', 'หญิง', 'นักวิชาการคอมพิวเตอร์'), 2),
+        (('สำนักคอมพิวเตอร์', 'พนักงานมหาวิทยาลัย', 'หญิง', 'เจ้าหน้าที่บริหารงานทั่วไป'), 4),
+        (('คณะวิทยาศาสตร์', 'ข้าราชการ', 'ชาย', 'อาจารย์'), 5),
+        ((None, 'ลูกจ้าง', None, None), 1),
+    ]
+    STAFF_LIST = [{'STAFFID': '001', 'STAFFNAME': 'สมชาย'}]
+
+    def setUp(self):
+        _fresh_result_cache(self)
+        cube = CountCube(('DEPARTMENTNAME', 'STFTYPENAME', 'GENDERNAMETH', 'POSNAMETH'))
+        for values, count in self.CELLS:
+            cube.add(values, count)
+        self.cube = _patch(self, 'dashboard.database_utils._staff_cube', return_value=cube)
+        self.fetch_staff = _patch(
+            self, 'dashboard.database_utils._fetch_department_staff', return_value=self.STAFF_LIST
+        )
+
+    def test_staff_summary_counts_every_dimension(self):
+        summary = database_utils.get_staff_summary()
+
+        self.assertEqual(summary['total_staff'], 15)
+        self.assertEqual(summary['gender_distribution'], [
+            {'GENDERNAMETH': 'ชาย', 'count': 8},
+            {'GENDERNAMETH': 'หญิง', 'count': 6},
+            {'GENDERNAMETH': None, 'count': 1},
+        ])
+        self.assertEqual(summary['department_distribution'], [
+            {'DEPARTMENTNAME': 'สำนักคอมพิวเตอร์', 'count': 9},
+            {'DEPARTMENTNAME': 'คณะวิทยาศาสตร์', 'count': 5},
+            {'DEPARTMENTNAME': None, 'count': 1},
+        ])
+        self.assertEqual(summary['staff_type_distribution'][0], {'STFTYPENAME': 'ข้าราชการ', 'count': 8})
+
+    def test_staff_summary_failure_returns_none(self):
+        self.cube.return_value = None
+        self.assertIsNone(database_utils.get_staff_summary())
+
+    def test_department_detail_is_sliced_to_department(self):
+        detail = database_utils.get_department_detail('สำนักคอมพิวเตอร์')
+
+        self.assertEqual(detail['total_staff'], 9)
+        self.assertEqual(detail['position_distribution'], [
+            {'POSNAMETH': 'นักวิชาการคอมพิวเตอร์', 'count': 5},
+            {'POSNAMETH': 'เจ้าหน้าที่บริหารงานทั่วไป', 'count': 4},
+        ])
+        self.assertEqual(detail['employment_type_distribution'], [
+            {'STFTYPENAME': 'พนักงานมหาวิทยาลัย', 'count': 6},
+            {'STFTYPENAME': 'ข้าราชการ', 'count': 3},
+        ])
+        self.assertEqual(detail['staff_list'], self.STAFF_LIST)
+        self.fetch_staff.assert_called_once_with('สำนักคอมพิวเตอร์')
+
+    def test_department_detail_without_staff_list(self):
+        detail = database_utils.get_department_detail('คณะวิทยาศาสตร์', include_staff_list=False)
+
+        self.assertEqual(detail['total_staff'], 5)
+        self.assertNotIn('staff_list', detail)
+        self.fetch_staff.assert_not_called()
+
+    def test_department_detail_staff_list_failure_returns_none(self):
+        self.fetch_staff.return_value = None
+        self.assertIsNone(database_utils.get_department_detail('สำนักคอมพิวเตอร์'))
+
+
+class CountCubeTests(SimpleTestCase):
+    DIMENSIONS = ('faculty_name', 'level_name', 'gender')
+    CELLS = [
+        (('คณะ A', 'ปริญญาตรี', 'ชาย'), 10),
+        (('คณะ A', 'ปริญญาตรี', 'หญิง'), 15),
+        (('คณะ A', 'ปริญญาโท', 'หญิง'), 3),
+        (('คณะ B', 'ปริญญาตรี', 'ชาย'), 7),
+        (('คณะ B', None, 'ไม่ระบุ'), 2),
+        ((None, 'ปริญญาเอก', 'ชาย'), 1),
+    ]
+
+    def setUp(self):
+        self.cube = CountCube(self.DIMENSIONS)
+        self.db = sqlite3.connect(':memory:')
+        self.addCleanup(self.db.close)
+        self.db.execute(f"CREATE TABLE cells ({', '.join(self.DIMENSIONS)}, count)")
+        for values, count in self.CELLS:
+            self.cube.add(values, count)
+            self.db.execute('INSERT INTO cells VALUES (?, ?, ?, ?)', (*values, count))
+
+    def group_by(self, dimensions, where=''):
+        columns = ', '.join(dimensions)
+        rows = self.db.execute(f'SELECT {columns}, SUM(count) FROM cells {where} GROUP BY {columns}')
+        return {tuple(row[:-1]): row[-1] for row in rows}
+
+    def test_count_by_matches_group_by(self):
+        for dimensions in (['faculty_name'], ['gender', 'level_name'], list(self.DIMENSIONS)):
+            with self.subTest(dimensions=dimensions):
+                self.assertEqual(self.cube.slice().count_by(dimensions), self.group_by(dimensions))
+
+    def test_sliced_count_by_matches_filtered_group_by(self):
+        students = self.cube.slice(faculty_name='คณะ A', level_name='ปริญญาตรี')
+        self.assertEqual(
+            students.count_by(['gender']),
+            self.group_by(['gender'], "WHERE faculty_name = 'คณะ A' AND level_name = 'ปริญญาตรี'"),
+        )
+        self.assertEqual(students.total(), 25)
+        self.assertEqual(self.cube.slice(faculty_name='ไม่มีคณะนี้').count_by(['gender']), {})
+
+
+class ResultCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.get_generation = _fresh_result_cache(self)
+        self.cache = ResultCache(2)
+        self.results = {}
+        self.calls = []
+
+        @cached_result('staff_info', cache=self.cache)
+        def load(name):
+            self.calls.append(name)
+            return self.results.get(name)
+
+        self.load = load
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.assertEqual(self.cache.get('a'), (True, 1))
+        self.cache.set('c', 3)
+
+        self.assertEqual(self.cache.get('b'), (False, None))
+        self.assertEqual(self.cache.get('a'), (True, 1))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['size']), (2, 1, 1, 2))
+
+    def test_new_generation_reloads(self):
+        self.results['x'] = ['first']
+        self.assertEqual(self.load('x'), ['first'])
+        self.assertEqual(self.load('x'), ['first'])
+        self.assertEqual(self.calls, ['x'])
+
+        self.get_generation.return_value = object()
+        self.results['x'] = ['second']
+        self.assertEqual(self.load('x'), ['second'])
+        self.assertEqual(self.calls, ['x', 'x'])
+
+    def test_failure_is_not_cached(self):
+        self.assertIsNone(self.load('x'))
+        self.assertIsNone(self.load('x'))
+        self.assertEqual(self.calls, ['x', 'x'])
+
+    def test_unhashable_arguments_bypass_cache(self):
+        @cached_result('staff_info', cache=self.cache)
+        def count(names):
+            self.calls.append(names)
+            return len(names)
+
+        self.assertEqual(count(['x', 'y']), 2)
+        self.assertEqual(count(['x', 'y']), 2)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+
+class FakeMySQLCursor:
+    """cursor ของ mysql.connector แบบ unbuffered ที่คืนแถวตามตารางใน FROM"""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.queries = []
+        self._rows = []
+
+    def execute(self, query, params=()):
+        self.queries.append(query)
+        table_name = max((name for name in self.tables if f'FROM {name}' in query), key=len)
+        self._rows = list(self.tables[table_name])
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+
+class LocalReplicaTests(SimpleTestCase):
+    STAFF = [
+        ('001', 'นาย', 'สมชาย', 'ใจดี', 'ชาย', 'อาจารย์', 'ข้าราชการ', 'คณะวิทยาศาสตร์'),
+        ('002', 'นางสาว', 'สมหญิง', 'ใจงาม', 'หญิง', 'อาจารย์', 'ข้าราชการ', 'คณะวิทยาศาสตร์'),
+        ('003', 'นาย', 'สมศักดิ์', 'รักงาน', 'ชาย', 'นักวิชาการ', 'ลูกจ้าง', 'สำนักคอมพิวเตอร์'),
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        _patch(self, 'dashboard.local_replica.REPLICA_PATH', new=os.path.join(directory.name, 'replica.sqlite3'))
+        self.get_generation = _patch(self, 'dashboard.local_replica.get_generation', return_value=7)
+        self._reset_connection()
+        self.addCleanup(self._reset_connection)
+
+        rollup = ROLLUPS['staff_info']
+        self.cursor = FakeMySQLCursor({
+            'staff_info': self.STAFF,
+            rollup['table']: [
+                ('คณะวิทยาศาสตร์', 'ข้าราชการ', 'ชาย', 'อาจารย์', 1),
+                ('คณะวิทยาศาสตร์', 'ข้าราชการ', 'หญิง', 'อาจารย์', 1),
+                ('สำนักคอมพิวเตอร์', 'ลูกจ้าง', 'ชาย', 'นักวิชาการ', 1),
+            ],
+        })
+
+    @staticmethod
+    def _reset_connection():
+        connection = getattr(local_replica._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+        local_replica._local.connection = None
+
+    def test_query_before_refresh_returns_none(self):
+        self.assertIsNone(local_replica.query('staff_info', 'SELECT COUNT(*) FROM staff_info'))
+
+    def test_refresh_then_query(self):
+        self.assertTrue(local_replica.refresh_replica(self.cursor, 'staff_info', 7))
+
+        rows = local_replica.query(
+            'staff_info', database_utils.DEPARTMENT_STAFF_QUERY, ('คณะวิทยาศาสตร์',), dictionary=True,
+        )
+        self.assertEqual([row['STAFFID'] for row in rows], ['001', '002'])
+        self.assertEqual(rows[0]['POSNAMETH'], 'อาจารย์')
+        self.assertEqual(
+            local_replica.query('staff_info', ROLLUPS['staff_info']['read'])[-1],
+            ('สำนักคอมพิวเตอร์', 'ลูกจ้าง', 'ชาย', 'นักวิชาการ', 1),
+        )
+        compact = local_replica.query(
+            'staff_info', 'SELECT STAFFID, STAFFNAME FROM staff_info WHERE STAFFID = %s', ('003',), compact=True,
+        )
+        self.assertEqual(compact[0].STAFFNAME, 'สมศักดิ์')
+
+    def test_replica_of_other_generation_is_not_used(self):
+        local_replica.refresh_replica(self.cursor, 'staff_info', 7)
+        self.get_generation.return_value = 8
+        self.assertIsNone(local_replica.query('staff_info', 'SELECT COUNT(*) FROM staff_info'))
+        # replica ของตารางอื่นยังไม่เคยสร้าง
+        self.assertIsNone(local_replica.query('students_info', 'SELECT COUNT(*) FROM students_info'))
+
+        self.assertTrue(local_replica.refresh_replica(self.cursor, 'staff_info', 8))
+        self.assertEqual(local_replica.query('staff_info', 'SELECT COUNT(*) FROM staff_info'), [(3,)])
+
+    def test_failed_refresh_keeps_previous_replica(self):
+        local_replica.refresh_replica(self.cursor, 'staff_info', 7)
+        self.cursor.tables['staff_info'] = [('004',)]  # จำนวนคอลัมน์ไม่ตรง
+
+        with mock.patch('builtins.print'):
+            self.assertFalse(local_replica.refresh_replica(self.cursor, 'staff_info', 8))
+        self.assertEqual(local_replica.query('staff_info', 'SELECT COUNT(*) FROM staff_info'), [(3,)])
+
+
+class SearchIndexTests(SimpleTestCase):
+    ROWS = [
+        ('S1', ('สมชาย', 'ใจดี', 'S1'), ('สมชาย', 'ใจดี', 'S1', 'คณะวิทยาศาสตร์')),
+        ('S2', ('สมชายชาญ', 'มีสุข', 'S2'), ('สมชายชาญ', 'มีสุข', 'S2', 'คณะวิทยาศาสตร์')),
+        ('S3', ('ชาย', 'ดีมาก', 'S3'), ('ชาย', 'ดีมาก', 'S3', 'สำนักคอมพิวเตอร์')),
+        ('S4', ('นายสมชาย', 'ใจดี', 'S4'), ('นายสมชาย', 'ใจดี', 'S4', 'คณะเกษตร')),
+        ('S5', ('Somchai', 'Jaidee', 'S5'), ('Somchai', 'Jaidee', 'S5', 'Faculty of Science')),
+        ('S6', ('สมหญิง', 'ใจดี', 'S6'), ('สมหญิง', 'ใจดี', 'S6', 'คณะวิทยาศาสตร์')),
+    ]
+
+    def setUp(self):
+        self.index = SearchIndex(self.ROWS)
+
+    def scan(self, query):
+        """ผลที่ถูกต้องจากการตรวจทุกแถว: เรียงตามคะแนนแล้วตาม sort_key"""
+        terms = normalize(query).split()
+        found = []
+        for key, sort_key, fields in self.ROWS:
+            score = SearchIndex._score(tuple(normalize(field) for field in fields), terms)
+            if score:
+                found.append((-score, sort_key, key))
+        return [(-negative, key) for negative, _, key in sorted(found)]
+
+    def test_single_term_ranks_exact_then_prefix_then_substring(self):
+        self.assertEqual(self.index.search('สมชาย'), [
+            (SCORE_EXACT, 'S1'), (SCORE_PREFIX, 'S2'), (SCORE_SUBSTRING, 'S4'),
+        ])
+        self.assertEqual(self.index.search('ชาย'), [
+            (SCORE_EXACT, 'S3'), (SCORE_SUBSTRING, 'S4'), (SCORE_SUBSTRING, 'S1'), (SCORE_SUBSTRING, 'S2'),
+        ])
+
+    def test_matches_full_scan(self):
+        for query in ('สม', 'ใจดี', 'ดี', 'สมชาย ใจดี', 'ชาย ดี', 'วิทยา', 'somchai', '  SOMCHAI   jaidee ', 's', 'ไม่มี'):
+            with self.subTest(query=query):
+                self.assertEqual(self.index.search(query), self.scan(query))
+
+    def test_limit(self):
+        self.assertEqual(self.index.search('ใจดี', limit=2), self.scan('ใจดี')[:2])
+        self.assertEqual(self.index.search('ชาย ดี', limit=1), self.scan('ชาย ดี')[:1])
+
+    def test_empty_query_and_unknown_gram(self):
+        self.assertEqual(self.index.search('   '), [])
+        self.assertEqual(self.index.search('สมชxย'), [])
+        self.assertEqual(len(SearchIndex([])), 0)
+        self.assertEqual(SearchIndex([]).search('สม'), [])
+
+
+class PrefixIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = PrefixIndex([
+            ({'id': 'S1'}, ('สมชาย', 'ใจดี', 'สมชาย ใจดี', 'S1')),
+            ({'id': 'S2'}, ('สมศรี', 'สมใจ', 'สมศรี สมใจ', 'S2')),
+            ({'id': 'S3'}, ('Somchai', 'Jaidee', 'Somchai Jaidee', 'S3')),
+            ({'id': 'S4'}, ('', None, 'สม', 'S4')),
+        ])
+
+    def test_suggest_returns_each_row_once_shortest_token_first(self):
+        self.assertEqual(
+            [item['id'] for item in self.index.suggest('สม')],
+            ['S4', 'S1', 'S2'],
+        )
+        self.assertEqual([item['id'] for item in self.index.suggest('ใจ')], ['S1'])
+        self.assertEqual([item['id'] for item in self.index.suggest('สมชาย ใ')], ['S1'])
+
+    def test_suggest_is_normalized_and_limited(self):
+        self.assertEqual(self.index.suggest('  SOMCHAI  j'), [{'id': 'S3'}])
+        self.assertEqual([item['id'] for item in self.index.suggest('s')], ['S1', 'S2', 'S3', 'S4'])
+        self.assertEqual(len(self.index.suggest('สม', limit=2)), 2)
+
+    def test_no_match(self):
+        self.assertEqual(self.index.suggest(''), [])
+        self.assertEqual(self.index.suggest('ไม่มี'), [])
+        self.assertEqual(self.index.suggest('ๆ'), [])
+
+
+class KeysetPaginationTests(SimpleTestCase):
+    def test_search_index_pages_match_one_search(self):
+        index = SearchIndex(SearchIndexTests.ROWS)
+        sort_keys = {key: sort_key for key, sort_key, _ in SearchIndexTests.ROWS}
+        for query in ('ใจดี', 'ชาย', 'สม', 'ชาย ดี', 'ดี'):
+            with self.subTest(query=query):
+                pages, after = [], None
+                while True:
+                    page = index.search(query, limit=2, after=after)
+                    if not page:
+                        break
+                    pages.extend(page)
+                    score, key = page[-1]
+                    after = (score, sort_keys[key])
+                self.assertEqual(pages, index.search(query))
+
+    def test_cursor_round_trip(self):
+        row = {'score': 2, 'STAFFNAME': 'สมชาย', 'STAFFSURNAME': None, 'STAFFID': 'S1'}
+        cursor = database_utils.encode_search_cursor('staff_info', row)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(database_utils.decode_search_cursor(cursor), (2, 'สมชาย', '', 'S1'))
+
+    def test_invalid_cursor_starts_from_first_page(self):
+        def encode(text):
+            return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+        for cursor in (
+            None, '', 'ไม่ใช่ base64', encode('not json'), encode('{"score": 1}'),
+            encode('[1, "a", "b"]'), encode('[1, "a", "b", 3]'),
+            encode('["1", "a", "b", "c"]'), encode('[true, "a", "b", "c"]'),
+            encode('[NaN, "a", "b", "c"]'), encode('[Infinity, "a", "b", "c"]'),
+        ):
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(database_utils.decode_search_cursor(cursor))
+
+    def test_search_page_returns_cursor_only_when_more_rows(self):
+        rows = [
+            {'score': 3, 'STAFFNAME': 'สมชาย', 'STAFFSURNAME': 'ใจดี', 'STAFFID': 'S1', 'ldap': None},
+            {'score': 1, 'STAFFNAME': 'สมหญิง', 'STAFFSURNAME': 'ใจดี', 'STAFFID': 'S2', 'ldap': None},
+        ]
+        search = _patch(
+            self, 'dashboard.database_utils._search_staff',
+            side_effect=lambda query, limit, after: rows[:limit],
+        )
+        _patch(self, 'dashboard.database_utils.add_line_ids', side_effect=lambda rows, *args, **kwargs: rows)
+
+        results, next_cursor = database_utils.search_staff_page('  สม ', page_size=1)
+        self.assertEqual(results, rows[:1])
+        self.assertEqual(database_utils.decode_search_cursor(next_cursor), (3, 'สมชาย', 'ใจดี', 'S1'))
+        search.assert_called_with('สม', 2, None)
+
+        results, next_cursor = database_utils.search_staff_page('สม', cursor=next_cursor, page_size=2)
+        self.assertEqual((len(results), next_cursor), (2, None))
+        search.assert_called_with('สม', 3, (3, 'สมชาย', 'ใจดี', 'S1'))
+
+
+class LineIdsTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        _patch(self, 'dashboard.line_ids.time.monotonic', new=self.clock)
+        _patch(self, 'dashboard.line_ids._line_ids', new=None)
+        self.load = _patch(self, 'dashboard.line_ids._load', return_value={'1001': ('U1', 'U2'), 'S2': ('U3',)})
+
+    def test_add_line_ids_copies_rows(self):
+        rows = [
+            {'STAFFID': 'S1', 'CITIZENID': '1001'},
+            {'STAFFID': 'S2', 'CITIZENID': '1002'},
+        ]
+        enriched = line_ids.add_line_ids(rows, 'CITIZENID', drop_ldap=True)
+
+        self.assertEqual(enriched, [
+            {'STAFFID': 'S1', 'line_ids': ['U1', 'U2'], 'line_user_id': 'U1, U2'},
+            {'STAFFID': 'S2', 'line_ids': [], 'line_user_id': None},
+        ])
+        self.assertEqual(rows[0], {'STAFFID': 'S1', 'CITIZENID': '1001'})
+
+    def test_add_line_ids_keeps_ldap_column(self):
+        rows = [{'student_code': 'S2', 'student_name': 'สมชาย'}]
+        self.assertEqual(line_ids.add_line_ids(rows, 'student_code'), [
+            {'student_code': 'S2', 'student_name': 'สมชาย', 'line_ids': ['U3'], 'line_user_id': 'U3'},
+        ])
+
+    def test_map_is_reloaded_after_interval(self):
+        line_ids.get_line_id_map()
+        self.clock.now += line_ids.LINE_IDS_REFRESH_INTERVAL - 1
+        line_ids.get_line_id_map()
+        self.assertEqual(self.load.call_count, 1)
+
+        self.clock.now += 1
+        self.load.return_value = {'1001': ('U9',)}
+        self.assertEqual(line_ids.get_line_id_map(), {'1001': ('U9',)})
+        self.assertEqual(self.load.call_count, 2)
+
+    def test_failed_reload_keeps_previous_map(self):
+        self.load.return_value = None
+        self.assertEqual(line_ids.get_line_id_map(), {})
+
+        self.load.return_value = {'1001': ('U1',)}
+        self.assertEqual(line_ids.get_line_id_map(), {'1001': ('U1',)})
+
+        self.clock.now += line_ids.LINE_IDS_REFRESH_INTERVAL
+        self.load.return_value = None
+        self.assertEqual(line_ids.get_line_id_map(), {'1001': ('U1',)})
+
+
+class SearchCacheTests(SimpleTestCase):
+    def setUp(self):
+        _fresh_result_cache(self)
+        self.search = _patch(self, 'dashboard.database_utils._search', return_value=[])
+        _patch(self, 'dashboard.database_utils.add_line_ids', side_effect=lambda rows, *args, **kwargs: rows)
+
+    def test_normalize(self):
+        decomposed = 'Ca\u0301fe\u0301'  # อักขระผสม (NFD)
+        self.assertEqual(normalize(f'  {decomposed}\t SOMCHAI\n'), 'cáfé somchai')
+        self.assertEqual(normalize(None), '')
+
+    def test_empty_result_is_cached_under_normalized_query(self):
+        for query in ('ไม่มีชื่อนี้', '  ไม่มีชื่อนี้ ', 'ไม่มีชื่อนี้'):
+            self.assertEqual(database_utils.search_students_page(query), ([], None))
+        self.search.assert_called_once_with('students_info', 'ไม่มีชื่อนี้', database_utils.SEARCH_PAGE_SIZE + 1, None)
+
+        database_utils.search_students_page('SOMCHAI')
+        database_utils.search_students_page('somchai')
+        self.assertEqual(self.search.call_count, 2)
+
+    def test_failed_search_is_not_cached(self):
+        self.search.return_value = None
+        self.assertEqual(database_utils.search_staff_page('สม'), ([], None))
+        self.search.return_value = []
+        database_utils.search_staff_page('สม')
+        self.assertEqual(self.search.call_count, 2)
+
+
+class CompactRowTests(SimpleTestCase):
+    def setUp(self):
+        db = sqlite3.connect(':memory:')
+        self.addCleanup(db.close)
+        db.execute('CREATE TABLE staff (STAFFID, STAFFNAME, DEPARTMENTNAME)')
+        db.executemany('INSERT INTO staff VALUES (?, ?, ?)', [
+            ('S1', 'สมชาย', 'คณะวิทยาศาสตร์'),
+            ('S2', 'สมหญิง', None),
+        ])
+        self.rows = fetch_compact(db.execute('SELECT * FROM staff ORDER BY STAFFID'))
+
+    def test_reads_like_dict(self):
+        row = self.rows[0]
+        self.assertEqual((row['STAFFNAME'], row.STAFFNAME, row[0]), ('สมชาย', 'สมชาย', 'S1'))
+        self.assertEqual(row.get('DEPARTMENTNAME'), 'คณะวิทยาศาสตร์')
+        self.assertEqual(row.get('ไม่มี', '-'), '-')
+        self.assertIn('STAFFID', row)
+        self.assertNotIn('S1', row)
+        self.assertEqual(dict(self.rows[1]), {'STAFFID': 'S2', 'STAFFNAME': 'สมหญิง', 'DEPARTMENTNAME': None})
+        with self.assertRaises(KeyError):
+            row['ไม่มี']
+        with self.assertRaises(AttributeError):
+            row.ไม่มี
+
+    def test_rows_share_one_class_per_column_set(self):
+        self.assertIs(type(self.rows[0]), type(self.rows[1]))
+        self.assertIs(type(self.rows[0]), row_class(('STAFFID', 'STAFFNAME', 'DEPARTMENTNAME')))
+        self.assertFalse(hasattr(self.rows[0], '__dict__'))
+
+    def test_add_column(self):
+        rows = add_column(self.rows, 'rank', [1, 2])
+        self.assertEqual([(row.STAFFID, row['rank']) for row in rows], [('S1', 1), ('S2', 2)])
+        self.assertEqual(list(rows[0].keys()), ['STAFFID', 'STAFFNAME', 'DEPARTMENTNAME', 'rank'])
+        self.assertNotIn('rank', self.rows[0])
+        self.assertEqual(add_column([], 'rank', []), [])
+
+    def test_add_line_ids_accepts_compact_rows(self):
+        _patch(self, 'dashboard.line_ids.get_line_id_map', return_value={'S1': ('U1',)})
+        enriched = line_ids.add_line_ids(self.rows, 'STAFFID', drop_ldap=True)
+        self.assertEqual(enriched[0], {
+            'STAFFNAME': 'สมชาย', 'DEPARTMENTNAME': 'คณะวิทยาศาสตร์', 'line_ids': ['U1'], 'line_user_id': 'U1',
+        })
+
+
+class DepartmentRosterTests(SimpleTestCase):
+    COLUMNS = ('STAFFID', 'PREFIXFULLNAME', 'STAFFNAME', 'STAFFSURNAME', 'GENDERNAMETH', 'POSNAMETH',
+               'STFTYPENAME', 'DEPARTMENTNAME')
+    DEPARTMENT = 'คณะวิทยาศาสตร์'
+
+    def setUp(self):
+        _fresh_result_cache(self)
+        self.db = sqlite3.connect(':memory:')
+        self.addCleanup(self.db.close)
+        self.db.execute(f"CREATE TABLE staff_info ({', '.join(self.COLUMNS)})")
+        self.staff = []
+        for n in range(12):
+            self.staff.append((
+                f'S{n:02}', 'นาย' if n % 2 else 'นาง', f'ชื่อ{n % 5}', f'สกุล{n}',
+                'ชาย' if n % 2 else 'หญิง', ('อาจารย์', 'นักวิชาการ', 'เจ้าหน้าที่')[n % 3],
+                ('ข้าราชการ', 'พนักงานมหาวิทยาลัย')[n % 2], self.DEPARTMENT,
+            ))
+        self.staff.append(('X01', 'นาย', 'ชื่อ0', 'อื่น', 'ชาย', 'อาจารย์', 'ข้าราชการ', 'คณะอื่น'))
+        self.db.executemany(f"INSERT INTO staff_info VALUES ({', '.join('?' * len(self.COLUMNS))})", self.staff)
+
+        def query(table_name, sql, params=(), dictionary=False, compact=False):
+            cursor = self.db.execute(sql.replace('%s', '?'), params)
+            return fetch_compact(cursor) if compact else cursor.fetchall()
+
+        _patch(self, 'dashboard.database_utils.local_replica.query', side_effect=query)
+
+    def roster(self, **kwargs):
+        return database_utils.get_department_roster(self.DEPARTMENT, **kwargs)
+
+    def expected(self, sort, keep=lambda row: True):
+        columns = database_utils.ROSTER_SORTS[sort]
+        rows = [dict(zip(self.COLUMNS, row)) for row in self.staff if row[-1] == self.DEPARTMENT]
+        rows = [row for row in rows if keep(row)]
+        return [row['STAFFID'] for row in sorted(rows, key=lambda row: [row[column] for column in columns])]
+
+    def test_every_sort_pages_through_department(self):
+        for sort in database_utils.ROSTER_SORTS:
+            with self.subTest(sort=sort):
+                ids = []
+                for page in (1, 2, 3):
+                    result = self.roster(page=page, page_size=5, sort=sort)
+                    self.assertEqual((result['total'], result['num_pages']), (12, 3))
+                    ids.extend(row['STAFFID'] for row in result['results'])
+                self.assertEqual(ids, self.expected(sort))
+
+    def test_filters_and_search_terms(self):
+        result = self.roster(sort='name', gender='ชาย', type='พนักงานมหาวิทยาลัย', position='', query='ชื่อ1 1')
+        self.assertEqual(
+            [row['STAFFID'] for row in result['results']],
+            self.expected('name', lambda row: (
+                row['GENDERNAMETH'] == 'ชาย' and row['STAFFNAME'] == 'ชื่อ1' and '1' in row['STAFFSURNAME']
+            )),
+        )
+        self.assertEqual(result['total'], len(result['results']))
+        self.assertEqual(self.roster(query='ไม่มี')['results'], [])
+
+    def test_where_uses_only_known_columns(self):
+        where, params = database_utils._roster_where(self.DEPARTMENT, ' a  b ', {'type': 'T', 'gender': 'G'})
+        self.assertEqual(where.count('%s'), len(params))
+        self.assertEqual(params[:3], [self.DEPARTMENT, 'G', 'T'])
+        self.assertEqual(params[3:], ['%a%'] * 4 + ['%b%'] * 4)
+        with self.assertRaises(KeyError):
+            database_utils._roster_where(self.DEPARTMENT, '', {'STAFFID': 'x'})
+
+    def test_invalid_arguments_fall_back(self):
+        result = self.roster(page=0, page_size=1000, sort='DROP TABLE', DEPARTMENTNAME='คณะอื่น')
+        self.assertEqual((result['page'], result['page_size'], result['total']), (1, 200, 12))
+        self.assertEqual([row['STAFFID'] for row in result['results']], self.expected('position'))
+
+        result = self.roster(page=13, page_size=0)
+        self.assertEqual((result['page_size'], result['num_pages'], result['results']), (1, 12, []))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        _patch(self, 'dashboard.db_pool.time.monotonic', new=self.clock)
+        self.breaker = CircuitBreaker(threshold=2, window=10.0, reset_after=5.0)
+
+    def trip(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.now += 5
+
+    def test_opens_after_threshold_failures_within_window(self):
+        self.breaker.record_failure()
+        self.clock.now += 11  # ความล้มเหลวแรกหลุด window แล้ว
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.allow(), (True, False))
+
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.stats()['state'], 'open')
+        self.assertEqual(self.breaker.allow(), (False, False))
+        self.assertEqual(self.breaker.stats()['rejected'], 1)
+
+    def test_half_open_trial_success_closes(self):
+        self.trip()
+        self.assertEqual(self.breaker.allow(), (True, True))
+        self.assertEqual(self.breaker.stats()['state'], 'half-open')
+        # ระหว่างรอผลของคำขอทดลอง คำขออื่นถูกปฏิเสธ
+        self.assertEqual(self.breaker.allow(), (False, False))
+
+        self.breaker.record_success(trial=True)
+        self.assertEqual(self.breaker.stats()['state'], 'closed')
+        self.assertEqual(self.breaker.allow(), (True, False))
+
+    def test_half_open_trial_failure_reopens(self):
+        self.trip()
+        self.breaker.allow()
+
+        # ความล้มเหลวของ connection ที่ไม่ใช่คำขอทดลองไม่มีผล
+        self.breaker.record_failure(trial=False)
+        self.assertEqual(self.breaker.stats()['state'], 'half-open')
+
+        self.breaker.record_failure(trial=True)
+        stats = self.breaker.stats()
+        self.assertEqual((stats['state'], stats['trips']), ('open', 2))
+        self.assertEqual(self.breaker.allow(), (False, False))
+
+    def test_released_trial_lets_next_request_try(self):
+        self.trip()
+        self.assertEqual(self.breaker.allow(), (True, True))
+        self.breaker.release_trial(True)
+        self.assertEqual(self.breaker.allow(), (True, True))
+
+
+class PoolBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        _patch(self, 'dashboard.db_pool.time.monotonic', new=self.clock)
+        self.connect = _patch(
+            self, 'dashboard.db_pool.mysql.connector.connect',
+            side_effect=lambda **kwargs: mock.Mock(in_transaction=False),
+        )
+        self.breaker = CircuitBreaker(threshold=2, window=10.0, reset_after=5.0)
+        self.pool = ConnectionPool({}, size=1, timeout=0, query_timeout=2.5, breaker=self.breaker)
+
+    def test_pool_timeouts_do_not_trip_breaker(self):
+        connection = self.pool.acquire()
+        for _ in range(5):
+            with self.assertRaises(PoolTimeout):
+                self.pool.acquire()
+        self.assertEqual(self.breaker.stats()['state'], 'closed')
+        connection.close()
+
+    def test_pool_timeout_releases_half_open_trial(self):
+        connection = self.pool.acquire()
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.now += 5
+
+        with self.assertRaises(PoolTimeout):
+            self.pool.acquire()
+        connection.close()
+        trial = self.pool.acquire()
+        self.assertTrue(trial._trial)
+        trial.close()
+        self.assertEqual(self.breaker.stats()['state'], 'closed')
+
+    def test_host_errors_open_circuit(self):
+        self.connect.side_effect = errors.InterfaceError(errno=2003, msg="Can't connect")
+        for _ in range(2):
+            with self.assertRaises(errors.InterfaceError):
+                self.pool.acquire()
+        with self.assertRaises(CircuitOpen):
+            self.pool.acquire()
+        self.assertEqual(self.pool.stats()['open'], 0)
+
+    def test_reported_host_error_discards_connection(self):
+        connection = self.pool.acquire()
+        raw = connection._raw
+        connection.report_error(errors.OperationalError(errno=2013, msg='Lost connection'))
+        connection.report_error(errors.ProgrammingError(errno=1064, msg='syntax'))
+        connection.close()
+
+        raw.close.assert_called_once_with()
+        self.assertEqual(self.breaker.stats()['recent_failures'], 1)
+        self.assertEqual(self.pool.stats()['open'], 0)
+
+    def test_query_timeout_is_set_once_per_session(self):
+        connection = self.pool.acquire()
+        raw = connection._raw
+        connection.close()
+        self.pool.acquire().close()
+        self.pool.acquire(query_timeout=0).close()
+
+        executed = [call.args for call in raw.cursor.return_value.execute.call_args_list]
+        self.assertEqual(executed, [
+            ('SET SESSION max_execution_time = %s', (2500,)),
+            ('SET SESSION max_execution_time = %s', (0,)),
+        ])
+
+
+class StaleFallbackTests(SimpleTestCase):
+    def setUp(self):
+        self.get_generation = _fresh_result_cache(self)
+        self.results = {}
+
+        @cached_result('staff_info', cache=ResultCache(2))
+        def load(name):
+            return self.results.get(name)
+
+        self.load = load
+
+    def test_failure_returns_last_good_result_marked_stale(self):
+        self.results['x'] = {'total': 5}
+        fresh = self.load('x')
+        self.get_generation.return_value = object()
+        self.results['x'] = None
+
+        value = self.load('x')
+        self.assertEqual(value, {'total': 5, 'is_stale': True})
+        self.assertTrue(is_stale(value))
+        self.assertFalse(is_stale(fresh))
+
+    def test_list_result_becomes_stale_list(self):
+        self.results['x'] = [1, 2]
+        self.load('x')
+        self.get_generation.return_value = object()
+        self.results['x'] = None
+
+        value = self.load('x')
+        self.assertIsInstance(value, StaleList)
+        self.assertEqual(value, [1, 2])
+        self.assertTrue(is_stale(value))
+        self.assertIsNone(self.load('never loaded'))
+
+
+class SearchAllTests(SimpleTestCase):
+    STAFF = [
+        {'score': 6, 'STAFFID': 'T1', 'STAFFNAME': 'สมชาย', 'STAFFSURNAME': 'ใจดี', 'STAFFCITIZENID': '1001'},
+        {'score': 3, 'STAFFID': 'T2', 'STAFFNAME': 'กมล', 'STAFFSURNAME': None, 'STAFFCITIZENID': '1002'},
+    ]
+    STUDENTS = [
+        {'score': 2, 'student_code': '6701', 'student_name': 'สมชาย', 'student_surname': 'ใจงาม'},
+        {'score': 1, 'student_code': '6702', 'student_name': 'ขวัญ', 'student_surname': 'ดี'},
+    ]
+
+    def setUp(self):
+        self.search_staff = _patch(self, 'dashboard.database_utils._search_staff', return_value=self.STAFF)
+        self.search_students = _patch(self, 'dashboard.database_utils._search_students', return_value=self.STUDENTS)
+        _patch(self, 'dashboard.line_ids.get_line_id_map', return_value={'1001': ('U1',), '6702': ('U2',)})
+
+    def ids(self, results):
+        return [(row['kind'], row.get('STAFFID') or row.get('student_code')) for row in results]
+
+    def test_ranks_by_score_relative_to_each_kind(self):
+        results = database_utils.search_all('  สมชาย ', limit=20)
+
+        self.search_staff.assert_called_once_with('สมชาย', 20, None)
+        self.search_students.assert_called_once_with('สมชาย', 20, None)
+        # คะแนนเต็มของแต่ละประเภทเท่ากัน แล้วเรียงตามชื่อ-สกุล
+        self.assertEqual(self.ids(results), [
+            ('student', '6701'), ('staff', 'T1'), ('staff', 'T2'), ('student', '6702'),
+        ])
+        self.assertEqual(results[1]['line_user_id'], 'U1')
+        self.assertNotIn('STAFFCITIZENID', results[1])
+        self.assertEqual(results[3]['line_ids'], ['U2'])
+        self.assertNotIn('kind', self.STAFF[0])
+        self.assertFalse(is_stale(results))
+
+    def test_failed_kind_is_skipped(self):
+        self.search_students.return_value = None
+        self.assertEqual(self.ids(database_utils.search_all('สม')), [('staff', 'T1'), ('staff', 'T2')])
+
+        self.search_staff.return_value = []
+        self.assertEqual(database_utils.search_all('สม'), [])
+
+    def test_stale_result_marks_merged_result_stale(self):
+        self.search_students.return_value = StaleList(self.STUDENTS)
+        results = database_utils.search_all('สม')
+        self.assertTrue(is_stale(results))
+        self.assertEqual(len(results), 4)
+
+
+class FakeSchemaCursor:
+    """cursor ที่จำลอง DROP / RENAME / CREATE LIKE ของตาราง (ชื่อตาราง -> ข้อมูล) และเก็บ statement ที่รัน"""
+
+    def __init__(self, tables, indexes=()):
+        self.tables = dict(tables)
+        self.indexes = list(indexes)  # แถวของ information_schema.STATISTICS
+        self.statements = []
+        self._result = None
+
+    def execute(self, sql, params=()):
+        self.statements.append(sql)
+        if 'information_schema.TABLES' in sql:
+            self._result = [(int(params[0] in self.tables),)]
+        elif 'information_schema.STATISTICS' in sql:
+            self._result = list(self.indexes)
+        elif sql.startswith('SELECT @@SESSION.'):
+            self._result = [(0,)]
+        elif sql.startswith('DROP TABLE IF EXISTS '):
+            for name in sql[len('DROP TABLE IF EXISTS '):].split(', '):
+                self.tables.pop(name, None)
+        elif sql.startswith('RENAME TABLE '):
+            # MySQL ทำทีละคู่จากซ้ายไปขวา และล้มทั้ง statement ถ้าคู่ใดผิด
+            tables = dict(self.tables)
+            for pair in sql[len('RENAME TABLE '):].split(', '):
+                source, target = pair.split(' TO ')
+                if source not in tables or target in tables:
+                    raise AssertionError(f'invalid rename: {pair}')
+                tables[target] = tables.pop(source)
+            self.tables = tables
+        elif match := re.match(r'CREATE TABLE (\w+) LIKE (\w+)', sql):
+            self.tables[match[1]] = []
+
+    def fetchone(self):
+        return self._result[0]
+
+    def fetchall(self):
+        return self._result
+
+
+class TableSwapTests(SimpleTestCase):
+    NAMES = ['students_info', 'students_info_rollup']
+
+    def setUp(self):
+        self.cursor = FakeSchemaCursor({
+            'students_info': 'v1', 'students_info_rollup': 'r1',
+            'students_info_old': 'v0', 'students_info_rollup_old': 'r0',
+            'students_info_new': 'v2', 'students_info_rollup_new': 'r2',
+        })
+
+    def test_swap_replaces_tables_in_one_rename(self):
+        table_swap.swap_tables(self.cursor, self.NAMES)
+
+        self.assertEqual(self.cursor.tables, {
+            'students_info': 'v2', 'students_info_rollup': 'r2',
+            'students_info_old': 'v1', 'students_info_rollup_old': 'r1',
+        })
+        self.assertEqual([sql.split()[0] for sql in self.cursor.statements], ['DROP', 'RENAME'])
+
+    def test_rollback_restores_previous_tables_and_can_be_undone(self):
+        table_swap.swap_tables(self.cursor, self.NAMES)
+        self.cursor.tables['students_info_new'] = 'leftover'
+
+        table_swap.rollback_tables(self.cursor, self.NAMES)
+        self.assertEqual(self.cursor.tables, {
+            'students_info': 'v1', 'students_info_rollup': 'r1',
+            'students_info_old': 'v2', 'students_info_rollup_old': 'r2',
+        })
+        self.assertEqual(sum(sql.startswith('RENAME') for sql in self.cursor.statements), 2)
+
+        table_swap.rollback_tables(self.cursor, self.NAMES)
+        self.assertEqual(self.cursor.tables['students_info'], 'v2')
+
+    def test_rollback_without_old_table_changes_nothing(self):
+        del self.cursor.tables['students_info_rollup_old']
+        before = dict(self.cursor.tables)
+
+        with self.assertRaisesMessage(ValueError, 'students_info_rollup_old'):
+            table_swap.rollback_tables(self.cursor, self.NAMES)
+        self.assertEqual(self.cursor.tables, before)
+        self.assertFalse(any(sql.startswith(('DROP', 'RENAME')) for sql in self.cursor.statements))
+
+    def test_shadow_is_loaded_without_indexes_then_rebuilt(self):
+        self.cursor.indexes = [
+            ('idx_students_code', 0, 'BTREE', 'student_code', None),
+            ('idx_students_faculty', 1, 'BTREE', 'faculty_name', 100),
+            ('idx_students_faculty', 1, 'BTREE', 'level_name', None),
+            ('ft_students_name', 1, 'FULLTEXT', 'student_name', None),
+        ]
+
+        shadow, indexes = table_swap.create_shadow(self.cursor, 'students_info')
+        self.assertEqual(shadow, 'students_info_new')
+        self.assertEqual(self.cursor.tables[shadow], [])
+        self.assertEqual(indexes, [
+            ('idx_students_code', True, False, ('student_code',)),
+            ('idx_students_faculty', False, False, ('faculty_name(100)', 'level_name')),
+            ('ft_students_name', False, True, ('student_name',)),
+        ])
+        self.assertEqual(
+            self.cursor.statements[-1],
+            'ALTER TABLE students_info_new DROP INDEX idx_students_code, '
+            'DROP INDEX idx_students_faculty, DROP INDEX ft_students_name',
+        )
+
+        del self.cursor.statements[:]
+        table_swap.build_indexes(self.cursor, shadow, indexes)
+        self.assertEqual(self.cursor.statements, [
+            'ALTER TABLE students_info_new ADD UNIQUE INDEX idx_students_code (student_code), '
+            'ADD INDEX idx_students_faculty (faculty_name(100), level_name)',
+            'SET SESSION innodb_ft_enable_stopword = OFF',
+            'SELECT @@SESSION.innodb_ft_enable_stopword',
+            'ALTER TABLE students_info_new ADD FULLTEXT INDEX ft_students_name (student_name) WITH PARSER ngram',
+        ])
+
+
+def _sync_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith('sync-')]
+
+
+class RunPipelineTests(SimpleTestCase):
+    def test_writes_every_chunk_in_order(self):
+        written = []
+        total = run_pipeline(([n] * n for n in range(1, 6)), written.append, depth=2)
+        self.assertEqual(total, 15)
+        self.assertEqual(written, [[n] * n for n in range(1, 6)])
+
+    def test_writer_exception_propagates_and_stops_reader(self):
+        closed = threading.Event()
+
+        def endless():
+            try:
+                while True:
+                    yield [1]
+            finally:
+                closed.set()
+
+        def write(rows):
+            raise ValueError('write failed')
+
+        with self.assertRaisesMessage(ValueError, 'write failed'):
+            run_pipeline(endless(), write, 'test ', depth=1)
+        self.assertTrue(closed.is_set())
+        self.assertEqual(_sync_threads(), [])
+
+    def test_reader_exception_propagates(self):
+        def failing():
+            yield [1]
+            raise RuntimeError('read failed')
+
+        written = []
+        with self.assertRaisesMessage(RuntimeError, 'read failed'):
+            run_pipeline(failing(), written.append)
+        self.assertEqual(written, [[1]])
+        self.assertEqual(_sync_threads(), [])
+
+
+class RowDiffTests(SimpleTestCase):
+    def test_row_hash_distinguishes_null_empty_and_separators(self):
+        hashes = {row_hash(row) for row in [(None, 'a'), ('', 'a'), ('a', None), ('a', ''), ('a|', ''), ('a', '|')]}
+        self.assertEqual(len(hashes), 6)
+        self.assertEqual(row_hash(('S1', 'สมชาย')), row_hash(['S1', 'สมชาย']))
+
+    def test_counts_each_kind_of_change(self):
+        unchanged = ('S1', 'สมชาย', 'ใจดี')
+        updated = ('S2', 'สมหญิง', 'ใจดี')
+        hashes = {
+            'S1': row_hash(unchanged),
+            'S2': row_hash(('S2', 'สมหญิง', 'ใจงาม')),
+            'S3': row_hash(('S3', 'ลาออก', 'แล้ว')),
+        }
+        diff = RowDiff(hashes)
+
+        written = diff.changes([unchanged, updated]) + diff.changes([('S4', 'ใหม่', 'เข้า'), updated])
+
+        self.assertEqual([row[0] for row in written], ['S2', 'S4'])
+        self.assertEqual(written[0][-1], row_hash(updated))
+        self.assertEqual((diff.inserted, diff.updated, diff.unchanged), (1, 1, 1))
+        self.assertEqual(diff.deleted_keys(), ['S3'])
+        self.assertTrue(diff.has_changes)
+
+    def test_write_all_still_counts(self):
+        row = ('S1', 'สมชาย', 'ใจดี')
+        diff = RowDiff({'S1': row_hash(row)}, write_all=True)
+        self.assertEqual(len(diff.changes([row])), 1)
+        self.assertEqual((diff.inserted, diff.updated, diff.unchanged), (0, 0, 1))
+        self.assertFalse(diff.has_changes)
+
+    def test_empty_source_deletes_nothing(self):
+        diff = RowDiff({'S1': row_hash(('S1',))})
+        diff.changes([])
+        self.assertEqual(diff.deleted_keys(), [])
+
+
+class FakeOraclePool:
+    """pool ของ oracledb ที่ cursor คืนรหัสนักศึกษาในช่วง :low / :high ของ query"""
+
+    def __init__(self, codes):
+        self.codes = codes
+        self.queries = []
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def acquire(self):
+        yield mock.Mock(cursor=lambda: FakeOracleCursor(self))
+
+
+class FakeOracleCursor:
+    def __init__(self, pool):
+        self.pool = pool
+        self.rows = []
+
+    def execute(self, sql, params):
+        with self.pool.lock:
+            self.pool.queries.append((sql, params))
+        self.rows = [
+            (code,) for code in self.pool.codes
+            if ('low' not in params or code >= params['low']) and ('high' not in params or code < params['high'])
+        ]
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class PartitionedExtractTests(SimpleTestCase):
+    def test_partition_bounds_split_previous_codes_evenly(self):
+        codes = [f'67{n:04}' for n in range(100)] + [None, '']
+        self.assertEqual(partition_bounds(codes, 4), ['670025', '670050', '670075'])
+        self.assertEqual(partition_bounds(['1', '1', '1', '2'], 4), ['1', '2'])
+        self.assertEqual(partition_bounds(['670001', '670002'], 4), [])
+        self.assertEqual(partition_bounds(codes, 1), [])
+
+    def test_partitions_read_every_code_once(self):
+        previous = [f'67{n:04}' for n in range(0, 40, 2)]
+        current = ['660001', *previous, '670011', '690001']  # มีรหัสใหม่ทั้งต่ำกว่าและสูงกว่าช่วงเดิม
+        pool = FakeOraclePool(current)
+        bounds = partition_bounds(previous, 4)
+
+        chunks = merge_chunks(partition_sources(pool, bounds), workers=4, depth=2)
+        codes = [row[0] for rows in chunks for row in rows]
+
+        self.assertEqual(sorted(codes), sorted(current))
+        self.assertEqual(len(pool.queries), 4)
+        conditions = sorted(
+            (params.get('low') or '', params.get('high') or '~') for _, params in pool.queries
+        )
+        self.assertEqual(conditions, [('', bounds[0]), (bounds[0], bounds[1]), (bounds[1], bounds[2]), (bounds[2], '~')])
+        for sql, _ in pool.queries:
+            self.assertIn('V.STUDENTSTATUS < 40', sql)
+            self.assertNotIn('ORA_HASH', sql)
+
+    def test_merge_chunks_source_exception_stops_other_sources(self):
+        def endless():
+            while True:
+                yield [1]
+
+        def failing():
+            raise RuntimeError('source failed')
+            yield
+
+        with self.assertRaisesMessage(RuntimeError, 'source failed'):
+            run_pipeline(merge_chunks([endless, failing], workers=2, depth=1), lambda rows: None)
+        self.assertEqual(_sync_threads(), [])
@@ -10,6 +10,7 @@ urlpatterns = [
     path('staff/', views.staff_dashboard, name='staff'),
     path('staff/export/excel/', views.export_staff_excel, name='export_staff_excel'),
     path('staff/export/department/<path:department_name>/', views.export_department_excel, name='export_department_excel'),
+    path('staff/roster/<path:department_name>/', views.department_roster_api, name='department_roster'),
     path('staff/department/<path:department_name>/', views.department_detail, name='department_detail'),
     path('student/', views.student_dashboard, name='student'),
     path('student/faculty/export/<path:faculty_name>/', views.export_faculty_excel, name='export_faculty_excel'),
@@ -18,6 +19,8 @@ urlpatterns = [
     path('student/level/<path:level_name>/', views.level_detail, name='level_detail'),
     path('student/export/excel/', views.export_student_excel, name='export_student_excel'),
     path('search/', views.search_view, name='search'),
+    path('search/api/', views.search_api, name='search_api'),
+    path('search/suggest/', views.search_suggest_api, name='search_suggest'),
     path('service-statistics/', views.service_statistics_view, name='service_statistics'),
 
     # Sync Monitor
@@ -1,11 +1,14 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
-from .database_utils import get_staff_summary,get_student_summary,get_db_connection,get_department_detail,get_faculty_detail,get_level_detail,get_available_years,search_staff,search_students
+from .database_utils import get_staff_summary,get_student_summary,get_db_connection,get_department_detail,get_department_roster,get_faculty_detail,get_level_detail,get_available_years,search_staff_page,search_students_page,search_all,get_table_counts,suggest,ROSTER_PAGE_SIZE
 import json
 import mysql.connector
 from .sheets_utils import get_service_statistics, get_formatted_statistics
 from django.http import JsonResponse, HttpResponse
+from django.views.decorators.cache import cache_control
+from .result_cache import is_stale
 import datetime
+from itertools import zip_longest
 
 # Excel export support
 try:
@@ -54,6 +57,7 @@ def staff_dashboard(request):
     gender_data = [gender['count'] for gender in summary['gender_distribution']]
     
     context = {
+        'is_stale': summary.get('is_stale', False),
         'total_staff': summary['total_staff'],
         # ข้อมูลกราฟ - แสดงทั้งหมด
         'department_labels': json.dumps(department_labels),
@@ -91,8 +95,8 @@ def student_dashboard(request):
         # ดึงข้อมูลสรุปนักศึกษา (กรองตามปีถ้ามี)
         summary = get_student_summary(year_filter)
         
-        # ดึงรายการปีที่มีข้อมูล
-        available_years = get_available_years()
+        # ดึงรายการปีที่มีข้อมูล (None = ดึงไม่ได้ แสดงเป็นรายการว่าง)
+        available_years = get_available_years() or []
         
         if not summary:
             # กรณีเกิดข้อผิดพลาดในการดึงข้อมูล
@@ -140,6 +144,7 @@ def student_dashboard(request):
         small_programs = [prog for prog in all_programs if prog['count'] < 10]  # สาขาเล็ก
         
         context = {
+            'is_stale': summary.get('is_stale', False),
             'total_students': summary['total_students'],
             # ข้อมูลกราฟ - แสดงทั้งหมด
             'faculty_labels': json.dumps(faculty_labels),
@@ -339,8 +344,8 @@ def department_detail(request, department_name):
     import urllib.parse
     department_name = urllib.parse.unquote(department_name)
     
-    # ดึงข้อมูลรายละเอียดหน่วยงาน
-    dept_info = get_department_detail(department_name)
+    # ดึงข้อมูลรายละเอียดหน่วยงาน (รายชื่อบุคลากรโหลดทีละหน้าผ่าน department_roster_api)
+    dept_info = get_department_detail(department_name, include_staff_list=False)
     
     if not dept_info:
         return render(request, 'dashboard/error.html', {
@@ -358,6 +363,7 @@ def department_detail(request, department_name):
     employment_type_data = [emp['count'] for emp in dept_info['employment_type_distribution']]
     
     context = {
+        'is_stale': dept_info.get('is_stale', False),
         'department_name': department_name,
         'total_staff': dept_info['total_staff'],
         'gender_labels': json.dumps(gender_labels),
@@ -369,11 +375,40 @@ def department_detail(request, department_name):
         'gender_distribution': dept_info['gender_distribution'],
         'position_distribution': dept_info['position_distribution'],
         'employment_type_distribution': dept_info['employment_type_distribution'],
-        'staff_list': dept_info['staff_list']
     }
     
     return render(request, 'dashboard/department_detail.html', context)
 
+@login_required
+def department_roster_api(request, department_name):
+    """
+    รายชื่อบุคลากรของหน่วยงานทีละหน้า (JSON)
+    GET ?page=1&page_size=50&sort=position|name|type|gender&q=...&gender=...&type=...&position=...
+    """
+    import urllib.parse
+    department_name = urllib.parse.unquote(department_name)
+
+    try:
+        page = int(request.GET.get('page', 1))
+        page_size = int(request.GET.get('page_size', ROSTER_PAGE_SIZE))
+    except ValueError:
+        page, page_size = 1, ROSTER_PAGE_SIZE
+
+    roster = get_department_roster(
+        department_name,
+        page=page,
+        page_size=page_size,
+        sort=request.GET.get('sort', 'position'),
+        query=request.GET.get('q', '').strip(),
+        gender=request.GET.get('gender', ''),
+        type=request.GET.get('type', ''),
+        position=request.GET.get('position', ''),
+    )
+    if roster is None:
+        return JsonResponse({'error': 'ไม่สามารถดึงรายชื่อบุคลากรได้'}, status=503)
+
+    return JsonResponse(dict(roster, results=[dict(row) for row in roster['results']]))
+
 @login_required
 def export_department_excel(request, department_name):
     """
@@ -636,6 +671,7 @@ def faculty_detail(request, faculty_name):
     year_data = [year['count'] for year in fac_info['year_distribution']]
     
     context = {
+        'is_stale': fac_info.get('is_stale', False),
         'faculty_name': faculty_name,
         'total_students': fac_info['total_students'],
         'gender_labels': json.dumps(gender_labels),
@@ -697,6 +733,7 @@ def level_detail(request, level_name):
     year_data = [year['count'] for year in level_info['year_distribution']]
     
     context = {
+        'is_stale': level_info.get('is_stale', False),
         'level_name': level_name,
         'total_students': level_info['total_students'],
         'gender_labels': json.dumps(gender_labels),
@@ -1809,15 +1846,9 @@ def sync_monitor_view(request):
     staff_count = None
     students_count = None
     try:
-        conn = get_db_connection()
-        if conn:
-            cur = conn.cursor()
-            cur.execute("SELECT COUNT(*) FROM staff_info")
-            staff_count = cur.fetchone()[0]
-            cur.execute("SELECT COUNT(*) FROM students_info")
-            students_count = cur.fetchone()[0]
-            cur.close()
-            conn.close()
+        counts = get_table_counts()
+        staff_count = counts['staff_info']
+        students_count = counts['students_info']
     except Exception:
         pass
 
@@ -1896,32 +1927,92 @@ def sync_status_api(request, log_id):
         'records_synced': log.records_synced,
         'records_before': log.records_before,
         'records_after': log.records_after,
+        'records_inserted': log.records_inserted,
+        'records_updated': log.records_updated,
+        'records_deleted': log.records_deleted,
+        'records_unchanged': log.records_unchanged,
         'duration_seconds': log.duration_seconds,
         'error_message': log.error_message,
         'finished_at': log.finished_at.isoformat() if log.finished_at else None,
     })
     return response
 
-@login_required
-def search_view(request):
+def _search_results(request):
+    """
+    อ่าน tab / q / after จาก query string แล้วค้นหาหนึ่งหน้า (keyset pagination)
+    คืน (tab, query, after, results, next_cursor, searched)
+    """
     tab = request.GET.get('tab', 'staff')
-    if tab not in ('staff', 'student'):
+    if tab not in ('staff', 'student', 'all'):
         tab = 'staff'
     query = request.GET.get('q', '').strip()
+    after = request.GET.get('after') or None
     results = []
+    next_cursor = None
     searched = False
     if query and len(query) >= 2:
         searched = True
         if tab == 'staff':
-            results = search_staff(query)
+            results, next_cursor = search_staff_page(query, after)
+        elif tab == 'student':
+            results, next_cursor = search_students_page(query, after)
         else:
-            results = search_students(query)
-        for row in results:
-            raw = row.get('line_user_id')
-            row['line_ids'] = raw.split(', ') if raw else []
+            # ค้นหาทั้งสองประเภทพร้อมกัน (ไม่แบ่งหน้า)
+            results = search_all(query)
+    return tab, query, after, results, next_cursor, searched
+
+@login_required
+def search_view(request):
+    tab, query, after, results, next_cursor, searched = _search_results(request)
     return render(request, 'dashboard/search.html', {
+        'is_stale': is_stale(results),
         'tab': tab,
         'query': query,
+        'after': after,
         'results': results,
+        'next_cursor': next_cursor,
         'searched': searched,
     })
+
+@login_required
+def search_api(request):
+    """
+    ผลการค้นหาแบบ JSON ทีละหน้า
+    GET ?tab=staff|student&q=...&after=<cursor> — ส่งค่า next กลับมาเป็น after เพื่อขอหน้าถัดไป
+    """
+    tab, query, after, results, next_cursor, searched = _search_results(request)
+    return JsonResponse({
+        'tab': tab,
+        'q': query,
+        'results': results,
+        'next': next_cursor,
+        'is_stale': is_stale(results),
+    })
+
+SUGGEST_LIMIT = 10
+SUGGEST_MAX_LIMIT = 20
+
+@login_required
+@cache_control(private=True, max_age=300)
+def search_suggest_api(request):
+    """
+    Typeahead สำหรับช่องค้นหา: คืนรายการที่ขึ้นต้นด้วยคำที่พิมพ์ (JSON ขนาดเล็ก)
+    GET ?tab=staff|student|all&q=...&limit=10
+    """
+    tab = request.GET.get('tab', 'staff')
+    if tab == 'all':
+        table_names = ('staff_info', 'students_info')
+    else:
+        table_names = ('students_info',) if tab == 'student' else ('staff_info',)
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', SUGGEST_LIMIT)), 1), SUGGEST_MAX_LIMIT)
+    except ValueError:
+        limit = SUGGEST_LIMIT
+
+    results = []
+    if query:
+        suggestions = [suggest(table_name, query, limit) for table_name in table_names]
+        # สลับรายการของแต่ละประเภท เพื่อให้เห็นทั้งบุคลากรและนักศึกษา
+        results = [item for group in zip_longest(*suggestions) for item in group if item is not None]
+    return JsonResponse({'q': query, 'results': results[:limit]})